@@ -1,3 +1,6 @@
+import 'dart:convert';
+import 'dart:io' show gzip;
+
 import 'package:flutter/foundation.dart';
 import 'package:dio/dio.dart';
 import 'package:shared_preferences/shared_preferences.dart';
@@ -138,6 +141,44 @@ class ApiService extends ChangeNotifier {
     }
   }
 
+  /// Latest record, history and practitioners of a patient in one request.
+  /// [similar] ('exact' or 'semantic') also returns records similar to the
+  /// latest pulse grid.
+  Future<Map<String, dynamic>> getPatientBundle(
+    int patientId, {
+    String? similar,
+  }) async {
+    try {
+      final response = await _dio.get(
+        '/api/patients/$patientId/bundle',
+        queryParameters: {
+          if (similar != null) 'similar': similar,
+        },
+      );
+      return response.data as Map<String, dynamic>;
+    } catch (e) {
+      debugPrint('Error getting patient bundle: $e');
+      rethrow;
+    }
+  }
+
+  /// Patients, records and practitioners changed after [since] (0 for
+  /// everything). Pass the returned `cursor` next time; repeat while
+  /// `has_more` is true. A 410 means the cursor is stale: clear the cache
+  /// and start again from 0.
+  Future<Map<String, dynamic>> getChanges(int since, {int limit = 1000}) async {
+    try {
+      final response = await _dio.get(
+        '/api/changes',
+        queryParameters: {'since': since, 'limit': limit},
+      );
+      return response.data as Map<String, dynamic>;
+    } catch (e) {
+      debugPrint('Error getting changes: $e');
+      rethrow;
+    }
+  }
+
   Future<Map<String, dynamic>> saveRecord(Map<String, dynamic> data) async {
     try {
       final response = await _dio.post('/api/records/save', data: data);
@@ -148,6 +189,28 @@ class ApiService extends ChangeNotifier {
     }
   }
 
+  /// Uploads many offline records in one gzip-compressed request.
+  /// Returns the per-item status list from `/api/records/save_batch`.
+  Future<List<Map<String, dynamic>>> saveRecordsBatch(
+    List<Map<String, dynamic>> records,
+  ) async {
+    try {
+      final body = gzip.encode(utf8.encode(jsonEncode({'records': records})));
+      final response = await _dio.post(
+        '/api/records/save_batch',
+        data: Stream.fromIterable([body]),
+        options: Options(headers: {
+          'Content-Encoding': 'gzip',
+          Headers.contentLengthHeader: body.length,
+        }),
+      );
+      return List<Map<String, dynamic>>.from(response.data['results']);
+    } catch (e) {
+      debugPrint('Error saving record batch: $e');
+      rethrow;
+    }
+  }
+
   Future<AnalysisResult> analyzeRecord(Map<String, dynamic> data) async {
     try {
       final response = await _dio.post('/api/analyze', data: data);
@@ -0,0 +1,41 @@
+"""
+Build the complaint_terms index (character bigrams of medical_records.complaint)
+used by multi-signal similar-case retrieval. Safe to re-run; each record's
+terms are replaced.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import ComplaintTerm
+from src.services import text_index_service
+
+
+def backfill(chunk_size: int = 1000):
+    ComplaintTerm.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = text_index_service.backfill_complaint_terms(db, chunk_size=chunk_size)
+        terms = db.query(ComplaintTerm).count()
+        print(f"Indexed {terms} complaint terms from {total} records in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during backfill: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill the complaint_terms text index')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Records per transaction')
+    args = parser.parse_args()
+
+    backfill(args.chunk_size)
@@ -0,0 +1,40 @@
+"""
+Fingerprint records imported from Excel before import_fingerprints existed,
+so the next import of the same clinic log skips them. Safe to re-run;
+records that already have a fingerprint are left alone.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import ImportFingerprint
+from src.services import import_service
+
+
+def backfill(chunk_size: int = 1000):
+    ImportFingerprint.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = import_service.backfill_fingerprints(db, chunk_size=chunk_size)
+        print(f"Fingerprinted {total} imported records in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during backfill: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill import_fingerprints for Excel-imported records')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Records per transaction')
+    args = parser.parse_args()
+
+    backfill(args.chunk_size)
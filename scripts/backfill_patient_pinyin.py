@@ -0,0 +1,50 @@
+"""
+Add the pinyin_full column to patients on databases created before it
+existed and fill pinyin / pinyin_full for every patient missing them
+(e.g. patients created by older Excel imports). Safe to re-run; use
+--force to recompute all patients.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database import schema
+from src.services import pinyin_service
+
+
+def ensure_schema():
+    for column in schema.ensure_columns(engine):
+        print(f"Added column {column}")
+
+
+def backfill(chunk_size: int = 5000, force: bool = False):
+    ensure_schema()
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = pinyin_service.backfill_pinyin(
+            db, chunk_size=chunk_size, force=force,
+            progress=lambda done: print(f"  Updated {done} patients...")
+        )
+        print(f"Filled pinyin for {total} patients in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during backfill: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill patient pinyin search columns')
+    parser.add_argument('--chunk-size', type=int, default=5000, help='Patients per transaction')
+    parser.add_argument('--force', action='store_true', help='Recompute pinyin for all patients')
+    args = parser.parse_args()
+
+    backfill(args.chunk_size, args.force)
@@ -0,0 +1,45 @@
+"""
+Build the prescription_items herb index and the MinHash LSH tables from
+existing records: parses medical_record.prescription and imported 方药
+(raw_data, read from record_payloads). Safe to re-run; each record's items
+and signature are replaced.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import PrescriptionItem, PrescriptionSignature, PrescriptionLshBucket, RecordPayload
+from src.services import prescription_service
+
+
+def backfill(chunk_size: int = 500):
+    RecordPayload.__table__.create(bind=engine, checkfirst=True)
+    PrescriptionItem.__table__.create(bind=engine, checkfirst=True)
+    PrescriptionSignature.__table__.create(bind=engine, checkfirst=True)
+    PrescriptionLshBucket.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = prescription_service.backfill_prescription_items(db, chunk_size=chunk_size)
+        items = db.query(PrescriptionItem).count()
+        print(f"Indexed {items} prescription items from {total} records in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during backfill: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill the prescription_items herb index')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Records per transaction')
+    args = parser.parse_args()
+
+    backfill(args.chunk_size)
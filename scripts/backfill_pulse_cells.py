@@ -0,0 +1,41 @@
+"""
+Backfill the pulse_cells / pulse_cell_terms index from medical_records.data.
+Creates the tables if needed and can be re-run safely (cells are replaced per record).
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import PulseCell, PulseCellTerm
+from src.services import pulse_index_service
+
+
+def backfill(chunk_size: int = 500):
+    PulseCell.__table__.create(bind=engine, checkfirst=True)
+    PulseCellTerm.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = pulse_index_service.backfill_pulse_cells(db, chunk_size=chunk_size)
+        cells = db.query(PulseCell).count()
+        print(f"Indexed {cells} pulse cells from {total} records in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error backfilling pulse_cells: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Backfill the pulse_cells index')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Records per transaction')
+    args = parser.parse_args()
+
+    backfill(args.chunk_size)
@@ -0,0 +1,56 @@
+"""
+Add the analysis_pattern / analysis_features columns to medical_records on
+databases created before they existed, classify every record that has no
+stored pattern yet, and rebuild the pattern_rollups table. Safe to re-run;
+use --force after changing the analysis rules to reclassify everything.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database import schema
+from src.database.models import PatternRollup
+from src.services import pattern_stats_service
+
+
+def ensure_schema():
+    for column in schema.ensure_columns(engine):
+        print(f"Added column {column}")
+    PatternRollup.__table__.create(bind=engine, checkfirst=True)
+
+
+def backfill(chunk_size: int = 500, force: bool = False):
+    ensure_schema()
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = pattern_stats_service.backfill_record_patterns(
+            db, chunk_size=chunk_size, force=force,
+            progress=lambda done: print(f"  Classified {done} records...")
+        )
+        print(f"Classified {total} records in {time.time() - start:.2f}s")
+
+        start = time.time()
+        rows = pattern_stats_service.rebuild_pattern_rollups(db)
+        print(f"Rebuilt pattern_rollups ({rows} rows) in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during backfill: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Store analysis patterns on medical_records and rebuild rollups')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Records per transaction')
+    parser.add_argument('--force', action='store_true', help='Reclassify records that already have a pattern')
+    args = parser.parse_args()
+
+    backfill(args.chunk_size, args.force)
@@ -0,0 +1,52 @@
+"""
+Microbenchmark for analysis_service over the golden corpus: evaluating the
+rules directly (analyze_pulse_data) and handling /api/analyze request bodies
+(parse + analyze) without the memo, on a memo miss and on a memo hit.
+"""
+import sys
+import os
+import json
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services import analysis_service
+from src.services.analysis_service import analyze_pulse_data, analyze_request_body, analysis_memo
+from scripts.test_analysis_golden import build_cases
+
+
+def _best(fn, inputs, rounds: int, clear: bool = False) -> float:
+    best = float("inf")
+    for _ in range(rounds):
+        if clear:
+            analysis_memo.clear()
+        start = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        best = min(best, time.perf_counter() - start)
+    return best / len(inputs) * 1e6
+
+
+def main(rounds: int):
+    cases = build_cases()
+    bodies = [json.dumps(case, ensure_ascii=False).encode("utf-8") for case in cases]
+    direct = _best(analyze_pulse_data, cases, rounds)
+    unmemoized = _best(lambda body: analyze_pulse_data(analysis_service._parse_body(body)), bodies, rounds)
+    miss = _best(analyze_request_body, bodies, rounds, clear=True)
+    hit = _best(analyze_request_body, bodies, rounds)
+    calls = f"(best of {rounds} x {len(cases)} calls)"
+    print(f"analyze_pulse_data:              {direct:.2f} us/call {calls}")
+    print(f"request body, no memo:           {unmemoized:.2f} us/call")
+    print(f"request body, memo miss:         {miss:.2f} us/call")
+    print(f"request body, memo hit:          {hit:.2f} us/call")
+    print(f"memo: {analysis_memo.stats()}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark analyze_pulse_data')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    main(args.rounds)
@@ -0,0 +1,112 @@
+"""
+Benchmark: patient history listing over 10k records.
+Compares loading full MedicalRecord entities (data JSON included, stdlib json)
+with the column-projected query used by record_service.get_patient_history
+(orjson-configured engine). Runs against a throwaway SQLite file.
+"""
+import sys
+import os
+import json
+import time
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker, undefer
+from src.database.connection import Base, json_serializer, json_deserializer
+from src.database.models import Patient, MedicalRecord
+from src.services import record_service
+
+
+def build_db(path: str, n_records: int):
+    engine = create_engine(f"sqlite:///{path}", json_serializer=json_serializer, json_deserializer=json_deserializer)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    patient = Patient(name="基准患者", gender="男", age=50)
+    db.add(patient)
+    db.flush()
+    patient_id = patient.id
+    grid = {f"{h}-{p}-{l}": "浮紧弦细" for h in ("left", "right") for p in ("cun", "guan", "chi") for l in ("fu", "zhong", "chen")}
+    grid["overall_description"] = "脉浮紧，沉取无力" * 5
+    start = datetime(2020, 1, 1)
+    db.bulk_insert_mappings(MedicalRecord, [
+        {
+            "patient_id": patient_id,
+            "visit_date": start + timedelta(hours=i),
+            "complaint": f"头痛恶寒 {i}",
+            "data": {
+                "medical_record": {"complaint": f"头痛恶寒 {i}", "prescription": "麻黄 桂枝 杏仁 甘草 " * 10},
+                "pulse_grid": grid,
+                "client_info": {"mode": "personal", "teacher": "", "practitioner_id": None, "user_id": 1},
+            },
+        }
+        for i in range(n_records)
+    ])
+    db.commit()
+    db.close()
+    engine.dispose()
+    return patient_id
+
+
+def full_entity_history(db, patient_id):
+    """Pre-optimization behaviour: whole entities, data column loaded and parsed."""
+    records = db.query(MedicalRecord).options(undefer(MedicalRecord.data))\
+        .filter(MedicalRecord.patient_id == patient_id)\
+        .order_by(MedicalRecord.visit_date.desc())\
+        .all()
+    return [{"id": r.id, "visit_date": r.visit_date.strftime("%Y-%m-%d"), "complaint": r.complaint} for r in records]
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main(n_records: int, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        patient_id = build_db(path, n_records)
+
+        stdlib_engine = create_engine(f"sqlite:///{path}", json_serializer=json.dumps, json_deserializer=json.loads)
+        fast_engine = create_engine(f"sqlite:///{path}", json_serializer=json_serializer, json_deserializer=json_deserializer)
+        slow_db = sessionmaker(bind=stdlib_engine)()
+        fast_db = sessionmaker(bind=fast_engine)()
+
+        def run_full():
+            full_entity_history(slow_db, patient_id)
+            slow_db.expunge_all()
+
+        def run_full_orjson():
+            full_entity_history(fast_db, patient_id)
+            fast_db.expunge_all()
+
+        def run_projected():
+            record_service.get_patient_history(fast_db, patient_id)
+
+        print(f"History listing, {n_records} records (best of {repeat}):")
+        print(f"  full entities, stdlib json:  {timed(run_full, repeat):8.1f} ms")
+        print(f"  full entities, orjson:       {timed(run_full_orjson, repeat):8.1f} ms")
+        print(f"  column projection:           {timed(run_projected, repeat):8.1f} ms")
+
+        slow_db.close()
+        fast_db.close()
+        stdlib_engine.dispose()
+        fast_engine.dispose()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the patient history listing')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    main(args.records, args.repeat)
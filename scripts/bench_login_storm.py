@@ -0,0 +1,102 @@
+"""
+Benchmark: API latency during a login storm.
+Fires N concurrent /api/auth/login requests at the app (in-process, via
+httpx's ASGI transport) while a probe calls /api/practitioners every few
+milliseconds, and reports the probe latency. The same storm is then replayed
+with bcrypt verified directly on the event loop, which is how the login
+handler used to run. Runs against a throwaway SQLite file.
+"""
+import sys
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000
+
+
+async def probe(client, headers, stop, spans):
+    """Latency is measured from when each probe was due, so event loop stalls count."""
+    due = time.perf_counter()
+    while True:
+        await client.get("/api/practitioners", headers=headers)
+        done = time.perf_counter()
+        spans.append((due, done))
+        if stop.is_set():
+            return
+        due = done + 0.005
+        await asyncio.sleep(0.005)
+
+
+async def run_storm(client, headers, storm, label):
+    spans = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(client, headers, stop, spans))
+    await asyncio.sleep(0.1)
+    start = time.perf_counter()
+    results = await storm()
+    end = time.perf_counter()
+    elapsed = end - start
+    stop.set()
+    await probe_task
+    latencies = [e - s for s, e in spans if e >= start and s <= end]
+    print(f"{label:<28} storm {elapsed * 1000:7.0f} ms   probe p50 {percentile(latencies, 50):6.1f} ms  "
+          f"p95 {percentile(latencies, 95):6.1f} ms  max {max(latencies) * 1000:6.1f} ms  ({len(latencies)} probes)")
+    return results
+
+
+async def main(logins: int):
+    import httpx
+    from web.app import app
+    from src.database.connection import SessionLocal
+    from src.database.models import User
+    from src.services import auth_service
+
+    db = SessionLocal()
+    db.add(User(username="bench", hashed_password=auth_service.get_password_hash("pw"), role="admin", is_active=True))
+    db.commit()
+    hashed = db.query(User.hashed_password).filter(User.username == "bench").scalar()
+    db.close()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        token = (await client.post("/api/auth/login", data={"username": "bench", "password": "pw"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        print(f"{logins} concurrent logins, {auth_service.HASH_WORKERS} hashing workers, "
+              f"bcrypt cost {auth_service.BCRYPT_ROUNDS}")
+        await run_storm(client, headers, lambda: asyncio.sleep(1.0), "idle")
+
+        async def pooled():
+            return await asyncio.gather(*[
+                client.post("/api/auth/login", data={"username": "bench", "password": "pw"}) for _ in range(logins)
+            ])
+        responses = await run_storm(client, headers, pooled, "logins (hashing pool)")
+        codes = {}
+        for response in responses:
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+        print(f"{'':<28} status codes {codes}")
+
+        async def inline_login():
+            await asyncio.sleep(0)
+            return auth_service.verify_password("pw", hashed)
+
+        async def inline():
+            return await asyncio.gather(*[inline_login() for _ in range(logins)])
+        await run_storm(client, headers, inline, "logins (bcrypt on the loop)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure API latency during a burst of logins")
+    parser.add_argument("--logins", type=int, default=30)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # The app opens ./sql_app.db
+        asyncio.run(main(args.logins))
@@ -0,0 +1,110 @@
+"""
+Benchmark prescription_lsh_service.find_similar against brute-force Jaccard.
+
+Builds a throwaway SQLite database of synthetic herb sets (variations of a few
+hundred base formulas, like real prescriptions), then for sampled queries
+reports LSH latency, brute-force latency and recall@k. Recall counts an LSH
+hit as correct when its exact Jaccard reaches the k-th best exact score, so
+ties do not penalise either side.
+"""
+import sys
+import os
+import time
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from src.database.models import PrescriptionSignature, PrescriptionLshBucket
+from src.services import prescription_lsh_service
+from src.services.prescription_service import HERBS
+
+
+def make_herb_sets(n: int, formulas: int, seed: int):
+    rng = random.Random(seed)
+    bases = [rng.sample(HERBS, rng.randint(4, 10)) for _ in range(formulas)]
+    sets = []
+    for _ in range(n):
+        herbs = set(rng.choice(bases))
+        for _ in range(rng.randint(0, 3)):
+            if herbs and rng.random() < 0.5:
+                herbs.discard(rng.choice(sorted(herbs)))
+            else:
+                herbs.add(rng.choice(HERBS))
+        sets.append(herbs or {rng.choice(HERBS)})
+    return sets
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(records: int, queries: int, k: int, formulas: int, db_path: str, seed: int):
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    PrescriptionSignature.__table__.create(bind=engine)
+    PrescriptionLshBucket.__table__.create(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+
+    print(f"Generating {records} herb sets from {formulas} base formulas...")
+    herb_sets = make_herb_sets(records, formulas, seed)
+
+    start = time.time()
+    chunk = 10000
+    for i in range(0, records, chunk):
+        prescription_lsh_service.write_signatures(
+            db, {rid + 1: herb_sets[rid] for rid in range(i, min(i + chunk, records))}
+        )
+        db.commit()
+    print(f"Indexed {records} signatures in {time.time() - start:.1f}s "
+          f"({os.path.getsize(db_path) / 1024 / 1024:.1f} MB)")
+
+    rng = random.Random(seed + 1)
+    lsh_times, brute_times, recalls = [], [], []
+    for _ in range(queries):
+        query = set(rng.choice(herb_sets))
+        query.add(rng.choice(HERBS))
+
+        start = time.perf_counter()
+        found = prescription_lsh_service.find_similar(db, query, k=k)
+        lsh_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        exact = sorted((jaccard(query, s) for s in herb_sets), reverse=True)[:k]
+        brute_times.append(time.perf_counter() - start)
+
+        threshold = exact[-1]
+        hits = sum(1 for rid, _ in found if jaccard(query, herb_sets[rid - 1]) >= threshold)
+        recalls.append(hits / k)
+
+    print(f"LSH top-{k}:   p50 {percentile(lsh_times, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(lsh_times, 0.95) * 1000:.1f} ms")
+    print(f"Brute force: p50 {percentile(brute_times, 0.5) * 1000:.1f} ms, "
+          f"p95 {percentile(brute_times, 0.95) * 1000:.1f} ms")
+    print(f"Recall@{k}: {sum(recalls) / len(recalls):.3f} over {queries} queries")
+
+    db.close()
+    os.remove(db_path)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark MinHash LSH prescription search')
+    parser.add_argument('--records', type=int, default=500000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--formulas', type=int, default=300, help='Base formulas the synthetic sets vary')
+    parser.add_argument('--db', default='bench_prescription_lsh.db', help='Throwaway SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    main(args.records, args.queries, args.k, args.formulas, args.db, args.seed)
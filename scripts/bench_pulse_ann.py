@@ -0,0 +1,131 @@
+"""
+Benchmark pulse_embedding_service.find_similar (semantic pulse search) at scale.
+
+Embeds synthetic pulse grids (random term combinations per cell, with a few
+hundred recurring grid patterns), stores them in a throwaway SQLite
+pulse_embeddings table, publishes an IVF snapshot and reports query latency
+and recall@k against an exact scan over all vectors. Queries are timed with a
+delta of post-snapshot writes still in the table, then again after the delta
+has been appended to the memory-mapped file as a segment.
+"""
+import sys
+import os
+import time
+import random
+import shutil
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from src.database.models import PulseEmbedding
+from src.services import pulse_embedding_service
+from src.services.pulse_index_service import HANDS, POSITIONS, LEVELS
+
+TERMS = ["浮", "沉", "迟", "数", "滑", "弦", "细", "缓", "紧", "弱", "无力", "有力", "中空", "大"]
+
+
+def make_grids(n: int, patterns: int, seed: int):
+    rng = random.Random(seed)
+    keys = [f"{h}-{p}-{l}" for h in HANDS for p in POSITIONS for l in LEVELS]
+    bases = [{key: "".join(rng.sample(TERMS, rng.randint(1, 3))) for key in rng.sample(keys, rng.randint(3, 12))}
+             for _ in range(patterns)]
+    grids = []
+    for _ in range(n):
+        grid = dict(rng.choice(bases))
+        for _ in range(rng.randint(0, 3)):
+            grid[rng.choice(keys)] = "".join(rng.sample(TERMS, rng.randint(1, 3)))
+        grids.append(grid)
+    return grids
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(records: int, queries: int, k: int, patterns: int, delta: int, nprobe: int, db_path: str, seed: int):
+    index_dir = db_path + ".ann"
+    for path in (db_path,):
+        if os.path.exists(path):
+            os.remove(path)
+    shutil.rmtree(index_dir, ignore_errors=True)
+    engine = create_engine(f"sqlite:///{db_path}")
+    PulseEmbedding.__table__.create(bind=engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+
+    print(f"Embedding {records} synthetic grids from {patterns} patterns...")
+    start = time.time()
+    grids = make_grids(records, patterns, seed)
+    vectors = np.empty((records, pulse_embedding_service.DIM), dtype=np.int8)
+    scales = np.empty(records, dtype=np.float32)
+    for i, grid in enumerate(grids):
+        vectors[i], scales[i] = pulse_embedding_service.quantize(pulse_embedding_service.embed_grid(grid))
+    print(f"Embedded in {time.time() - start:.1f}s")
+
+    start = time.time()
+    snapshot_size = records - delta
+    chunk = 50000
+    for i in range(0, records, chunk):
+        db.execute(insert(PulseEmbedding), [
+            {"record_id": j + 1, "seq": 1 if j < snapshot_size else 2,
+             "scale": float(scales[j]), "vector": vectors[j].tobytes()}
+            for j in range(i, min(i + chunk, records))
+        ])
+        db.commit()
+    pulse_embedding_service.publish_index(
+        np.arange(1, snapshot_size + 1), np.ones(snapshot_size), vectors[:snapshot_size], scales[:snapshot_size],
+        built_through=1, index_dir=index_dir
+    )
+    print(f"Stored and indexed in {time.time() - start:.1f}s: "
+          f"{pulse_embedding_service.index_stats(db, index_dir)}")
+
+    dense = vectors.astype(np.float32) * scales[:, None]
+
+    def run(label):
+        rng = random.Random(seed + 1)
+        times, recalls = [], []
+        for _ in range(queries):
+            grid = dict(rng.choice(grids))
+            grid[rng.choice(list(grid))] = rng.choice(TERMS)
+            start = time.perf_counter()
+            found = pulse_embedding_service.find_similar(db, grid, limit=k, nprobe=nprobe, index_dir=index_dir)
+            times.append(time.perf_counter() - start)
+
+            query = pulse_embedding_service.embed_grid(grid, mirror_single_hand=True)
+            exact = dense @ query
+            threshold = np.partition(exact, -k)[-k]
+            hits = sum(1 for rid, _ in found if exact[rid - 1] >= threshold - 1e-3)
+            recalls.append(hits / k)
+        print(f"{label} top-{k} (nprobe {nprobe}): p50 {percentile(times, 0.5) * 1000:.1f} ms, "
+              f"p95 {percentile(times, 0.95) * 1000:.1f} ms, recall@{k} {sum(recalls) / len(recalls):.3f}")
+
+    run(f"Snapshot + {delta}-row table delta:")
+    start = time.time()
+    pulse_embedding_service.append_index(db, index_dir)
+    print(f"Appended delta as a segment in {time.time() - start:.2f}s: "
+          f"{pulse_embedding_service.index_stats(db, index_dir)}")
+    run("Snapshot + appended segment:    ")
+
+    db.close()
+    os.remove(db_path)
+    shutil.rmtree(index_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark semantic pulse search (embedding ANN index)')
+    parser.add_argument('--records', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=25)
+    parser.add_argument('--patterns', type=int, default=500, help='Recurring grid patterns the synthetic grids vary')
+    parser.add_argument('--delta', type=int, default=2000, help='Rows written after the snapshot')
+    parser.add_argument('--nprobe', type=int, default=pulse_embedding_service.NPROBE)
+    parser.add_argument('--db', default='bench_pulse_ann.db', help='Throwaway SQLite file')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    main(args.records, args.queries, args.k, args.patterns, args.delta, args.nprobe, args.db, args.seed)
@@ -0,0 +1,105 @@
+"""
+Benchmark: payload size and server time of the read-heavy endpoints.
+For patient history, record detail, practitioners and patients-by-date it
+reports the bytes sent with no / gzip / br Accept-Encoding, the mean time per
+request, and the time of a revalidation (If-None-Match with the ETag of the
+previous response; 304 when supported). Runs the app in-process against a
+throwaway SQLite file.
+"""
+import sys
+import os
+import time
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def build_db(n_records: int):
+    from src.database.connection import SessionLocal
+    from src.database.models import User, Patient, Practitioner, MedicalRecord
+    from src.services import auth_service
+
+    db = SessionLocal()
+    db.add(User(username="bench", hashed_password=auth_service.get_password_hash("pw"), role="admin", is_active=True))
+    db.add_all([Practitioner(name=f"医师{i}", role="teacher" if i % 2 else "doctor") for i in range(40)])
+    patient = Patient(name="基准患者", gender="男", age=50, phone="13800000000")
+    db.add(patient)
+    db.flush()
+    grid = {f"{h}-{p}-{l}": "浮紧弦细" for h in ("left", "right") for p in ("cun", "guan", "chi") for l in ("fu", "zhong", "chen")}
+    grid["overall_description"] = "脉浮紧，沉取无力" * 5
+    today = datetime.now().replace(hour=9, minute=0, second=0, microsecond=0)
+    records = [
+        MedicalRecord(
+            patient_id=patient.id, visit_date=today - timedelta(days=i), complaint=f"头痛恶寒，项背强几几 {i}",
+            data={"medical_record": {"complaint": f"头痛恶寒，项背强几几 {i}", "prescription": "麻黄 桂枝 杏仁 甘草 " * 10},
+                  "pulse_grid": grid},
+        )
+        for i in range(n_records)
+    ]
+    db.add_all(records)
+    db.add_all([Patient(name=f"当日患者{i}", gender="女", age=30 + i % 40) for i in range(200)])
+    db.flush()
+    for p in db.query(Patient).filter(Patient.name.like("当日患者%")).all():
+        db.add(MedicalRecord(patient_id=p.id, visit_date=today, complaint="咳嗽", data={"medical_record": {}, "pulse_grid": {}}))
+    db.commit()
+    ids = (patient.id, records[0].id)
+    db.close()
+    return ids
+
+
+def measure(client, url, headers, repeat):
+    sizes = {encoding: _wire_bytes(client, url, headers, encoding) for encoding in ("identity", "gzip", "br")}
+    start = time.perf_counter()
+    for _ in range(repeat):
+        response = client.get(url, headers={**headers, "Accept-Encoding": "gzip"})
+    full = (time.perf_counter() - start) / repeat * 1000
+    etag = response.headers.get("etag")
+    conditional = {**headers, "Accept-Encoding": "gzip"}
+    if etag:
+        conditional["If-None-Match"] = etag
+    start = time.perf_counter()
+    for _ in range(repeat):
+        revalidated = client.get(url, headers=conditional)
+    revalidate = (time.perf_counter() - start) / repeat * 1000
+    return sizes, full, revalidate, revalidated.status_code
+
+
+def _wire_bytes(client, url, headers, encoding):
+    """Body size as sent (before the client decodes it)."""
+    with client.stream("GET", url, headers={**headers, "Accept-Encoding": encoding}) as response:
+        return len(b"".join(response.iter_raw()))
+
+
+def main(n_records: int, repeat: int):
+    from fastapi.testclient import TestClient
+    from web.app import app
+
+    patient_id, record_id = build_db(n_records)
+    client = TestClient(app)
+    token = client.post("/api/auth/login", data={"username": "bench", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    today = datetime.now().strftime("%Y-%m-%d")
+
+    print(f"{'endpoint':<32}{'identity':>10}{'gzip':>10}{'br':>10}{'ms/req':>10}{'revalidate':>12}")
+    for label, url in [
+        (f"history ({n_records} records)", f"/api/patients/{patient_id}/history"),
+        ("record detail", f"/api/records/{record_id}"),
+        ("practitioners (40)", "/api/practitioners"),
+        ("patients by date (200)", f"/api/patients/by_date?date={today}"),
+    ]:
+        sizes, full, revalidate, status = measure(client, url, headers, repeat)
+        print(f"{label:<32}{sizes['identity']:>10}{sizes['gzip']:>10}{sizes['br']:>10}{full:>10.2f}"
+              f"{revalidate:>8.2f} {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure payload size and latency of read endpoints")
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # The app opens ./sql_app.db
+        main(args.records, args.repeat)
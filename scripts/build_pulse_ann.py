@@ -0,0 +1,61 @@
+"""
+Publish a new generation of the on-disk pulse signature file (IVF over int8
+embedding codes, memory-mapped read-only by every web worker).
+
+Records saved or synced since the last generation are already searchable from
+the pulse_embeddings table, but every search scans them exactly, so fold them
+in regularly: --append (cheap, e.g. every few minutes from cron) writes them as
+a new segment; a plain run (e.g. nightly) compacts everything into a freshly
+clustered base. --append compacts by itself once segments grow too large.
+
+--reembed recomputes pulse_embeddings from medical_records first (first run,
+or after changing the embedding).
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import PulseEmbedding, SequenceCounter
+from src.services import pulse_embedding_service
+
+
+def build(reembed: bool = False, append: bool = False, nlist: int = None, index_dir: str = None):
+    PulseEmbedding.__table__.create(bind=engine, checkfirst=True)
+    SequenceCounter.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        if reembed:
+            start = time.time()
+            total = pulse_embedding_service.backfill_embeddings(db)
+            print(f"Embedded pulse grids of {total} records in {time.time() - start:.2f}s")
+        start = time.time()
+        if append and not reembed:
+            manifest = pulse_embedding_service.append_index(db, index_dir=index_dir)
+        else:
+            manifest = pulse_embedding_service.build_index(db, index_dir=index_dir, nlist=nlist)
+        print(f"Generation {manifest['generation']}: parts {manifest['parts']}, "
+              f"built through seq {manifest['built_through']} in {time.time() - start:.2f}s")
+        print(pulse_embedding_service.index_stats(db, index_dir))
+    except Exception as e:
+        db.rollback()
+        print(f"Error building pulse ANN index: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build or append to the pulse signature file (embedding ANN index)')
+    parser.add_argument('--reembed', action='store_true', help='Recompute all embeddings before building')
+    parser.add_argument('--append', action='store_true', help='Add new embeddings as a segment instead of rebuilding')
+    parser.add_argument('--nlist', type=int, default=None, help='Inverted lists (default: sqrt of vector count)')
+    parser.add_argument('--index-dir', default=None, help='Index directory (default: PULSE_ANN_DIR or ./pulse_ann)')
+    args = parser.parse_args()
+
+    build(args.reembed, args.append, args.nlist, args.index_dir)
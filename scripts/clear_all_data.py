@@ -5,13 +5,33 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.database.connection import SessionLocal
-from src.database.models import Patient, MedicalRecord
+from src.database.models import (
+    Patient, MedicalRecord, RecordPayload, AnalysisResult, ImportFingerprint, PatientSummary, PatternRollup,
+    PulseCell, PulseCellTerm, PulseEmbedding, PrescriptionItem, PrescriptionSignature, PrescriptionLshBucket,
+    ComplaintTerm,
+)
+
+# Tables derived from records and patients. SQLite does not enforce their
+# ON DELETE CASCADE (foreign_keys is off), so they are cleared explicitly;
+# otherwise stale import fingerprints make a re-import skip every row.
+DERIVED_TABLES = [
+    RecordPayload, AnalysisResult, ImportFingerprint, PatientSummary, PatternRollup,
+    PulseCellTerm, PulseCell, PulseEmbedding, PrescriptionItem, PrescriptionSignature, PrescriptionLshBucket,
+    ComplaintTerm,
+]
+
+def clear_derived(db):
+    for model in DERIVED_TABLES:
+        db.query(model).delete(synchronize_session=False)
 
 def clear_data():
     db = SessionLocal()
     try:
         print("Starting data cleanup...")
         
+        clear_derived(db)
+        print("Deleted derived index and summary rows.")
+
         # Delete medical records first due to foreign key constraint
         num_records = db.query(MedicalRecord).delete()
         print(f"Deleted {num_records} medical records.")
@@ -7,10 +7,14 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from sqlalchemy.orm import Session
 from src.database.connection import SessionLocal
 from src.database.models import Patient, MedicalRecord
+from scripts.clear_all_data import clear_derived
 
 def clear_patients():
     db = SessionLocal()
     try:
+        print("Clearing derived index and summary rows...")
+        clear_derived(db)
+
         print("Clearing medical records...")
         db.query(MedicalRecord).delete()
         
@@ -0,0 +1,36 @@
+"""
+Install the change_log triggers behind /api/changes if missing (the server
+also does this at startup) and drop log entries superseded by a later change
+of the same row. Clients at any cursor still receive the latest state of
+every row, so this is safe to run while the server is up.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.services import change_service
+
+
+def compact():
+    if change_service.ensure_change_log(engine):
+        print("Installed change_log triggers and logged existing rows")
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        removed = change_service.compact(db)
+        print(f"Removed {removed} superseded change_log entries in {time.time() - start:.2f}s "
+              f"(cursor now {change_service.current_cursor(db)})")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during compaction: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    compact()
@@ -1,66 +1,88 @@
+"""
+合并重复患者
+
+Finds duplicate patients with merge_service (pinyin / phone / gender / age
+blocking and scoring; same name alone is not enough) and merges each group
+into the patient with the most records. Use --dry-run to only print the
+report, --report to also write it as JSON.
+"""
 import sys
 import os
+import json
+import time
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from sqlalchemy import func, text
-from src.database.connection import SessionLocal
-from src.database.models import Patient, MedicalRecord
+from src.database.connection import engine, SessionLocal
+from src.database import schema
+from src.database.models import Patient, MedicalRecord, SyncTombstone
+from src.services import merge_service
+
+
+def _describe(p):
+    return f"{p['name']} (ID:{p['id']}, 电话:{p['phone'] or '-'}, {p['gender'] or '-'}, {p['age'] if p['age'] is not None else '-'}岁, {p['records']}条病历)"
+
+
+def merge_duplicates(dry_run: bool = False, threshold: float = merge_service.DEFAULT_THRESHOLD,
+                     report_path: str = None, batch_size: int = merge_service.DEFAULT_BATCH_SIZE, show: int = 50):
+    SyncTombstone.__table__.create(bind=engine, checkfirst=True)
+    # load_patients reads patients.pinyin_full, added after the first release
+    for column in schema.ensure_columns(engine):
+        print(f"Added column {column}")
 
-def merge_duplicates():
     db = SessionLocal()
     try:
-        # Find duplicate patients by name
-        duplicate_names = db.query(Patient.name, func.count(Patient.id).label('count'))\
-            .group_by(Patient.name)\
-            .having(func.count(Patient.id) > 1)\
-            .all()
-        
-        print(f"发现 {len(duplicate_names)} 组重复患者")
-        
-        if not duplicate_names:
-            print("没有重复数据需要合并")
-            return
-        
-        merged_count = 0
-        for name, count in duplicate_names:
-            patients = db.query(Patient).filter(Patient.name == name).order_by(Patient.id).all()
-            
-            # Keep the first one with most medical records
-            primary = max(patients, key=lambda p: db.query(MedicalRecord).filter(MedicalRecord.patient_id == p.id).count())
-            duplicates = [p for p in patients if p.id != primary.id]
-            
-            for dup in duplicates:
-                # Move medical records to primary patient
-                db.execute(
-                    text("UPDATE medical_records SET patient_id = :primary_id, sync_status = 'pending' WHERE patient_id = :dup_id"),
-                    {"primary_id": primary.id, "dup_id": dup.id}
-                )
-                
-                # Delete duplicate patient
-                db.execute(
-                    text("DELETE FROM patients WHERE id = :dup_id"),
-                    {"dup_id": dup.id}
-                )
-                merged_count += 1
-                print(f"  合并: {name} (ID:{dup.id} -> ID:{primary.id})")
-        
-        db.commit()
-        print(f"\n已合并 {merged_count} 条重复患者记录")
-        
-        # Final count
-        patient_count = db.query(Patient).count()
-        record_count = db.query(MedicalRecord).count()
+        start = time.time()
+        found = merge_service.find_duplicate_groups(db, threshold=threshold)
+        groups = found["groups"]
+        print(f"扫描 {found['patients']} 名患者，比较 {found['pairs_compared']} 对候选，"
+              f"发现 {len(groups)} 组重复患者 ({time.time() - start:.2f}s)")
+
+        for group in groups[:show]:
+            print(f"  保留: {_describe(group['keep'])}")
+            for dup in group["merge"]:
+                print(f"    合并: {_describe(dup)} 得分 {dup['score']}")
+        if len(groups) > show:
+            print(f"  ... 另有 {len(groups) - show} 组")
+        for block in found["skipped_blocks"]:
+            print(f"  跳过过大的分块 {block['key']} ({block['patients']} 名患者)")
+
+        if report_path:
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(found, f, ensure_ascii=False, indent=2)
+            print(f"报告已写入 {report_path}")
+
+        if dry_run or not groups:
+            if not groups:
+                print("没有重复数据需要合并")
+            return found
+
+        start = time.time()
+        stats = merge_service.merge_groups(db, groups, batch_size=batch_size)
+        print(f"\n已合并 {stats['patients_merged']} 条重复患者记录，移动 {stats['records_moved']} 条病历 "
+              f"({time.time() - start:.2f}s)")
+
         print(f"\n最终统计:")
-        print(f"  患者总数: {patient_count}")
-        print(f"  病历总数: {record_count}")
-        
+        print(f"  患者总数: {db.query(Patient).count()}")
+        print(f"  病历总数: {db.query(MedicalRecord).count()}")
+        return stats
+
     except Exception as e:
-        print(f"错误: {e}")
-        import traceback
-        traceback.print_exc()
         db.rollback()
+        print(f"错误: {e}")
+        raise
     finally:
         db.close()
 
+
 if __name__ == "__main__":
-    merge_duplicates()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Find and merge duplicate patients')
+    parser.add_argument('--dry-run', action='store_true', help='Only report duplicate groups')
+    parser.add_argument('--threshold', type=float, default=merge_service.DEFAULT_THRESHOLD, help='Minimum pair score')
+    parser.add_argument('--report', help='Write the duplicate report as JSON to this path')
+    parser.add_argument('--batch-size', type=int, default=merge_service.DEFAULT_BATCH_SIZE, help='Groups per transaction')
+    parser.add_argument('--show', type=int, default=50, help='Groups to print')
+    args = parser.parse_args()
+
+    merge_duplicates(args.dry_run, args.threshold, args.report, args.batch_size, args.show)
@@ -5,7 +5,8 @@ from sqlalchemy import text
 # Ensure src is in python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.database.connection import get_cloud_db
+from src.database.connection import get_cloud_db, cloud_engine
+from src.database.models import RecordPayload
 
 def migrate_cloud():
     print("Migrating Cloud Database...")
@@ -61,6 +62,31 @@ def migrate_cloud():
             db.commit()
             print(f"Table {table} migrated.")
 
+        # Analysis pattern columns (copied up with every medical record)
+        try:
+            db.execute(text("ALTER TABLE medical_records ADD COLUMN IF NOT EXISTS analysis_pattern VARCHAR"))
+            db.execute(text("ALTER TABLE medical_records ADD COLUMN IF NOT EXISTS analysis_features INTEGER"))
+            db.execute(text("CREATE INDEX IF NOT EXISTS ix_medical_records_analysis_pattern ON medical_records (analysis_pattern)"))
+            db.commit()
+            print("Analysis pattern columns ensured.")
+        except Exception as e:
+            print(f"Error adding analysis pattern columns: {e}")
+            db.rollback()
+
+        # Full-spelling pinyin column (copied up with every patient)
+        try:
+            db.execute(text("ALTER TABLE patients ADD COLUMN IF NOT EXISTS pinyin_full VARCHAR"))
+            db.execute(text("CREATE INDEX IF NOT EXISTS ix_patients_pinyin_full ON patients (pinyin_full)"))
+            db.commit()
+            print("Patient pinyin_full column ensured.")
+        except Exception as e:
+            print(f"Error adding pinyin_full column: {e}")
+            db.rollback()
+
+        # New tables synced from local
+        RecordPayload.__table__.create(bind=cloud_engine, checkfirst=True)
+        print("Table record_payloads ensured.")
+
         print("Cloud migration completed.")
         
     except Exception as e:
@@ -0,0 +1,94 @@
+"""
+Migrate medical_records.data to the split storage format:
+raw_input / raw_data move to the compressed record_payloads side table and the
+copies of medical_record / pulse_grid inside raw_input are dropped.
+
+Prints a size / page-read report before and after. Run with --vacuum to return
+the freed pages to the filesystem (SQLite).
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from src.database.connection import engine, SessionLocal
+from src.database.models import RecordPayload, MedicalRecord
+from src.services import storage_service
+
+
+def storage_report(db) -> dict:
+    """Database size and an estimate of pages read by a full list-style scan of medical_records."""
+    report = {}
+    if engine.dialect.name == "sqlite":
+        page_size = db.execute(text("PRAGMA page_size")).scalar()
+        page_count = db.execute(text("PRAGMA page_count")).scalar()
+        freelist = db.execute(text("PRAGMA freelist_count")).scalar()
+        report["db_bytes"] = page_size * page_count
+        report["free_pages"] = freelist
+    else:
+        page_size = 8192
+        report["db_bytes"] = db.execute(text("SELECT pg_database_size(current_database())")).scalar()
+
+    data_bytes = db.execute(text("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM medical_records")).scalar()
+    report["records"] = db.query(MedicalRecord).count()
+    report["data_bytes"] = data_bytes
+    report["scan_pages"] = -(-data_bytes // page_size)
+
+    start = time.time()
+    rows = db.query(MedicalRecord).all()
+    report["full_load_ms"] = round((time.time() - start) * 1000, 1)
+    db.expunge_all()
+    report["loaded"] = len(rows)
+    return report
+
+
+def print_report(title: str, report: dict):
+    print(f"--- {title} ---")
+    print(f"  database size:         {report['db_bytes'] / 1024:.1f} KB")
+    if "free_pages" in report:
+        print(f"  free pages:            {report['free_pages']}")
+    print(f"  records:               {report['records']}")
+    print(f"  data column bytes:     {report['data_bytes'] / 1024:.1f} KB")
+    print(f"  est. pages per scan:   {report['scan_pages']}")
+    print(f"  load all records:      {report['full_load_ms']} ms")
+
+
+def migrate(chunk_size: int = 500, vacuum: bool = False):
+    RecordPayload.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        print_report("Before", storage_report(db))
+
+        start = time.time()
+        rewritten = storage_service.migrate_record_storage(db, chunk_size=chunk_size)
+        print(f"\nRewrote {rewritten} records in {time.time() - start:.2f}s\n")
+
+        if vacuum and engine.dialect.name == "sqlite":
+            db.close()
+            with engine.connect() as conn:
+                conn.execution_options(isolation_level="AUTOCOMMIT").execute(text("VACUUM"))
+            db = SessionLocal()
+
+        payload_bytes = db.execute(text("SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM record_payloads")).scalar()
+        print_report("After", storage_report(db))
+        print(f"  record_payloads bytes: {payload_bytes / 1024:.1f} KB")
+    except Exception as e:
+        db.rollback()
+        print(f"Error migrating record storage: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Move raw payloads out of medical_records.data')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Records per transaction')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM the SQLite file afterwards')
+    args = parser.parse_args()
+
+    migrate(args.chunk_size, args.vacuum)
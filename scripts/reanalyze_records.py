@@ -0,0 +1,50 @@
+"""
+Offline re-analysis job: streams medical_records in chunks, runs
+analyze_pulse_data over a process pool and stores pattern + comments in
+analysis_results, tagged with the rule version. Records already analyzed
+under the current rule version are skipped unless --force is given.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import AnalysisResult
+from src.services import reanalysis_service
+
+
+def reanalyze(workers: int = 4, chunk_size: int = 500, force: bool = False):
+    AnalysisResult.__table__.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+
+        def progress(done):
+            print(f"  Analyzed {done} records ({time.time() - start:.1f}s)")
+
+        result = reanalysis_service.run_reanalysis(
+            db, workers=workers, chunk_size=chunk_size, force=force, progress=progress
+        )
+        print(f"Rule version {result['rule_version']}: analyzed {result['analyzed']} records "
+              f"in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error during re-analysis: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Re-run pulse analysis over stored records')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes (1 = in-process)')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Records per chunk / transaction')
+    parser.add_argument('--force', action='store_true', help='Re-analyze records already at the current rule version')
+    args = parser.parse_args()
+
+    reanalyze(args.workers, args.chunk_size, args.force)
@@ -0,0 +1,42 @@
+"""
+Rebuild the patient_summary projection (latest record, last visit, visit count)
+from medical_records. Safe to run at any time; also creates the table and the
+(patient_id, visit_date) index on databases created before they existed.
+"""
+import sys
+import os
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database.connection import engine, SessionLocal
+from src.database.models import PatientSummary, MedicalRecord
+from src.services import summary_service
+
+
+def rebuild(chunk_size: int = 1000):
+    PatientSummary.__table__.create(bind=engine, checkfirst=True)
+    for index in MedicalRecord.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+    db = SessionLocal()
+    try:
+        start = time.time()
+        total = summary_service.rebuild_patient_summaries(db, chunk_size=chunk_size)
+        print(f"Rebuilt patient_summary for {total} patients in {time.time() - start:.2f}s")
+    except Exception as e:
+        db.rollback()
+        print(f"Error rebuilding patient_summary: {e}")
+        raise
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rebuild the patient_summary projection')
+    parser.add_argument('--chunk-size', type=int, default=1000, help='Patients per transaction')
+    args = parser.parse_args()
+
+    rebuild(args.chunk_size)
@@ -8,6 +8,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.database.connection import SessionLocal
 from src.database.models import Patient, MedicalRecord, Practitioner
+from src.services import pinyin_service
 
 def seed_data():
     db = SessionLocal()
@@ -50,7 +51,8 @@ def seed_data():
                     gender=gender,
                     age=age,
                     phone=phone,
-                    info={"note": "Test data"}
+                    info={"note": "Test data"},
+                    **pinyin_service.pinyin_fields(name)
                 )
                 db.add(patient)
                 db.commit()
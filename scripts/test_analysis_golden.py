@@ -0,0 +1,81 @@
+"""
+Golden-output regression check for analysis_service.analyze_pulse_data.
+
+A deterministic corpus of pulse grids / prescriptions is analyzed and a digest
+of each JSON output is compared with data/golden/analysis_golden.json, so any
+change to the rule engine must keep the output byte-identical.
+
+    python scripts/test_analysis_golden.py            # check
+    python scripts/test_analysis_golden.py --update   # regenerate after an intended change
+"""
+import sys
+import os
+import json
+import random
+import hashlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.analysis_service import analyze_pulse_data
+
+GOLDEN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "golden", "analysis_golden.json")
+SEED = 20240117
+N_CASES = 1500
+
+QUALITIES = ["浮", "沉", "紧", "弦", "细", "弱", "微", "无", "空", "大", "虚", "滑", "数", "迟", "缓",
+             "浮紧", "浮大中空", "沉细无力", "弦紧", "细弱", "无根", "豁", "中空", "洪大", "沉迟"]
+OVERALLS = ["", "脉浮紧", "脉细弱", "沉取无根", "浮大中空，沉取豁然", "弦", "虚", "六脉平和", "寸浮尺空"]
+HERBS = ["附子", "干姜", "肉桂", "桂枝", "细辛", "吴茱萸", "石膏", "知母", "黄连", "黄芩", "大黄",
+         "麻黄", "甘草", "杏仁", "白芍", "生姜", "大枣", "党参", "白术"]
+KEYS = [f"{h}{p}-{l}" for h in ("left-", "right-", "") for p in ("cun", "guan", "chi") for l in ("fu", "zhong", "chen")]
+
+
+def build_cases():
+    rng = random.Random(SEED)
+    cases = [
+        {},
+        {"medical_record": {}, "pulse_grid": {}},
+        {"medical_record": {"prescription": "附"}, "pulse_grid": {"left-chi-chen": "  "}},
+    ]
+    while len(cases) < N_CASES:
+        grid = {}
+        for key in rng.sample(KEYS, rng.randint(0, 12)):
+            grid[key] = rng.choice(QUALITIES) + (" " if rng.random() < 0.1 else "")
+        overall = rng.choice(OVERALLS)
+        if overall or rng.random() < 0.3:
+            grid["overall_description"] = overall
+        herbs = rng.sample(HERBS, rng.randint(0, 6))
+        medical_record = {"complaint": rng.choice(["", "头痛", "恶寒发热", "腹泻"])}
+        if herbs or rng.random() < 0.5:
+            medical_record["prescription"] = " ".join(herbs)
+        cases.append({"medical_record": medical_record, "pulse_grid": grid})
+    return cases
+
+
+def digest(output) -> str:
+    raw = json.dumps(output, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def compute_digests():
+    return [digest(analyze_pulse_data(case)) for case in build_cases()]
+
+
+def test_analysis_golden():
+    with open(GOLDEN_PATH, encoding="utf-8") as f:
+        golden = json.load(f)
+    current = compute_digests()
+    assert len(current) == len(golden["digests"])
+    mismatches = [i for i, (a, b) in enumerate(zip(current, golden["digests"])) if a != b]
+    assert not mismatches, f"{len(mismatches)} outputs changed, first at case {mismatches[0]}"
+
+
+if __name__ == "__main__":
+    if "--update" in sys.argv:
+        os.makedirs(os.path.dirname(GOLDEN_PATH), exist_ok=True)
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump({"seed": SEED, "cases": N_CASES, "digests": compute_digests()}, f, indent=0)
+        print(f"Wrote {N_CASES} golden digests to {GOLDEN_PATH}")
+    else:
+        test_analysis_golden()
+        print(f"All {N_CASES} analysis outputs match the golden file")
@@ -0,0 +1,53 @@
+"""
+Regression check for pinyin_service.pinyin_fields: names with polyphonic
+characters must spell exactly as pypinyin spells the whole name (the phrase
+context picks the reading), which is what patient search has always matched.
+
+    python scripts/test_pinyin_fields.py
+"""
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pypinyin import lazy_pinyin, Style
+from src.services.pinyin_service import pinyin_fields
+
+# Names whose polyphonic characters read differently in context
+NAMES = ["王长生", "李重阳", "张朝晖", "曾乐乐", "单于行", "朴重行", "解长青", "张三", "欧阳朝阳", "乐正和"]
+# Spellings search users rely on
+EXPECTED = {
+    "王长生": ("wcs", "wangchangsheng"),
+    "李重阳": ("lcy", "lichongyang"),
+    "张朝晖": ("zzh", "zhangzhaohui"),
+    "张三": ("zs", "zhangsan"),
+}
+
+
+def main() -> int:
+    failures = 0
+    for name in NAMES:
+        fields = pinyin_fields(name)
+        initials = "".join(lazy_pinyin(name, style=Style.FIRST_LETTER))
+        full = "".join(lazy_pinyin(name)).lower()
+        if (fields["pinyin"], fields["pinyin_full"]) != (initials, full):
+            print(f"FAIL {name}: {fields} != ({initials}, {full})")
+            failures += 1
+    for name, expected in EXPECTED.items():
+        fields = pinyin_fields(name)
+        if (fields["pinyin"], fields["pinyin_full"]) != expected:
+            print(f"FAIL {name}: {fields} != {expected}")
+            failures += 1
+    spaced = pinyin_fields(" 王 长生 ")
+    if (spaced["pinyin"], spaced["pinyin_full"]) != EXPECTED["王长生"]:
+        print(f"FAIL whitespace: {spaced}")
+        failures += 1
+    return failures
+
+
+if __name__ == "__main__":
+    failures = main()
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+    print(f"All {len(NAMES) + len(EXPECTED) + 1} pinyin checks passed")
@@ -0,0 +1,50 @@
+"""
+Regression check for prescription_service.parse_prescription: herbs with a
+dose are items, while formula names ("麻黄汤加减") and dosage instructions
+("每日1剂") are not.
+
+    python scripts/test_prescription_parser.py
+"""
+import sys
+import os
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.prescription_service import parse_prescription
+
+# text -> expected [(herb, dose, unit)]
+CASES = {
+    "山药1g 炙甘草1g 附片0.5g": [("山药", 1.0, "g"), ("炙甘草", 1.0, "g"), ("附子", 0.5, "g")],
+    "麻黄9g": [("麻黄", 9.0, "g")],
+    "附子干姜": [("附子", None, None), ("干姜", None, None)],
+    "鹿角霜10g": [("鹿角霜", 10.0, "g")],
+    # Formula names
+    "麻黄汤加减": [],
+    "桂枝汤合麻黄汤": [],
+    "附子理中丸": [],
+    "六味地黄丸": [],
+    "玉屏风散": [],
+    "麻黄汤加减：麻黄9g 桂枝6g": [("麻黄", 9.0, "g"), ("桂枝", 6.0, "g")],
+    "小柴胡汤加减 柴胡12g 黄芩9g": [("柴胡", 12.0, "g"), ("黄芩", 9.0, "g")],
+    # Instructions
+    "饭后30分钟温服，每日1剂": [],
+    "麻黄9g 共6剂 每日1剂": [("麻黄", 9.0, "g")],
+}
+
+
+def main() -> int:
+    failures = 0
+    for text, expected in CASES.items():
+        got = [(item["herb"], item["dose"], item["unit"]) for item in parse_prescription(text)]
+        if got != expected:
+            print(f"FAIL {text}: {got} != {expected}")
+            failures += 1
+    return failures
+
+
+if __name__ == "__main__":
+    failures = main()
+    if failures:
+        print(f"{failures} check(s) failed")
+        sys.exit(1)
+    print(f"All {len(CASES)} prescription parser checks passed")
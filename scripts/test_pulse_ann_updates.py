@@ -0,0 +1,102 @@
+"""
+Regression check for pulse similarity search across record edits.
+
+Edits (and deletes) the newest record's pulse grid and searches before and
+after publishing a new generation (build and append), checking that search
+always sees the record's current grid and never the version in an older
+generation. Runs against a throwaway SQLite file and index directory.
+
+    python scripts/test_pulse_ann_updates.py
+"""
+import sys
+import os
+import random
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SEED = 20240117
+N_RECORDS = 300
+QUALITIES = ["浮", "沉", "紧", "弦", "细", "弱", "滑", "数", "迟", "缓", "洪大", "中空"]
+CELLS = [f"{h}-{p}-{l}" for h in ("left", "right") for p in ("cun", "guan", "chi") for l in ("fu", "zhong", "chen")]
+GRID_OLD = {cell: "浮大中空" for cell in CELLS}
+GRID_NEW = {cell: "沉细无力" for cell in CELLS}
+
+
+def similarity(db, grid, record_id, index_dir):
+    from src.services import pulse_embedding_service
+    hits = dict(pulse_embedding_service.find_similar(db, grid, limit=N_RECORDS * 2, index_dir=index_dir))
+    return hits.get(record_id)
+
+
+def check(db, label, record_id, current, stale, index_dir, failures):
+    """record_id must match its current grid (cosine ~1) and not the stale one."""
+    now = similarity(db, current, record_id, index_dir) if current else None
+    old = similarity(db, stale, record_id, index_dir)
+    ok = (current is None or (now is not None and now > 0.99)) and (old is None or old < 0.99)
+    print(f"  {'ok  ' if ok else 'FAIL'} {label}: current {now}, stale {old}")
+    if not ok:
+        failures.append(label)
+
+
+def main(tmp):
+    os.chdir(tmp)  # The app's SQLite file is ./sql_app.db
+    from src.database.connection import engine, Base, SessionLocal
+    from src.database.models import Patient, MedicalRecord
+    from src.services import pulse_embedding_service
+
+    Base.metadata.create_all(bind=engine)
+    index_dir = os.path.join(tmp, "pulse_ann")
+    rng = random.Random(SEED)
+    db = SessionLocal()
+    patient = Patient(name="测试患者")
+    db.add(patient)
+    db.flush()
+    grids = {}
+    for i in range(N_RECORDS):
+        record = MedicalRecord(patient_id=patient.id, data={})
+        db.add(record)
+        db.flush()
+        grids[record.id] = {cell: rng.choice(QUALITIES) for cell in rng.sample(CELLS, 6)}
+    newest = max(grids)
+    grids[newest] = GRID_OLD
+    pulse_embedding_service.write_embeddings(db, grids)
+    db.commit()
+    failures = []
+
+    pulse_embedding_service.build_index(db, index_dir=index_dir, nlist=4)
+    check(db, "generation holds the original grid", newest, GRID_OLD, GRID_NEW, index_dir, failures)
+
+    pulse_embedding_service.write_embeddings(db, {newest: GRID_NEW})
+    db.commit()
+    check(db, "edited newest record, before rebuild", newest, GRID_NEW, GRID_OLD, index_dir, failures)
+    pulse_embedding_service.build_index(db, index_dir=index_dir, nlist=4)
+    check(db, "edited newest record, after rebuild", newest, GRID_NEW, GRID_OLD, index_dir, failures)
+
+    pulse_embedding_service.write_embeddings(db, {newest: GRID_OLD})
+    db.commit()
+    check(db, "edited again, before append", newest, GRID_OLD, GRID_NEW, index_dir, failures)
+    pulse_embedding_service.append_index(db, index_dir=index_dir)
+    check(db, "edited again, after append", newest, GRID_OLD, GRID_NEW, index_dir, failures)
+
+    pulse_embedding_service.delete_embeddings(db, [newest])
+    db.query(MedicalRecord).filter(MedicalRecord.id == newest).delete()
+    db.commit()
+    check(db, "newest record deleted", newest, None, GRID_OLD, index_dir, failures)
+    record = MedicalRecord(patient_id=patient.id, data={})
+    db.add(record)
+    db.flush()
+    pulse_embedding_service.write_embeddings(db, {record.id: GRID_NEW})
+    db.commit()
+    check(db, "record added after deleting the newest", record.id, GRID_NEW, GRID_OLD, index_dir, failures)
+    db.close()
+    return failures
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = main(tmp)
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All pulse search update checks passed")
@@ -0,0 +1,93 @@
+"""
+Regression check for re-importing a clinic log after clearing the data.
+
+Imports a two-row workbook, clears it with each clear script and imports it
+again, checking that every row is imported again (no stale import
+fingerprints) and that no derived rows outlive their records. Runs against a
+throwaway SQLite file.
+
+    python scripts/test_reimport_after_clear.py
+"""
+import sys
+import os
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COLUMNS = ['患者姓名', '性别', '年龄', '门诊日期', '医生', '主诉', '诊断', '处方']
+ROWS = [
+    ['张三', '男', '45岁', '2024-01-05', '李师', '咳嗽三天', '风寒束表', '麻黄9g 桂枝6g 杏仁9g 甘草3g 共3付'],
+    ['李四', '女', '32', '2024-01-06', '李师', '头痛', '肝阳上亢', '天麻10g 钩藤12g 石决明15g'],
+]
+
+
+def write_workbook(path):
+    import openpyxl
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(COLUMNS)
+    for row in ROWS:
+        sheet.append(row)
+    workbook.save(path)
+
+
+def import_rows(path):
+    from src.database.connection import SessionLocal
+    from src.services import import_service
+    db = SessionLocal()
+    try:
+        return import_service.import_excel(db, path, user_id=1)
+    finally:
+        db.close()
+
+
+def leftovers():
+    from src.database.connection import SessionLocal
+    from scripts.clear_all_data import DERIVED_TABLES
+    db = SessionLocal()
+    try:
+        return {model.__tablename__: n for model in DERIVED_TABLES if (n := db.query(model).count())}
+    finally:
+        db.close()
+
+
+def main(tmp):
+    os.chdir(tmp)  # The app's SQLite file is ./sql_app.db
+    from src.database.connection import engine, Base
+    from scripts.clear_all_data import clear_data
+    from scripts.clear_patients_only import clear_patients
+
+    Base.metadata.create_all(bind=engine)
+    path = os.path.join(tmp, "log.xlsx")
+    write_workbook(path)
+    failures = []
+
+    stats = import_rows(path)
+    ok = stats["imported"] == len(ROWS)
+    print(f"  {'ok  ' if ok else 'FAIL'} first import: {stats['imported']} imported, {stats['duplicates']} duplicates")
+    if not ok:
+        failures.append("first import")
+
+    for label, clear in (("clear_all_data", clear_data), ("clear_patients_only", clear_patients)):
+        clear()
+        left = leftovers()
+        ok = not left
+        print(f"  {'ok  ' if ok else 'FAIL'} {label} leaves no derived rows: {left}")
+        if not ok:
+            failures.append(f"{label} leftovers")
+        stats = import_rows(path)
+        ok = stats["imported"] == len(ROWS) and stats["duplicates"] == 0
+        print(f"  {'ok  ' if ok else 'FAIL'} re-import after {label}: "
+              f"{stats['imported']} imported, {stats['duplicates']} duplicates")
+        if not ok:
+            failures.append(f"re-import after {label}")
+    return failures
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = main(tmp)
+    if failures:
+        print(f"{len(failures)} check(s) failed")
+        sys.exit(1)
+    print("All re-import after clear checks passed")
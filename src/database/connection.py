@@ -7,12 +7,34 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# JSON columns are (de)serialized with orjson when available: faster, and
+# non-ASCII text is stored as UTF-8 instead of \uXXXX escapes.
+try:
+    import orjson
+
+    def json_serializer(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY).decode("utf-8")
+
+    json_deserializer = orjson.loads
+except ImportError:
+    import json
+
+    def json_serializer(obj):
+        return json.dumps(obj, ensure_ascii=False)
+
+    json_deserializer = json.loads
+
 # --- Connection 1: Local Database (Always SQLite for offline support) ---
 # Hardcode local DB path to ensure it persists as the primary source of truth
 LOCAL_DATABASE_URL = "sqlite:///./sql_app.db"
 connect_args_local = {"check_same_thread": False}
 
-local_engine = create_engine(LOCAL_DATABASE_URL, connect_args=connect_args_local)
+local_engine = create_engine(
+    LOCAL_DATABASE_URL,
+    connect_args=connect_args_local,
+    json_serializer=json_serializer,
+    json_deserializer=json_deserializer
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=local_engine)
 
 # --- Connection 2: Cloud Database (PostgreSQL) ---
@@ -27,7 +49,9 @@ if CLOUD_DATABASE_URL and CLOUD_DATABASE_URL.startswith("postgresql"):
             CLOUD_DATABASE_URL, 
             pool_size=5, 
             max_overflow=10,
-            pool_timeout=30
+            pool_timeout=30,
+            json_serializer=json_serializer,
+            json_deserializer=json_deserializer
         )
         SessionCloud = sessionmaker(autocommit=False, autoflush=False, bind=cloud_engine)
         print("Cloud database engine configured.")
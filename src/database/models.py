@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, Boolean
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, DateTime, ForeignKey, Index, Boolean, LargeBinary
 from sqlalchemy.types import JSON
-from sqlalchemy.orm import relationship, declarative_mixin
+from sqlalchemy.orm import relationship, declarative_mixin, deferred
 from datetime import datetime
 import uuid
 from .connection import Base
@@ -46,6 +46,7 @@ class Patient(Base, SyncMixin):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True, nullable=False)
     pinyin = Column(String, index=True, nullable=True) # Added pinyin for search
+    pinyin_full = Column(String, index=True, nullable=True) # Full spelling for prefix search (pinyin_service)
     phone = Column(String, index=True, nullable=True) # Added phone number
     gender = Column(String, nullable=True)
     age = Column(Integer, nullable=True)
@@ -81,9 +82,14 @@ class MedicalRecord(Base, SyncMixin):
     # Relational Skeleton for common queries
     complaint = Column(Text, nullable=True) # 主诉
     diagnosis = Column(Text, nullable=True) # 诊断 (could be extracted later)
+
+    # Output of analysis_service for data, kept current on every write path
+    analysis_pattern = Column(String, nullable=True, index=True)
+    analysis_features = Column(Integer, nullable=True)  # Feature bitmask of the rule set
     
-    # JSONB Flesh for the core data
-    data = Column(JSON, nullable=False, server_default='{}')
+    # JSONB Flesh for the core data.
+    # Deferred: list queries never pay for it; use undefer(MedicalRecord.data) when needed.
+    data = deferred(Column(JSON, nullable=False, server_default='{}'))
     
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -91,3 +97,253 @@ class MedicalRecord(Base, SyncMixin):
     patient = relationship("Patient", back_populates="records")
     practitioner = relationship("Practitioner", back_populates="records")
     user = relationship("User", back_populates="records")
+
+    __table_args__ = (
+        Index("ix_medical_records_patient_visit", "patient_id", "visit_date"),
+        Index("ix_medical_records_practitioner_visit", "practitioner_id", "visit_date"),
+    )
+
+class RecordPayload(Base, SyncMixin):
+    """
+    Large, rarely-read parts of a medical record (original client payload,
+    Excel raw columns), stored compressed outside medical_records.data.
+    Encoded/decoded by storage_service; synced like the other models.
+    """
+    __tablename__ = "record_payloads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, unique=True, index=True)
+    encoding = Column(String(8), nullable=False, default="zlib")  # Compression of payload
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class SyncTombstone(Base):
+    """
+    A synced row that was removed locally (local only). Merged duplicate
+    patients leave one pointing at the patient they were merged into:
+    sync_up applies it to the cloud copy, and sync_down uses it so the
+    removed row is not pulled back and references to it are redirected.
+    """
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True, index=True)
+    table_name = Column(String(32), nullable=False)
+    uuid = Column(String(36), nullable=False)
+    replaced_by_uuid = Column(String(36), nullable=True)
+    deleted_at = Column(DateTime, default=datetime.now)
+    sync_status = Column(String, default='pending', index=True)
+
+    __table_args__ = (
+        Index("ix_sync_tombstones_table_uuid", "table_name", "uuid", unique=True),
+    )
+
+class ChangeLog(Base):
+    """
+    Change sequence behind /api/changes (local only). Rows are appended by
+    SQLite triggers on patients, medical_records and practitioners (see
+    change_service), so every write path is covered; id is the client cursor.
+    """
+    __tablename__ = "change_log"
+
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String(32), nullable=False)
+    row_id = Column(Integer, nullable=False)
+    uuid = Column(String(36), nullable=True)
+    user_id = Column(Integer, nullable=True)  # Owner of a medical record, for per-user feeds
+    op = Column(String(8), nullable=False)  # 'upsert' or 'delete'
+
+    __table_args__ = (
+        Index("ix_change_log_table_row", "table_name", "row_id"),
+        {"sqlite_autoincrement": True},  # Cursors must never be reused
+    )
+
+class PatientSummary(Base):
+    """
+    Denormalized per-patient projection (local only, not synced).
+    Maintained by summary_service on every write path; rebuild with
+    scripts/rebuild_patient_summary.py.
+    """
+    __tablename__ = "patient_summary"
+
+    patient_id = Column(Integer, ForeignKey("patients.id", ondelete="CASCADE"), primary_key=True)
+    latest_record_id = Column(Integer, nullable=True)
+    last_visit = Column(DateTime, nullable=True, index=True)
+    visit_count = Column(Integer, nullable=False, default=0)
+    last_practitioner_id = Column(Integer, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class PatternRollup(Base):
+    """
+    Record counts per practitioner, month ('YYYY-MM') and analysis pattern
+    (local only). Maintained incrementally by pattern_stats_service; rebuild
+    with scripts/backfill_record_patterns.py.
+    """
+    __tablename__ = "pattern_rollups"
+
+    id = Column(Integer, primary_key=True, index=True)
+    practitioner_id = Column(Integer, ForeignKey("practitioners.id"), nullable=True)
+    month = Column(String(7), nullable=False)
+    pattern = Column(String, nullable=True)
+    record_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        Index("ix_pattern_rollups_key", "practitioner_id", "month", "pattern"),
+        Index("ix_pattern_rollups_month_pattern", "month", "pattern"),
+    )
+
+class PulseCell(Base):
+    """
+    One pulse grid cell of a medical record, normalized out of medical_records.data
+    so pulse-pattern filters run as indexed SQL. Written in the same transaction as
+    the record by pulse_index_service; backfill with scripts/backfill_pulse_cells.py.
+    """
+    __tablename__ = "pulse_cells"
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, index=True)
+    hand = Column(String(8), nullable=True)  # 'left', 'right' or NULL for legacy unprefixed keys
+    position = Column(String(8), nullable=False)  # 'cun', 'guan', 'chi'
+    level = Column(String(8), nullable=False)  # 'fu', 'zhong', 'chen'
+    raw_text = Column(Text, nullable=False)
+    term_ids = Column(String, nullable=True)  # Comma-separated ids from pulse_index_service.PULSE_TERMS
+
+    __table_args__ = (
+        Index("ix_pulse_cells_position_level", "position", "level"),
+    )
+
+class PulseCellTerm(Base):
+    """Posting row: one recognised pulse term in one cell."""
+    __tablename__ = "pulse_cell_terms"
+
+    cell_id = Column(Integer, ForeignKey("pulse_cells.id", ondelete="CASCADE"), primary_key=True)
+    term_id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, index=True)
+    hand = Column(String(8), nullable=True)
+    position = Column(String(8), nullable=False)
+    level = Column(String(8), nullable=False)
+
+    __table_args__ = (
+        Index("ix_pulse_cell_terms_pos_level_term", "position", "level", "term_id", "record_id"),
+        Index("ix_pulse_cell_terms_term", "term_id", "record_id"),
+    )
+
+class PulseEmbedding(Base):
+    """
+    Hashed n-gram embedding of a record's pulse grid (pulse_embedding_service,
+    local only). Rows with seq above the on-disk ANN snapshot's built_through
+    form the delta that searches scan directly.
+    """
+    __tablename__ = "pulse_embeddings"
+
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), primary_key=True)
+    seq = Column(Integer, nullable=False, index=True)
+    scale = Column(Float, nullable=False)
+    vector = Column(LargeBinary, nullable=False)  # DIM int8 values; float value = int8 * scale
+
+class SequenceCounter(Base):
+    """
+    Named counters that only ever grow, e.g. the pulse_embeddings seq: taking
+    max(seq) + 1 would hand a replaced or deleted newest row's seq out again.
+    """
+    __tablename__ = "sequence_counters"
+
+    name = Column(String(32), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class PrescriptionItem(Base):
+    """
+    One herb of a record's prescription, parsed from medical_record.prescription
+    and imported 方药 text by prescription_service (local only). The
+    (herb, record_id) index serves as the herb -> records posting list.
+    """
+    __tablename__ = "prescription_items"
+
+    id = Column(Integer, primary_key=True, index=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False, default=0)
+    herb = Column(String, nullable=False)  # Dictionary name (aliases resolved)
+    raw_name = Column(String, nullable=False)  # As written, e.g. 附片 / 炒莱菔子
+    dose = Column(Float, nullable=True)
+    unit = Column(String(8), nullable=True)
+    source = Column(String(16), nullable=False, default="prescription")  # 'prescription' or 'raw_data'
+
+    __table_args__ = (
+        Index("ix_prescription_items_herb_record", "herb", "record_id"),
+    )
+
+class PrescriptionSignature(Base):
+    """MinHash signature of a record's herb set (prescription_lsh_service, local only)."""
+    __tablename__ = "prescription_signatures"
+
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), primary_key=True)
+    herb_count = Column(Integer, nullable=False, default=0)
+    signature = Column(LargeBinary, nullable=False)  # NUM_PERM little-endian uint32 values
+
+class PrescriptionLshBucket(Base):
+    """LSH posting row: one band bucket of a record's prescription signature."""
+    __tablename__ = "prescription_lsh_buckets"
+
+    bucket = Column(BigInteger, primary_key=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+class ComplaintTerm(Base):
+    """Posting row: one complaint term (CJK bigram or ASCII word) of a record (text_index_service, local only)."""
+    __tablename__ = "complaint_terms"
+
+    term = Column(String(32), primary_key=True)
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), primary_key=True, index=True)
+
+class AnalysisResult(Base):
+    """
+    Stored output of analysis_service for a record, tagged with the rule version
+    that produced it (local only). Filled by scripts/reanalyze_records.py; records
+    analyzed under an older rule version are picked up again on the next run.
+    """
+    __tablename__ = "analysis_results"
+
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), primary_key=True)
+    rule_version = Column(String(16), nullable=False, index=True)
+    pattern = Column(String, nullable=True, index=True)
+    features = Column(Integer, nullable=False, default=0)
+    consistency_comment = Column(Text, nullable=True)
+    prescription_comment = Column(Text, nullable=True)
+    suggestion = Column(Text, nullable=True)
+    analyzed_at = Column(DateTime, default=datetime.now)
+
+class ImportFingerprint(Base):
+    """
+    Fingerprint of an imported Excel row (normalized patient name, phone, visit
+    datetime, doctor and complaint; import_service, local only). Rows whose
+    fingerprint is already known are skipped, so re-imports are incremental.
+    """
+    __tablename__ = "import_fingerprints"
+
+    fingerprint = Column(BigInteger, primary_key=True)  # Signed 64-bit blake2b of the normalized fields
+    record_id = Column(Integer, ForeignKey("medical_records.id", ondelete="CASCADE"), nullable=False, index=True)
+
+class ImportJob(Base):
+    """
+    A background Excel import (import_job_service, local only). The upload is
+    spooled to spool_path; last_row is the Excel row number of the last
+    committed chunk and is updated in the same transaction as that chunk,
+    so a cancelled, failed or interrupted job resumes right after it.
+    """
+    __tablename__ = "import_jobs"
+
+    id = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    filename = Column(String, nullable=False)
+    spool_path = Column(String, nullable=True)  # Cleared once the job is done and the file removed
+    status = Column(String(16), nullable=False, default="queued", index=True)  # queued, running, done, failed, cancelled, interrupted
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    rows = Column(Integer, nullable=False, default=0)
+    imported = Column(Integer, nullable=False, default=0)
+    skipped = Column(Integer, nullable=False, default=0)
+    duplicates = Column(Integer, nullable=False, default=0)  # Rows already imported earlier
+    errors = Column(JSON, nullable=True)  # First import_service.MAX_ERRORS row errors
+    last_row = Column(Integer, nullable=False, default=0)
+    message = Column(Text, nullable=True)  # Failure reason
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
@@ -0,0 +1,42 @@
+from typing import List
+import logging
+from sqlalchemy import inspect, text
+from src.database.connection import Base
+from src.database import models  # noqa: F401  (registers the tables on Base.metadata)
+
+logger = logging.getLogger(__name__)
+
+# Columns added to existing tables after a release. create_all only creates
+# missing tables, so databases from before a column existed get it here.
+# Values are filled by the backfill scripts listed in API_DOCUMENTATION.md
+# ("升级说明").
+# (table, column, SQL type)
+ADDED_COLUMNS = [
+    ("medical_records", "analysis_pattern", "VARCHAR"),  # scripts/backfill_record_patterns.py
+    ("medical_records", "analysis_features", "INTEGER"),
+    ("patients", "pinyin_full", "VARCHAR"),  # scripts/backfill_patient_pinyin.py
+]
+
+def ensure_columns(engine) -> List[str]:
+    """
+    Add the ADDED_COLUMNS missing from existing tables, and their indexes.
+    Safe to call on every startup. Returns the "table.column" names added.
+    """
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    for table, column, sql_type in ADDED_COLUMNS:
+        if table not in tables:
+            continue  # create_all builds it with every column
+        if column in {c["name"] for c in inspector.get_columns(table)}:
+            continue
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type}"))
+        added.append(f"{table}.{column}")
+    for table in {name.split(".")[0] for name in added}:
+        for index in Base.metadata.tables[table].indexes:
+            index.create(bind=engine, checkfirst=True)
+    if added:
+        logger.warning("Added columns %s; run the backfill scripts in API_DOCUMENTATION.md to fill them",
+                       ", ".join(added))
+    return added
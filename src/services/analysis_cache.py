@@ -0,0 +1,136 @@
+from typing import Dict, Any, Optional, Tuple
+import json
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+def request_key(body: bytes, rule_version: str) -> Tuple[str, bytes]:
+    """
+    Memo key for one /api/analyze request: the rule version and the raw body.
+    Hashing the bytes is far cheaper than evaluating the rules, whereas
+    canonicalising the parsed payload (every grid cell, stripped) cost about
+    as much as the evaluation it was meant to skip. A client re-submitting an
+    unchanged form sends the same bytes.
+    """
+    return (rule_version, body)
+
+def key_digest(key: Tuple[str, bytes]) -> str:
+    """Stable hex digest of a memo key, used by the on-disk tier."""
+    return hashlib.sha256(key[0].encode("utf-8") + b"\0" + key[1]).hexdigest()
+
+class AnalysisMemo:
+    """
+    Thread-safe LRU + TTL memo for analysis results.
+    Entries expire ttl seconds after they were computed. When disk_path is set,
+    results are also written to a small SQLite file so warm entries survive
+    restarts and are shared between uvicorn workers; memory misses fall back
+    to it before recomputing.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0, disk_path: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._entries: "OrderedDict[Tuple, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_path:
+            try:
+                self._disk = sqlite3.connect(disk_path, timeout=5, check_same_thread=False, isolation_level=None)
+                self._disk.execute("PRAGMA journal_mode=WAL")
+                self._disk.execute(
+                    "CREATE TABLE IF NOT EXISTS analysis_memo (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+                )
+            except sqlite3.Error as e:
+                logger.error(f"Analysis memo disk tier disabled ({disk_path}): {e}")
+                self._disk = None
+
+    def get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(entry[1])
+                del self._entries[key]
+
+            if self._disk is not None:
+                row = self._disk_get(key_digest(key))
+                if row is not None and now - row[1] < self.ttl:
+                    value = json.loads(row[0])
+                    self._put_memory(key, row[1], value)
+                    self.disk_hits += 1
+                    return dict(value)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: Tuple, value: Dict[str, Any]):
+        now = time.time()
+        value = dict(value)
+        with self._lock:
+            self._put_memory(key, now, value)
+            if self._disk is not None:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO analysis_memo (key, value, created) VALUES (?, ?, ?)",
+                        (key_digest(key), json.dumps(value, ensure_ascii=False), now)
+                    )
+                except sqlite3.Error as e:
+                    logger.warning(f"Analysis memo disk write failed: {e}")
+
+    def _put_memory(self, key: Tuple, created: float, value: Dict[str, Any]):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def _disk_get(self, digest: str):
+        try:
+            return self._disk.execute(
+                "SELECT value, created FROM analysis_memo WHERE key = ?", (digest,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Analysis memo disk read failed: {e}")
+            return None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.disk_hits = self.misses = 0
+            if self._disk is not None:
+                self._disk.execute("DELETE FROM analysis_memo")
+
+    def purge_expired(self) -> int:
+        """Drop expired entries from both tiers. Returns the number of disk rows removed."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [k for k, (created, _) in self._entries.items() if created < cutoff]:
+                del self._entries[key]
+            if self._disk is None:
+                return 0
+            return self._disk.execute("DELETE FROM analysis_memo WHERE created < ?", (cutoff,)).rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "disk": self.disk_path if self._disk is not None else None,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
@@ -1,6 +1,12 @@
 import os
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Dict, Any, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session
@@ -18,24 +24,167 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-for-development-only")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 # 24 hours
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes with a different cost than BCRYPT_ROUNDS are flagged by
+# verify_and_update and rewritten on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"], deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS
+)
+
+# bcrypt costs ~100+ ms of CPU per call; it runs on this bounded pool (bcrypt
+# releases the GIL) instead of the event loop. At most HASH_WORKERS +
+# HASH_QUEUE calls are admitted at once; beyond that callers get a 503 so a
+# login storm cannot queue unbounded work.
+HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE = int(os.getenv("AUTH_HASH_QUEUE", "32"))
+_hash_executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_admitted = 0
+_hash_lock = threading.Lock()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 class TokenData(BaseModel):
     username: Optional[str] = None
 
+@dataclass(frozen=True)
+class CurrentUser:
+    """
+    Snapshot of the User columns request handlers read. Cached across
+    requests, so it is deliberately not a session-bound ORM object.
+    """
+    id: int
+    username: str
+    role: str
+    is_active: bool
+    real_name: Optional[str] = None
+
+    @classmethod
+    def from_user(cls, user: User) -> "CurrentUser":
+        return cls(id=user.id, username=user.username, role=user.role,
+                   is_active=bool(user.is_active), real_name=user.real_name)
+
+class UserCache:
+    """
+    Thread-safe LRU + TTL map of validated token -> CurrentUser, so steady-state
+    authentication needs neither a JWT decode nor a users query. Entries live
+    ttl seconds (never past the token's own expiry) and are dropped when an
+    admin changes the user. The cache is per process: with several uvicorn
+    workers another worker sees a change only once its entry expires.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, CurrentUser]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, token: str) -> Optional[CurrentUser]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is not None:
+                if now < entry[0]:
+                    self._entries.move_to_end(token)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[token]
+            self.misses += 1
+            return None
+
+    def put(self, token: str, user: CurrentUser, token_expires: Optional[float] = None):
+        expires = time.time() + self.ttl
+        if token_expires is not None:
+            expires = min(expires, token_expires)
+        with self._lock:
+            self._entries[token] = (expires, user)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> int:
+        """Drop every cached token of a user. Returns the number of entries removed."""
+        with self._lock:
+            tokens = [t for t, (_, user) in self._entries.items() if user.id == user_id]
+            for token in tokens:
+                del self._entries[token]
+            self.invalidations += 1
+            return len(tokens)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.invalidations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+user_cache = UserCache(
+    maxsize=int(os.getenv("AUTH_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_CACHE_TTL", "60"))
+)
+
+def invalidate_user(user_id: int):
+    """Call after changing a user's role, activation or password, or deleting it."""
+    user_cache.invalidate_user(user_id)
+
+def get_cache_stats() -> Dict[str, Any]:
+    """Hit / miss counters of the token -> user cache."""
+    return user_cache.stats()
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def _run_hashing(fn, *args):
+    global _hash_admitted
+    with _hash_lock:
+        if _hash_admitted >= HASH_WORKERS + HASH_QUEUE:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="登录请求过多，请稍后重试",
+                headers={"Retry-After": "1"},
+            )
+        _hash_admitted += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        with _hash_lock:
+            _hash_admitted -= 1
+
+async def verify_password_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """
+    verify_password on the hashing pool. Returns (valid, new_hash); new_hash is
+    set when the stored hash used another cost and should be replaced.
+    """
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await _run_hashing(pwd_context.hash, password)
+
 async def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cached = user_cache.get(token)
+    if cached is not None:
+        return cached
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
@@ -47,7 +196,9 @@ async def get_current_user(db: Session = Depends(get_db), token: str = Depends(o
     user = get_user_by_username(db, username=token_data.username)
     if user is None:
         raise credentials_exception
-    return user
+    current = CurrentUser.from_user(user)
+    user_cache.put(token, current, payload.get("exp"))
+    return current
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if not current_user.is_active:
@@ -78,7 +229,7 @@ def get_user_by_username(db: Session, username: str):
 def create_user(db: Session, user_data: dict):
     db_user = User(
         username=user_data["username"],
-        hashed_password=get_password_hash(user_data["password"]),
+        hashed_password=user_data.get("hashed_password") or get_password_hash(user_data["password"]),
         role=user_data.get("role", "practitioner")
     )
     db.add(db_user)
@@ -95,6 +246,7 @@ def update_user_role(db: Session, user_id: int, role: str):
         user.role = role
         db.commit()
         db.refresh(user)
+        invalidate_user(user.id)
     return user
 
 def delete_user(db: Session, user_id: int):
@@ -102,4 +254,5 @@ def delete_user(db: Session, user_id: int):
     if user:
         db.delete(user)
         db.commit()
+        invalidate_user(user_id)
     return user
@@ -0,0 +1,224 @@
+from typing import Dict, Any, List, Optional
+import logging
+from sqlalchemy.orm import Session
+from sqlalchemy import text, func
+from src.database.models import Patient, MedicalRecord, Practitioner, ChangeLog, SyncTombstone
+
+logger = logging.getLogger(__name__)
+
+# Change feed for client-side caches. SQLite triggers append a change_log row
+# whenever a patient, record or practitioner is inserted, deleted, or has a
+# field the feed returns changed; writes come from the ORM, bulk mappings,
+# Core executemany and scripts alike, and the triggers see all of them.
+# SQLite has one writer at a time, so ids become visible in order and a
+# client's cursor (the last id it saw) never skips a change.
+MAX_LIMIT = 5000
+
+# table -> (columns whose change is logged, expression for the owner user_id)
+_TRACKED = {
+    "patients": (["name", "gender", "age", "phone", "is_deleted"], None),
+    "medical_records": (["patient_id", "practitioner_id", "user_id", "visit_date", "complaint", "data", "is_deleted"], "user_id"),
+    "practitioners": (["name", "role", "is_deleted"], None),
+}
+_MODELS = {"patients": Patient, "medical_records": MedicalRecord, "practitioners": Practitioner}
+_FEED_KEYS = {"patients": "patients", "medical_records": "records", "practitioners": "practitioners"}
+
+def _trigger_ddl(table: str) -> Dict[str, str]:
+    """Trigger name -> CREATE TRIGGER statement for one tracked table."""
+    columns, owner = _TRACKED[table]
+
+    def values(row: str, op: str) -> str:
+        user = f"{row}.{owner}" if owner else "NULL"
+        return (f"INSERT INTO change_log (table_name, row_id, uuid, user_id, op) "
+                f"VALUES ('{table}', {row}.id, {row}.uuid, {user}, '{op}');")
+
+    changed = " OR ".join(f"NEW.{c} IS NOT OLD.{c}" for c in columns)
+    update = values("NEW", "upsert")
+    if owner:
+        # A row handed to another owner is a delete for the previous one, logged
+        # first so the new owner's upsert stays the row's latest entry
+        update = (f"INSERT INTO change_log (table_name, row_id, uuid, user_id, op) "
+                  f"SELECT '{table}', OLD.id, OLD.uuid, OLD.{owner}, 'delete' "
+                  f"WHERE OLD.{owner} IS NOT NULL AND OLD.{owner} IS NOT NEW.{owner}; {update}")
+    return {
+        f"change_log_{table}_insert": f"CREATE TRIGGER change_log_{table}_insert AFTER INSERT ON {table} "
+                                      f"BEGIN {values('NEW', 'upsert')} END",
+        f"change_log_{table}_update": f"CREATE TRIGGER change_log_{table}_update AFTER UPDATE ON {table} "
+                                      f"WHEN {changed} BEGIN {update} END",
+        f"change_log_{table}_delete": f"CREATE TRIGGER change_log_{table}_delete AFTER DELETE ON {table} "
+                                      f"BEGIN {values('OLD', 'delete')} END",
+    }
+
+def ensure_change_log(engine) -> bool:
+    """
+    Create the change_log table and its triggers (SQLite only), replacing
+    triggers installed by an older version. The first time, every existing
+    row is logged as an upsert so a client starting from cursor 0 sees the
+    whole data set. Returns True if any trigger was (re)created.
+    """
+    if engine.dialect.name != "sqlite":
+        return False
+    ChangeLog.__table__.create(bind=engine, checkfirst=True)
+    with engine.begin() as conn:
+        existing = dict(conn.execute(
+            text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'change_log_%'")
+        ).all())
+        wanted = {}
+        for table in _TRACKED:
+            wanted.update(_trigger_ddl(table))
+        stale = {name for name, ddl in wanted.items() if existing.get(name) != ddl}
+        if not stale:
+            return False
+        for name in stale:
+            if name in existing:
+                conn.execute(text(f"DROP TRIGGER {name}"))
+            conn.execute(text(wanted[name]))
+        if not existing:
+            for table, (_, owner) in _TRACKED.items():
+                conn.execute(text(
+                    f"INSERT INTO change_log (table_name, row_id, uuid, user_id, op) "
+                    f"SELECT '{table}', id, uuid, {owner or 'NULL'}, 'upsert' FROM {table} ORDER BY id"
+                ))
+            logger.info("Change log initialised")
+    return True
+
+def current_cursor(db: Session) -> int:
+    return db.query(func.max(ChangeLog.id)).scalar() or 0
+
+def _patient_dict(p) -> Dict[str, Any]:
+    return {"id": p.id, "uuid": p.uuid, "name": p.name, "gender": p.gender, "age": p.age, "phone": p.phone,
+            "updated_at": p.updated_at.isoformat() if p.updated_at else None}
+
+def _record_dict(r) -> Dict[str, Any]:
+    return {"id": r.id, "uuid": r.uuid, "patient_id": r.patient_id, "practitioner_id": r.practitioner_id,
+            "visit_date": r.visit_date.isoformat() if r.visit_date else None, "complaint": r.complaint,
+            "updated_at": r.updated_at.isoformat() if r.updated_at else None}
+
+def _practitioner_dict(p) -> Dict[str, Any]:
+    return {"id": p.id, "uuid": p.uuid, "name": p.name, "role": p.role}
+
+_COLUMNS = {
+    "patients": [Patient.id, Patient.uuid, Patient.name, Patient.gender, Patient.age, Patient.phone, Patient.updated_at],
+    "medical_records": [MedicalRecord.id, MedicalRecord.uuid, MedicalRecord.patient_id, MedicalRecord.practitioner_id,
+                        MedicalRecord.visit_date, MedicalRecord.complaint, MedicalRecord.updated_at, MedicalRecord.user_id],
+    "practitioners": [Practitioner.id, Practitioner.uuid, Practitioner.name, Practitioner.role],
+}
+_TO_DICT = {"patients": _patient_dict, "medical_records": _record_dict, "practitioners": _practitioner_dict}
+
+def _load_rows(db: Session, table: str, ids: List[int]) -> Dict[int, Any]:
+    """Current, not soft-deleted rows by id (missing ids were deleted since)."""
+    model = _MODELS[table]
+    rows = {}
+    for i in range(0, len(ids), 500):
+        query = db.query(*_COLUMNS[table]).filter(model.id.in_(ids[i:i + 500]), model.is_deleted.isnot(True))
+        rows.update((row.id, row) for row in query)
+    return rows
+
+def get_changes(db: Session, since: int = 0, limit: int = 1000, user_id: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Changes after cursor since, oldest first, at most limit log entries.
+    user_id limits records to that user's (a record given to another user
+    shows up as deleted), and patients, including deleted and merged ones, to
+    those the user has records for. Each table gets "upserts" (current row values; several
+    changes to one row collapse into one) and "deleted" ({id, uuid}, plus
+    replaced_by_uuid for merged patients), under "patients", "records" and
+    "practitioners". Returns the cursor to pass next time and has_more when
+    the page was full.
+    Raises ValueError if since is ahead of the log (e.g. the database was reset).
+    """
+    head = current_cursor(db)
+    if since > head:
+        raise ValueError("Cursor is ahead of the change log; start again from 0")
+    query = db.query(ChangeLog.id, ChangeLog.table_name, ChangeLog.row_id, ChangeLog.uuid, ChangeLog.op)\
+        .filter(ChangeLog.id > since, ChangeLog.id <= head)
+    if user_id is not None:
+        query = query.filter((ChangeLog.table_name != "medical_records") | (ChangeLog.user_id == user_id))
+    entries = query.order_by(ChangeLog.id).limit(limit).all()
+    has_more = len(entries) == limit
+    cursor = entries[-1].id if has_more else head
+
+    latest: Dict[tuple, Any] = {}
+    for entry in entries:
+        latest[(entry.table_name, entry.row_id)] = entry  # Last change of a row wins
+
+    loaded = {}
+    for table in _TRACKED:
+        ids = [row_id for (name, row_id), e in latest.items() if name == table and e.op == "upsert"]
+        loaded[table] = _load_rows(db, table, ids)
+
+    visible = dict(loaded)
+    if user_id is not None:
+        # Patients are visible through the user's records: keep changed patients
+        # the user has records for, and add the patients of changed records
+        records = {rid: r for rid, r in loaded["medical_records"].items() if r.user_id == user_id}
+        changed = list(loaded["patients"])
+        owned = set()
+        for i in range(0, len(changed), 500):
+            owned.update(pid for (pid,) in db.query(MedicalRecord.patient_id).filter(
+                MedicalRecord.patient_id.in_(changed[i:i + 500]), MedicalRecord.user_id == user_id).distinct())
+        patients = {pid: row for pid, row in loaded["patients"].items() if pid in owned}
+        referenced = {r.patient_id for r in records.values()} - set(patients)
+        patients.update(_load_rows(db, "patients", sorted(referenced)))
+        visible["patients"] = patients
+        visible["medical_records"] = records
+
+    result: Dict[str, Any] = {"cursor": cursor, "has_more": has_more}
+    for table, key in _FEED_KEYS.items():
+        # Deleted, or soft-deleted / gone again (or, for a user, no longer theirs) since the logged upsert
+        deleted = [
+            {"id": row_id, "uuid": e.uuid} for (name, row_id), e in latest.items()
+            if name == table and (e.op == "delete" or row_id not in loaded[table]
+                                  or (user_id is not None and table == "medical_records"
+                                      and row_id not in visible[table]))
+        ]
+        if table == "patients":
+            _add_replacements(db, deleted)
+            if user_id is not None:
+                deleted = _owned_patients(db, deleted, user_id)
+        result[key] = {
+            "upserts": [_TO_DICT[table](row) for _, row in sorted(visible[table].items())],
+            "deleted": deleted,
+        }
+    return result
+
+def _add_replacements(db: Session, deleted: List[Dict[str, Any]]) -> None:
+    """replaced_by_uuid for patients merged into another one (see merge_service)."""
+    uuids = [d["uuid"] for d in deleted if d["uuid"]]
+    replaced = {}
+    for i in range(0, len(uuids), 500):
+        replaced.update(db.query(SyncTombstone.uuid, SyncTombstone.replaced_by_uuid).filter(
+            SyncTombstone.table_name == Patient.__tablename__, SyncTombstone.uuid.in_(uuids[i:i + 500])
+        ).all())
+    for d in deleted:
+        if replaced.get(d["uuid"]):
+            d["replaced_by_uuid"] = replaced[d["uuid"]]
+
+def _owned_patients(db: Session, deleted: List[Dict[str, Any]], user_id: int) -> List[Dict[str, Any]]:
+    """
+    Deleted patients the user has records for: still pointing at the patient
+    (soft delete) or, for a merged patient, moved to the one it was merged into.
+    """
+    survivors = {}
+    uuids = [d["replaced_by_uuid"] for d in deleted if d.get("replaced_by_uuid")]
+    for i in range(0, len(uuids), 500):
+        survivors.update(db.query(Patient.uuid, Patient.id).filter(Patient.uuid.in_(uuids[i:i + 500])).all())
+    candidates = list({d["id"] for d in deleted} | set(survivors.values()))
+    owned = set()
+    for i in range(0, len(candidates), 500):
+        owned.update(pid for (pid,) in db.query(MedicalRecord.patient_id).filter(
+            MedicalRecord.patient_id.in_(candidates[i:i + 500]), MedicalRecord.user_id == user_id).distinct())
+    return [d for d in deleted if d["id"] in owned or survivors.get(d.get("replaced_by_uuid")) in owned]
+
+def compact(db: Session) -> int:
+    """
+    Drop log entries superseded by a later entry for the same row and owner
+    (a previous owner keeps the delete logged when a record changed hands).
+    Clients at any cursor still see the latest change of every row. Returns
+    the number of entries removed.
+    """
+    removed = db.execute(text(
+        "DELETE FROM change_log WHERE id NOT IN "
+        "(SELECT MAX(id) FROM change_log GROUP BY table_name, row_id, user_id)"
+    )).rowcount
+    db.commit()
+    return removed
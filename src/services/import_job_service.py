@@ -0,0 +1,186 @@
+from typing import Dict, Any, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from uuid import uuid4
+import logging
+import multiprocessing
+import os
+import threading
+from sqlalchemy.orm import Session
+from src.database.connection import SessionLocal
+from src.database.models import ImportJob
+from src.services import import_service
+
+logger = logging.getLogger(__name__)
+
+# Background Excel imports: the upload is spooled to SPOOL_DIR, an import_jobs
+# row is queued, and a process pool runs import_service.import_excel on the
+# file. Progress and the resume point (last_row) are written inside each chunk's
+# transaction. SQLite allows one writer at a time, so one worker is the default.
+SPOOL_DIR = os.getenv("IMPORT_SPOOL_DIR", "import_spool")
+WORKERS = int(os.getenv("IMPORT_WORKERS", "1"))
+SPOOL_CHUNK = 1 << 20
+ACTIVE_STATUSES = ("queued", "running")
+RESUMABLE_STATUSES = ("failed", "cancelled", "interrupted")
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def job_dict(job: ImportJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "filename": job.filename,
+        "status": job.status,
+        "rows": job.rows,
+        "imported": job.imported,
+        "skipped": job.skipped,
+        "duplicates": job.duplicates,
+        "errors": (job.errors or [])[:10],  # First 10 errors
+        "last_row": job.last_row,
+        "message": job.message,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+async def spool_upload(upload, filename: str) -> str:
+    """Copy an UploadFile to a new file under SPOOL_DIR, SPOOL_CHUNK bytes at a time."""
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = os.path.join(SPOOL_DIR, uuid4().hex + os.path.splitext(filename)[1].lower())
+    with open(path, "wb") as out:
+        while True:
+            block = await upload.read(SPOOL_CHUNK)
+            if not block:
+                break
+            out.write(block)
+    return path
+
+def create_job(db: Session, user_id: int, filename: str, spool_path: str) -> ImportJob:
+    job = ImportJob(id=uuid4().hex, user_id=user_id, filename=filename, spool_path=spool_path,
+                    status="queued", errors=[])
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+def get_job(db: Session, job_id: str) -> Optional[ImportJob]:
+    return db.query(ImportJob).filter(ImportJob.id == job_id).first()
+
+def list_jobs(db: Session, user_id: Optional[int] = None, limit: int = 20) -> List[ImportJob]:
+    query = db.query(ImportJob)
+    if user_id is not None:
+        query = query.filter(ImportJob.user_id == user_id)
+    return query.order_by(ImportJob.created_at.desc()).limit(limit).all()
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: the web process runs threads, which fork does not copy safely
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+def _log_failure(future) -> None:
+    error = future.exception()
+    if error is not None:
+        # A crashed worker leaves its job 'running'; recover_jobs marks it interrupted
+        logger.error("Import worker failed: %s", error)
+
+def submit(job_id: str) -> None:
+    _pool().submit(run_job, job_id).add_done_callback(_log_failure)
+
+def cancel_job(db: Session, job: ImportJob) -> ImportJob:
+    """
+    Cancel a queued job outright; ask a running one to stop after its current
+    chunk. The spool file is kept so the job can be resumed.
+    """
+    if job.status == "queued":
+        db.query(ImportJob)\
+            .filter(ImportJob.id == job.id, ImportJob.status == "queued")\
+            .update({"status": "cancelled"}, synchronize_session=False)
+    elif job.status == "running":
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    return job
+
+def resume_job(db: Session, job: ImportJob) -> ImportJob:
+    """Queue a stopped job again; it continues after last_row. Raises ValueError if it cannot resume."""
+    if job.status not in RESUMABLE_STATUSES:
+        raise ValueError(f"Job is {job.status}, only {', '.join(RESUMABLE_STATUSES)} jobs can be resumed")
+    if not job.spool_path or not os.path.exists(job.spool_path):
+        raise ValueError("Uploaded file is no longer available")
+    job.status = "queued"
+    job.cancel_requested = False
+    job.message = None
+    db.commit()
+    submit(job.id)
+    db.refresh(job)
+    return job
+
+def recover_jobs(db: Session) -> int:
+    """
+    Mark jobs left queued or running by a previous server process as
+    interrupted (resumable). Call once at startup, before any submit.
+    """
+    count = db.query(ImportJob)\
+        .filter(ImportJob.status.in_(ACTIVE_STATUSES))\
+        .update({"status": "interrupted"}, synchronize_session=False)
+    db.commit()
+    return count
+
+def shutdown() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+def run_job(job_id: str) -> None:
+    """Worker entry point (runs in a pool process with its own session)."""
+    db = SessionLocal()
+    try:
+        claimed = db.query(ImportJob)\
+            .filter(ImportJob.id == job_id, ImportJob.status == "queued")\
+            .update({"status": "running"}, synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return  # Cancelled before it started
+        job = get_job(db, job_id)
+        base = {"rows": job.rows, "imported": job.imported, "skipped": job.skipped, "duplicates": job.duplicates}
+        base_errors = list(job.errors or [])
+
+        def progress(stats: Dict[str, Any]) -> None:
+            values = {key: base[key] + stats[key] for key in base}
+            values["errors"] = (base_errors + stats["errors"])[:import_service.MAX_ERRORS]
+            values["last_row"] = stats["last_row"]
+            values["updated_at"] = datetime.now()
+            db.query(ImportJob).filter(ImportJob.id == job_id).update(values, synchronize_session=False)
+
+        def should_stop() -> bool:
+            return bool(db.query(ImportJob.cancel_requested).filter(ImportJob.id == job_id).scalar())
+
+        stats = import_service.import_excel(
+            db, job.spool_path, job.user_id, filename=job.filename,
+            progress=progress, start_after_row=job.last_row, should_stop=should_stop
+        )
+
+        db.expire_all()
+        job = get_job(db, job_id)
+        if stats["stopped"]:
+            job.status = "cancelled"
+        else:
+            job.status = "done"
+            if job.spool_path and os.path.exists(job.spool_path):
+                os.remove(job.spool_path)
+            job.spool_path = None
+        job.cancel_requested = False
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.exception("Import job %s failed", job_id)
+        db.query(ImportJob).filter(ImportJob.id == job_id).update(
+            {"status": "failed", "message": str(e), "updated_at": datetime.now()}, synchronize_session=False
+        )
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,340 @@
+from typing import Dict, Any, Callable, Iterable, Iterator, Optional, Set
+from datetime import datetime
+import hashlib
+import numpy as np
+import pandas as pd
+import openpyxl
+from sqlalchemy.orm import Session
+from src.database.models import Patient, MedicalRecord, Practitioner, ImportFingerprint
+from src.services import pinyin_service, summary_service, storage_service, pattern_stats_service, prescription_service, text_index_service
+
+# Shared clinic-log import pipeline for /api/import/excel and scripts/import_excel.py.
+# Rows are streamed in chunks; each chunk is normalized column-wise, resolves its
+# patients and practitioners with one query each, and is written in one transaction.
+# Every imported row is fingerprinted; rows seen before are skipped with one
+# lookup per chunk, so re-importing an extended log only writes the new rows.
+DEFAULT_CHUNK_SIZE = 1000
+RAW_DATA_COLUMNS = ['现病史', '既往史', '辩证', '治法', '望闻切诊', '方药']
+DEFAULT_TOTAL_DOSAGE = '6付'
+MAX_ERRORS = 100
+
+def iter_excel_chunks(source, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      filename: str = None, start_after_row: int = 0) -> Iterator[pd.DataFrame]:
+    """
+    Yield DataFrames of at most chunk_size rows, indexed by Excel row number.
+    .xlsx is streamed with openpyxl in read-only mode, so memory is bounded by the
+    chunk size; legacy .xls falls back to pandas reading the whole sheet.
+    `source` is a path or a binary file object. Rows up to start_after_row
+    (an Excel row number) are skipped, for resuming an interrupted import.
+    """
+    name = filename or (source if isinstance(source, str) else "")
+    if str(name).lower().endswith(".xls"):
+        df = pd.read_excel(source)
+        df.index = df.index + 2
+        df = df[df.index > start_after_row]
+        for start in range(0, len(df), chunk_size):
+            yield df.iloc[start:start + chunk_size]
+        return
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c).strip() if c is not None else f"_col{i}" for i, c in enumerate(header)]
+        width = len(columns)
+        buffer, row_numbers = [], []
+        for row_number, row in enumerate(rows, start=2):
+            if row_number <= start_after_row:
+                continue
+            if not any(v is not None and v != "" for v in row):
+                continue
+            row = tuple(row[:width]) + (None,) * (width - len(row))
+            buffer.append(row)
+            row_numbers.append(row_number)
+            if len(buffer) >= chunk_size:
+                yield pd.DataFrame(buffer, columns=columns, index=row_numbers)
+                buffer, row_numbers = [], []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns, index=row_numbers)
+    finally:
+        workbook.close()
+
+def _text(df: pd.DataFrame, column: str, strip: bool = True) -> pd.Series:
+    """Cell text of a column, '' for missing cells; whole-number floats lose their '.0'."""
+    if column not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    col = df[column]
+    present = col.notna()
+    if pd.api.types.is_float_dtype(col):
+        whole = present & np.isfinite(col) & (col == np.floor(col))
+    else:
+        whole = col.map(lambda v: isinstance(v, float) and v.is_integer()).astype(bool)
+    text = col.astype(object)
+    if whole.any():
+        text = text.where(~whole, col[whole].map(lambda v: str(int(v))))
+    text = text.astype(str)
+    if strip:
+        text = text.str.strip()
+    return text.where(present, "")
+
+def normalize_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    """Clinic-log columns to import fields, computed column-wise for the whole chunk."""
+    out = pd.DataFrame(index=df.index)
+    out["name"] = _text(df, '患者姓名')
+    out["phone"] = _text(df, '联系电话')
+    out["gender"] = np.where(_text(df, '性别').str.contains('女', regex=False), '女', '男')
+
+    # "45", "45岁", "45周岁"; infants given in months or days count as 0
+    age_text = _text(df, '年龄')
+    age = pd.to_numeric(age_text.str.extract(r"(\d+(?:\.\d+)?)", expand=False), errors="coerce")
+    infant = age_text.str.contains("[月天]") & ~age_text.str.contains("岁", regex=False)
+    out["age"] = np.floor(age.where(~infant, 0)).astype("Int64")
+
+    if '门诊日期' in df.columns:
+        out["visit_date"] = pd.to_datetime(df['门诊日期'], errors="coerce", format="mixed")
+    else:
+        out["visit_date"] = pd.Series(pd.NaT, index=df.index, dtype="datetime64[us]")
+
+    out["doctor"] = _text(df, '医生')
+    out["complaint"] = _text(df, '主诉')
+    out["diagnosis"] = _text(df, '诊断')
+    out["prescription"] = _text(df, '处方')
+    out["note"] = _text(df, '医嘱事项')
+    doses = pd.to_numeric(
+        out["prescription"].str.extract(prescription_service.TOTAL_DOSES_PATTERN, expand=False), errors="coerce"
+    ).astype("Int64")
+    out["total_dosage"] = (doses.astype(str) + '付').where(doses.notna(), DEFAULT_TOTAL_DOSAGE)
+    for column in RAW_DATA_COLUMNS:
+        out["raw:" + column] = _text(df, column, strip=False)
+    out["fingerprint"] = fingerprints(out)
+    return out
+
+def _fingerprint(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+def fingerprints(rows: pd.DataFrame) -> pd.Series:
+    """
+    Row fingerprints from name, phone, visit_date, doctor and complaint columns.
+    Whitespace is ignored, phones keep only digits and visits compare to the
+    second; a row without a date fingerprints with an empty visit.
+    """
+    visit = rows["visit_date"].dt.strftime("%Y-%m-%d %H:%M:%S").fillna("")
+    keys = rows["name"].str.replace(r"\s+", "", regex=True)\
+        .str.cat([
+            rows["phone"].str.replace(r"\D+", "", regex=True),
+            visit,
+            rows["doctor"].str.replace(r"\s+", "", regex=True),
+            rows["complaint"].str.replace(r"\s+", "", regex=True),
+        ], sep="\x1f")
+    return keys.map(_fingerprint).astype("int64")
+
+def known_fingerprints(db: Session, values: Iterable[int]) -> Set[int]:
+    values = [int(v) for v in values]
+    known = set()
+    for i in range(0, len(values), 1000):
+        known.update(fp for (fp,) in db.query(ImportFingerprint.fingerprint)
+                     .filter(ImportFingerprint.fingerprint.in_(values[i:i + 1000])))
+    return known
+
+def write_fingerprints(db: Session, record_fingerprints: Dict[int, int]) -> None:
+    """Store fingerprint per record id (caller commits)."""
+    if record_fingerprints:
+        db.bulk_insert_mappings(ImportFingerprint, [
+            {"fingerprint": int(fp), "record_id": record_id} for record_id, fp in record_fingerprints.items()
+        ])
+
+def delete_fingerprints(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if record_ids:
+        db.query(ImportFingerprint).filter(ImportFingerprint.record_id.in_(record_ids)).delete(synchronize_session=False)
+
+def backfill_fingerprints(db: Session, chunk_size: int = 1000) -> int:
+    """
+    Fingerprint records imported before fingerprints existed, in id-ordered
+    chunks, from the stored patient_info, visit date, practitioner and complaint.
+    Records that already have a fingerprint, or whose fingerprint another
+    record holds, are left alone. Returns the number of fingerprints written.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint,
+                        MedicalRecord.data, Practitioner.name)\
+            .outerjoin(Practitioner, Practitioner.id == MedicalRecord.practitioner_id)\
+            .filter(MedicalRecord.id > last_id)\
+            .order_by(MedicalRecord.id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        imported = [r for r in rows if (r.data or {}).get("imported_from_excel")]
+        if not imported:
+            continue
+        have = {rid for (rid,) in db.query(ImportFingerprint.record_id)
+                .filter(ImportFingerprint.record_id.in_([r.id for r in imported]))}
+        imported = [r for r in imported if r.id not in have]
+        if not imported:
+            continue
+        frame = pd.DataFrame({
+            "name": [str((r.data.get("patient_info") or {}).get("name") or "").strip() for r in imported],
+            "phone": [str((r.data.get("patient_info") or {}).get("phone") or "") for r in imported],
+            "visit_date": pd.to_datetime([r.visit_date for r in imported]),
+            "doctor": [r.name or "" for r in imported],
+            "complaint": [r.complaint or "" for r in imported],
+        }, index=[r.id for r in imported])
+        fps = fingerprints(frame)
+        fps = fps[~fps.duplicated() & ~fps.isin(known_fingerprints(db, fps.unique()))]
+        write_fingerprints(db, fps.to_dict())
+        db.commit()
+        total += len(fps)
+    return total
+
+def _resolve_practitioners(db: Session, names, cache: Dict[str, int]) -> None:
+    """Fill cache with ids for the doctor names, creating unknown ones as teachers."""
+    missing = {n for n in names if n and n not in cache}
+    if not missing:
+        return
+    cache.update(db.query(Practitioner.name, Practitioner.id).filter(Practitioner.name.in_(missing)).all())
+    new = [{"name": n, "role": "teacher"} for n in sorted(missing) if n not in cache]
+    if new:
+        db.bulk_insert_mappings(Practitioner, new, return_defaults=True)
+        cache.update({m["name"]: m["id"] for m in new})
+
+def _resolve_patients(db: Session, rows: pd.DataFrame) -> Dict[str, int]:
+    """Patient id per name (existing first, else created from the name's first row in the chunk)."""
+    names = list(rows["name"].unique())
+    patient_ids = {}
+    for i in range(0, len(names), 500):
+        existing = db.query(Patient.name, Patient.id)\
+            .filter(Patient.name.in_(names[i:i + 500]))\
+            .order_by(Patient.id.desc())\
+            .all()
+        patient_ids.update(existing)
+    first_rows = rows[~rows["name"].isin(patient_ids.keys())].drop_duplicates("name")
+    if len(first_rows):
+        new = [
+            {
+                "name": r.name,
+                "phone": r.phone or None,
+                "gender": r.gender,
+                "age": None if pd.isna(r.age) else int(r.age),
+                **pinyin_service.pinyin_fields(r.name),
+            }
+            for r in first_rows.itertuples()
+        ]
+        db.bulk_insert_mappings(Patient, new, return_defaults=True)
+        patient_ids.update({m["name"]: m["id"] for m in new})
+    return patient_ids
+
+def import_chunk(db: Session, df: pd.DataFrame, user_id: int, stats: Dict[str, Any],
+                 practitioner_cache: Dict[str, int], dry_run: bool = False) -> None:
+    """Normalize and write one chunk (caller commits). Updates stats in place."""
+    rows = normalize_chunk(df)
+    stats["rows"] += len(rows)
+    named = rows[rows["name"] != ""]
+    stats["skipped"] += len(rows) - len(named)
+    # Rows imported before, or repeated within this chunk
+    seen = named["fingerprint"].isin(known_fingerprints(db, named["fingerprint"].unique()))\
+        | named["fingerprint"].duplicated()
+    stats["duplicates"] += int(seen.sum())
+    named = named[~seen]
+    if dry_run or named.empty:
+        if dry_run:
+            stats["imported"] += len(named)
+        return
+
+    _resolve_practitioners(db, named["doctor"].unique(), practitioner_cache)
+    patient_ids = _resolve_patients(db, named)
+    now = datetime.now()
+
+    mappings, colds, fps = [], [], []
+    for row_number, r in zip(named.index, named.to_dict("records")):
+        try:
+            age = None if pd.isna(r["age"]) else int(r["age"])
+            record_data = {
+                'patient_info': {
+                    'name': r["name"],
+                    'age': str(age) if age else '',
+                    'gender': r["gender"],
+                    'phone': r["phone"],
+                },
+                'medical_record': {
+                    'complaint': r["complaint"],
+                    'prescription': r["prescription"],
+                    'totalDosage': r["total_dosage"],
+                    'note': r["note"],
+                },
+                'pulse_grid': {},  # Excel logs carry no pulse grid
+                'imported_from_excel': True,
+                'excel_row': int(row_number),
+                'raw_data': {column: r["raw:" + column] for column in RAW_DATA_COLUMNS},
+            }
+            # raw_data is stored compressed in record_payloads
+            hot, cold = storage_service.split_record_data(record_data)
+            visit_date = r["visit_date"].to_pydatetime() if not pd.isna(r["visit_date"]) else now
+            mappings.append(pattern_stats_service.apply_classification({
+                "patient_id": patient_ids[r["name"]],
+                "user_id": user_id,
+                "practitioner_id": practitioner_cache.get(r["doctor"]) if r["doctor"] else None,
+                "visit_date": visit_date,
+                "complaint": r["complaint"],
+                "diagnosis": r["diagnosis"],
+                "data": hot,
+            }))
+            colds.append(cold)
+            fps.append(r["fingerprint"])
+        except Exception as row_err:
+            stats["skipped"] += 1
+            if len(stats["errors"]) < MAX_ERRORS:
+                stats["errors"].append(f"Row {row_number}: {row_err}")
+
+    if mappings:
+        db.bulk_insert_mappings(MedicalRecord, mappings, return_defaults=True)
+        storage_service.store_payloads(db, {m["id"]: cold for m, cold in zip(mappings, colds)})
+        write_fingerprints(db, {m["id"]: fp for m, fp in zip(mappings, fps)})
+        prescription_service.write_prescription_items_bulk(db, {
+            m["id"]: prescription_service.prescription_texts(m["data"], cold) for m, cold in zip(mappings, colds)
+        })
+        text_index_service.write_complaint_terms_bulk(db, {m["id"]: m["complaint"] for m in mappings})
+        summary_service.refresh_patient_summaries(db, {m["patient_id"] for m in mappings})
+        pattern_stats_service.refresh_pattern_rollups(db, {
+            (m["practitioner_id"], pattern_stats_service.month_of(m["visit_date"])) for m in mappings
+        })
+    stats["imported"] += len(mappings)
+
+def import_excel(db: Session, source, user_id: int, filename: str = None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE, dry_run: bool = False,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 start_after_row: int = 0,
+                 should_stop: Optional[Callable[[], bool]] = None) -> Dict[str, Any]:
+    """
+    Import a clinic-log workbook chunk by chunk. Each chunk is committed on its
+    own, so a failure keeps the chunks before it; the exception is re-raised
+    after rolling back the failing chunk. Returns rows / imported / skipped /
+    duplicates (rows imported before) / errors (first MAX_ERRORS row errors) /
+    last_row (Excel row number of the last committed chunk) / stopped.
+
+    `progress` is called after every chunk inside its transaction, so anything
+    it writes commits atomically with the chunk. `should_stop` is checked
+    before every chunk; returning True ends the import early (stopped=True).
+    """
+    stats: Dict[str, Any] = {"rows": 0, "imported": 0, "skipped": 0, "duplicates": 0, "errors": [],
+                             "last_row": start_after_row, "stopped": False}
+    practitioner_cache: Dict[str, int] = {}
+    try:
+        for df in iter_excel_chunks(source, chunk_size, filename, start_after_row):
+            if should_stop and should_stop():
+                stats["stopped"] = True
+                break
+            import_chunk(db, df, user_id, stats, practitioner_cache, dry_run)
+            stats["last_row"] = int(df.index[-1])
+            if progress:
+                progress(stats)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return stats
@@ -0,0 +1,69 @@
+from typing import Dict, Iterable, List
+from collections import deque
+from functools import lru_cache
+
+class KeywordAutomaton:
+    """
+    Aho–Corasick multi-pattern matcher.
+    Compiled once from a keyword list; scan() reads a text in a single pass and
+    returns a bitmask with bit i set when keyword i occurs anywhere in the text
+    (overlapping matches included, e.g. "无根" also sets "无").
+    """
+
+    def __init__(self, keywords: Iterable[str], cache_size: int = 4096):
+        self.keywords: List[str] = []
+        self.bits: Dict[str, int] = {}
+        for kw in keywords:
+            if kw and kw not in self.bits:
+                self.bits[kw] = 1 << len(self.keywords)
+                self.keywords.append(kw)
+
+        # Trie
+        self._goto: List[Dict[str, int]] = [{}]
+        self._out: List[int] = [0]
+        for kw in self.keywords:
+            state = 0
+            for ch in kw:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._out.append(0)
+                state = nxt
+            self._out[state] |= self.bits[kw]
+
+        # Failure links (BFS); outputs are merged along them
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                fail_state = self._goto[f].get(ch, 0)
+                self._fail[nxt] = fail_state if fail_state != nxt else 0
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+        # Cell texts repeat heavily across records, so scans are memoized
+        self.scan = lru_cache(maxsize=cache_size)(self._scan)
+
+    def _scan(self, text: str) -> int:
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        mask = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            mask |= out[state]
+        return mask
+
+    def mask(self, keywords: Iterable[str]) -> int:
+        """Bitmask of a keyword group; every keyword must have been compiled in."""
+        m = 0
+        for kw in keywords:
+            m |= self.bits[kw]
+        return m
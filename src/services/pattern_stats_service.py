@@ -0,0 +1,194 @@
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from collections import Counter
+from datetime import datetime
+import logging
+from sqlalchemy.orm import Session
+from sqlalchemy import func, update, bindparam
+from src.database.models import MedicalRecord, PatternRollup, Practitioner
+from src.services import analysis_service
+
+logger = logging.getLogger(__name__)
+
+RollupKey = Tuple[Optional[int], str]  # (practitioner_id, "YYYY-MM")
+
+GROUP_FIELDS = ("practitioner", "month", "pattern")
+
+def classify(record_data: Dict[str, Any]) -> Tuple[Optional[str], Optional[int]]:
+    """Pattern name and feature bitmask for stored record data; (None, None) if it cannot be analyzed."""
+    try:
+        result = analysis_service.analyze_pulse_data_full(record_data or {})
+    except (AttributeError, TypeError) as e:
+        logger.warning(f"Could not classify record data: {e}")
+        return None, None
+    return result["pattern"], result["features"]
+
+def apply_classification(values: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill analysis_pattern / analysis_features into a MedicalRecord mapping from its data."""
+    values["analysis_pattern"], values["analysis_features"] = classify(values.get("data"))
+    return values
+
+def classify_record(record: MedicalRecord) -> None:
+    record.analysis_pattern, record.analysis_features = classify(record.data)
+
+def month_of(visit_date: Optional[datetime]) -> Optional[str]:
+    return visit_date.strftime("%Y-%m") if visit_date else None
+
+def _month_range(month: str) -> Tuple[datetime, datetime]:
+    start = datetime.strptime(month, "%Y-%m")
+    end = datetime(start.year + 1, 1, 1) if start.month == 12 else datetime(start.year, start.month + 1, 1)
+    return start, end
+
+def _eq(column, value):
+    return column.is_(None) if value is None else column == value
+
+def rollup_keys(db: Session, record_ids: Iterable[int]) -> Set[RollupKey]:
+    """(practitioner, month) rollup keys the given records currently count towards."""
+    record_ids = [rid for rid in set(record_ids) if rid is not None]
+    if not record_ids:
+        return set()
+    rows = db.query(MedicalRecord.practitioner_id, MedicalRecord.visit_date)\
+        .filter(MedicalRecord.id.in_(record_ids))\
+        .all()
+    return {(pid, month_of(visit_date)) for pid, visit_date in rows if visit_date}
+
+def refresh_pattern_rollups(db: Session, keys: Iterable[RollupKey]) -> None:
+    """
+    Recount the rollup rows of the given (practitioner, month) keys from
+    medical_records. Each recount is one grouped query over the
+    (practitioner_id, visit_date) index; runs in the caller's transaction.
+    Callers pass the keys a write touched, before and after the change.
+    """
+    keys = {k for k in keys if k[1]}
+    if not keys:
+        return
+    db.flush()
+    now = datetime.now()
+    rows = []
+    for practitioner_id, month in keys:
+        start, end = _month_range(month)
+        counts = db.query(MedicalRecord.analysis_pattern, func.count(MedicalRecord.id))\
+            .filter(
+                _eq(MedicalRecord.practitioner_id, practitioner_id),
+                MedicalRecord.visit_date >= start,
+                MedicalRecord.visit_date < end,
+            )\
+            .group_by(MedicalRecord.analysis_pattern)\
+            .all()
+        db.query(PatternRollup)\
+            .filter(_eq(PatternRollup.practitioner_id, practitioner_id), PatternRollup.month == month)\
+            .delete(synchronize_session=False)
+        rows.extend(
+            {"practitioner_id": practitioner_id, "month": month, "pattern": pattern,
+             "record_count": count, "updated_at": now}
+            for pattern, count in counts
+        )
+    if rows:
+        db.bulk_insert_mappings(PatternRollup, rows)
+
+def rebuild_pattern_rollups(db: Session) -> int:
+    """Rebuild every rollup row with one streaming pass over medical_records. Returns the row count."""
+    counter: Counter = Counter()
+    query = db.query(MedicalRecord.practitioner_id, MedicalRecord.visit_date, MedicalRecord.analysis_pattern)\
+        .execution_options(yield_per=5000)
+    for practitioner_id, visit_date, pattern in query:
+        if visit_date:
+            counter[(practitioner_id, month_of(visit_date), pattern)] += 1
+
+    db.query(PatternRollup).delete(synchronize_session=False)
+    now = datetime.now()
+    db.bulk_insert_mappings(PatternRollup, [
+        {"practitioner_id": pid, "month": month, "pattern": pattern, "record_count": count, "updated_at": now}
+        for (pid, month, pattern), count in counter.items()
+    ])
+    db.commit()
+    return len(counter)
+
+def update_record_patterns(db: Session, patterns: Dict[int, Tuple[Optional[str], Optional[int]]]) -> None:
+    """
+    Write recomputed (pattern, features) onto medical_records without touching
+    updated_at, so re-classification is not treated as a user edit by sync.
+    """
+    if not patterns:
+        return
+    table = MedicalRecord.__table__
+    stmt = update(table)\
+        .where(table.c.id == bindparam("b_id"))\
+        .values(
+            analysis_pattern=bindparam("b_pattern"),
+            analysis_features=bindparam("b_features"),
+            updated_at=table.c.updated_at,
+        )
+    db.execute(stmt, [
+        {"b_id": rid, "b_pattern": pattern, "b_features": features}
+        for rid, (pattern, features) in patterns.items()
+    ])
+
+def backfill_record_patterns(db: Session, chunk_size: int = 500, force: bool = False, progress=None) -> int:
+    """
+    Classify records that have no stored pattern yet (all records with force),
+    keyset-paginated by id, one transaction per chunk. Returns the number classified.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        query = db.query(MedicalRecord.id, MedicalRecord.data).filter(MedicalRecord.id > last_id)
+        if not force:
+            query = query.filter(MedicalRecord.analysis_pattern.is_(None))
+        rows = query.order_by(MedicalRecord.id).limit(chunk_size).all()
+        if not rows:
+            return total
+        update_record_patterns(db, {rid: classify(data) for rid, data in rows})
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+        if progress:
+            progress(total)
+
+def get_pattern_stats(db: Session, group_by: Iterable[str] = GROUP_FIELDS,
+                      practitioner_id: Optional[int] = None, practitioner_name: Optional[str] = None,
+                      pattern: Optional[str] = None, start_month: Optional[str] = None,
+                      end_month: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Grouped record counts by any of practitioner / month / pattern, read from
+    pattern_rollups (one row per practitioner, month and pattern) instead of
+    scanning medical_records. Months are inclusive 'YYYY-MM' bounds.
+    """
+    group_by = list(group_by)
+    unknown = [g for g in group_by if g not in GROUP_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown group_by fields: {', '.join(unknown)}")
+    group_by = [g for g in GROUP_FIELDS if g in group_by]
+    for value in (start_month, end_month):
+        if value:
+            _month_range(value)  # validates the format
+
+    columns = []
+    if "practitioner" in group_by:
+        columns += [PatternRollup.practitioner_id, Practitioner.name.label("practitioner_name")]
+    if "month" in group_by:
+        columns.append(PatternRollup.month)
+    if "pattern" in group_by:
+        columns.append(PatternRollup.pattern)
+    total = func.sum(PatternRollup.record_count).label("count")
+
+    query = db.query(*columns, total)
+    if "practitioner" in group_by or practitioner_name:
+        query = query.select_from(PatternRollup)\
+            .outerjoin(Practitioner, Practitioner.id == PatternRollup.practitioner_id)
+    if practitioner_id is not None:
+        query = query.filter(PatternRollup.practitioner_id == practitioner_id)
+    if practitioner_name:
+        query = query.filter(Practitioner.name == practitioner_name)
+    if pattern:
+        query = query.filter(PatternRollup.pattern == pattern)
+    if start_month:
+        query = query.filter(PatternRollup.month >= start_month)
+    if end_month:
+        query = query.filter(PatternRollup.month <= end_month)
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+
+    return [
+        {**{key: getattr(row, key) for key in row._fields if key != "count"}, "count": int(row.count or 0)}
+        for row in query.all()
+    ]
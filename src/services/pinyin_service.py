@@ -0,0 +1,63 @@
+from typing import Dict, Optional, Tuple
+from functools import lru_cache
+from sqlalchemy.orm import Session
+from sqlalchemy import bindparam, or_
+from pypinyin import lazy_pinyin, Style
+from src.database.models import Patient
+
+# Patient name -> pinyin for search, spelled by pypinyin over the whole name
+# so its phrase dictionary picks the reading of polyphonic characters
+# (王长生 -> wcs, not wzs). Whole names are memoized: clinics see the same
+# names again and again, and bulk imports repeat them within a file.
+#   pinyin:      initials as before, e.g. 张三 -> "zs" (substring search)
+#   pinyin_full: lower-case full spelling, e.g. 张三 -> "zhangsan" (prefix search)
+
+@lru_cache(maxsize=65536)
+def _spell(name: str) -> Tuple[str, str]:
+    """(initials, full spelling) of a name with whitespace removed."""
+    return "".join(lazy_pinyin(name, style=Style.FIRST_LETTER)), "".join(lazy_pinyin(name)).lower()
+
+def pinyin_fields(name: Optional[str]) -> Dict[str, Optional[str]]:
+    """pinyin / pinyin_full column values for a patient name (whitespace ignored)."""
+    if not name:
+        return {"pinyin": None, "pinyin_full": None}
+    initials, full = _spell("".join(name.split()))
+    return {"pinyin": initials, "pinyin_full": full}
+
+def full_prefix_filter(query: str):
+    """Index-friendly prefix match on pinyin_full (a range, so no LIKE collation issues)."""
+    prefix = "".join(query.split()).lower()
+    return (Patient.pinyin_full >= prefix) & (Patient.pinyin_full < prefix + "￿")
+
+def backfill_pinyin(db: Session, chunk_size: int = 5000, force: bool = False, progress=None) -> int:
+    """
+    Fill pinyin / pinyin_full for patients missing either (all patients with
+    force), keyset-paginated by id, one executemany UPDATE and commit per chunk.
+    updated_at and sync_status are left alone: the columns are derived from
+    the name, which every copy already has. Returns the number of patients updated.
+    """
+    table = Patient.__table__
+    statement = table.update()\
+        .where(table.c.id == bindparam("patient_id"))\
+        .values(pinyin=bindparam("new_pinyin"), pinyin_full=bindparam("new_pinyin_full"),
+                updated_at=table.c.updated_at)  # Explicit value suppresses onupdate
+    total = 0
+    last_id = 0
+    while True:
+        query = db.query(Patient.id, Patient.name).filter(Patient.id > last_id)
+        if not force:
+            query = query.filter(or_(Patient.pinyin.is_(None), Patient.pinyin_full.is_(None)))
+        rows = query.order_by(Patient.id).limit(chunk_size).all()
+        if not rows:
+            return total
+        params = []
+        for patient_id, name in rows:
+            fields = pinyin_fields(name)
+            params.append({"patient_id": patient_id, "new_pinyin": fields["pinyin"],
+                           "new_pinyin_full": fields["pinyin_full"]})
+        db.execute(statement, params)
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+        if progress:
+            progress(total)
@@ -0,0 +1,115 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import zlib
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from src.database.models import PrescriptionSignature, PrescriptionLshBucket
+
+# MinHash over the herb set of a prescription, banded for LSH:
+# 64 permutations in 16 bands of 4 rows puts the 50% bucket-collision point
+# at a Jaccard similarity of about (1/16) ** (1/4) = 0.5.
+# The constants below are baked into stored signatures and buckets; changing
+# them requires re-running scripts/backfill_prescription_items.py.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240117)
+_A = _rng.randint(1, _PRIME, size=NUM_PERM).astype(np.int64)
+_B = _rng.randint(0, _PRIME, size=NUM_PERM).astype(np.int64)
+
+def compute_signature(herbs: Iterable[str]) -> Optional[np.ndarray]:
+    """MinHash signature (NUM_PERM uint32 values) of a herb set, or None for an empty set."""
+    herbs = set(herbs)
+    if not herbs:
+        return None
+    x = np.fromiter((zlib.crc32(h.encode("utf-8")) & 0x7FFFFFFF for h in herbs), dtype=np.int64, count=len(herbs))
+    return ((_A[:, None] * x[None, :] + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+def band_buckets(signature: np.ndarray) -> List[int]:
+    """One signed 64-bit bucket key per band; the band number is part of the key."""
+    keys = []
+    for band in range(BANDS):
+        chunk = signature[band * ROWS:(band + 1) * ROWS].tobytes()
+        digest = hashlib.blake2b(bytes([band]) + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+def encode_signature(signature: np.ndarray) -> bytes:
+    return signature.astype("<u4").tobytes()
+
+def decode_signature(blob: bytes) -> np.ndarray:
+    return np.frombuffer(blob, dtype="<u4")
+
+def estimate_jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+def write_signatures(db: Session, herb_sets: Dict[int, Set[str]]) -> None:
+    """Replace signatures and LSH buckets of the given records. Runs in the caller's transaction."""
+    if not herb_sets:
+        return
+    delete_signatures(db, herb_sets.keys())
+    signatures = []
+    buckets = []
+    for record_id, herbs in herb_sets.items():
+        signature = compute_signature(herbs)
+        if signature is None:
+            continue
+        signatures.append({
+            "record_id": record_id,
+            "herb_count": len(set(herbs)),
+            "signature": encode_signature(signature),
+        })
+        buckets.extend({"bucket": key, "record_id": record_id} for key in band_buckets(signature))
+    if signatures:
+        db.bulk_insert_mappings(PrescriptionSignature, signatures)
+        db.bulk_insert_mappings(PrescriptionLshBucket, buckets)
+
+def delete_signatures(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+    db.query(PrescriptionLshBucket).filter(PrescriptionLshBucket.record_id.in_(record_ids)).delete(synchronize_session=False)
+    db.query(PrescriptionSignature).filter(PrescriptionSignature.record_id.in_(record_ids)).delete(synchronize_session=False)
+
+def candidate_records(db: Session, signature: np.ndarray, limit: int = 2000,
+                      exclude_record_id: int = None) -> List[Tuple[int, int]]:
+    """(record_id, shared band count) for records sharing an LSH bucket, most shared first."""
+    shared = func.count(PrescriptionLshBucket.bucket)
+    query = db.query(PrescriptionLshBucket.record_id, shared)\
+        .filter(PrescriptionLshBucket.bucket.in_(band_buckets(signature)))
+    if exclude_record_id is not None:
+        query = query.filter(PrescriptionLshBucket.record_id != exclude_record_id)
+    return query.group_by(PrescriptionLshBucket.record_id)\
+        .order_by(shared.desc(), PrescriptionLshBucket.record_id.desc())\
+        .limit(limit)\
+        .all()
+
+def load_signatures(db: Session, record_ids: Iterable[int]) -> Dict[int, np.ndarray]:
+    record_ids = list(record_ids)
+    signatures = {}
+    for i in range(0, len(record_ids), 900):
+        rows = db.query(PrescriptionSignature.record_id, PrescriptionSignature.signature)\
+            .filter(PrescriptionSignature.record_id.in_(record_ids[i:i + 900]))\
+            .all()
+        signatures.update((rid, decode_signature(blob)) for rid, blob in rows)
+    return signatures
+
+def find_similar(db: Session, herbs: Iterable[str], k: int = 20, exclude_record_id: int = None,
+                 max_candidates: int = 2000) -> List[Tuple[int, float]]:
+    """
+    Top-k (record_id, estimated Jaccard) for a herb set. Candidates are records
+    sharing at least one LSH band bucket, read from the bucket index and ranked by
+    the number of shared bands; only the best max_candidates signatures are
+    loaded and compared, so the cost depends on bucket sizes, not table size.
+    """
+    signature = compute_signature(herbs)
+    if signature is None:
+        return []
+    candidates = [rid for rid, _ in candidate_records(db, signature, max_candidates, exclude_record_id)]
+    if not candidates:
+        return []
+    scored = [(rid, estimate_jaccard(signature, sig)) for rid, sig in load_signatures(db, candidates).items()]
+    scored.sort(key=lambda s: (-s[1], -s[0]))
+    return scored[:k]
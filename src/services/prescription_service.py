@@ -0,0 +1,290 @@
+from typing import Dict, Any, List, Iterable, Optional, Set, Tuple
+import re
+from sqlalchemy.orm import Session
+from sqlalchemy import func, distinct
+from src.database.models import MedicalRecord, PrescriptionItem
+from src.services import storage_service, prescription_lsh_service
+
+# Herb dictionary. Names are matched longest-first, so processed forms listed
+# here (炙甘草, 炒白术) stay distinct from the plain herb.
+HERBS = [
+    "附子", "干姜", "生姜", "炮姜", "肉桂", "桂枝", "细辛", "吴茱萸", "花椒", "丁香",
+    "小茴香", "高良姜", "麻黄", "防风", "荆芥", "羌活", "独活", "白芷", "藁本", "苍耳子",
+    "辛夷", "紫苏", "紫苏叶", "香薷", "葛根", "柴胡", "升麻", "薄荷", "牛蒡子", "蝉蜕",
+    "桑叶", "菊花", "蔓荆子", "淡豆豉", "石膏", "知母", "芦根", "天花粉", "栀子", "夏枯草",
+    "黄芩", "黄连", "黄柏", "龙胆草", "苦参", "金银花", "连翘", "蒲公英", "板蓝根", "大青叶",
+    "生地黄", "玄参", "牡丹皮", "赤芍", "紫草", "青蒿", "地骨皮", "大黄", "芒硝", "火麻仁",
+    "郁李仁", "秦艽", "木瓜", "威灵仙", "桑寄生", "五加皮", "狗脊", "藿香", "佩兰",
+    "苍术", "厚朴", "砂仁", "白豆蔻", "草豆蔻", "草果", "茯苓", "猪苓", "泽泻", "薏苡仁",
+    "车前子", "滑石", "木通", "通草", "萆薢", "茵陈", "金钱草", "虎杖", "陈皮", "青皮",
+    "枳实", "枳壳", "木香", "香附", "乌药", "沉香", "川楝子", "薤白", "佛手", "山楂",
+    "神曲", "麦芽", "谷芽", "莱菔子", "鸡内金", "三七", "白及", "仙鹤草", "艾叶", "川芎",
+    "延胡索", "郁金", "姜黄", "乳香", "没药", "丹参", "红花", "桃仁", "益母草", "牛膝",
+    "鸡血藤", "王不留行", "土鳖虫", "水蛭", "莪术", "三棱", "半夏", "法半夏", "姜半夏", "天南星",
+    "白附子", "白芥子", "旋覆花", "白前", "川贝母", "浙贝母", "瓜蒌", "竹茹", "桔梗", "杏仁",
+    "苦杏仁", "紫苏子", "百部", "紫菀", "款冬花", "桑白皮", "葶苈子", "枇杷叶", "朱砂", "磁石",
+    "龙骨", "牡蛎", "酸枣仁", "柏子仁", "远志", "合欢皮", "夜交藤", "石决明", "珍珠母", "代赭石",
+    "天麻", "钩藤", "地龙", "全蝎", "蜈蚣", "僵蚕", "石菖蒲", "人参", "党参", "太子参",
+    "西洋参", "黄芪", "白术", "山药", "甘草", "炙甘草", "大枣", "蜂蜜", "鹿茸", "淫羊藿",
+    "巴戟天", "仙茅", "杜仲", "续断", "肉苁蓉", "锁阳", "补骨脂", "益智仁", "菟丝子", "沙苑子",
+    "蛤蚧", "冬虫夏草", "当归", "熟地黄", "白芍", "阿胶", "何首乌", "龙眼肉", "北沙参", "南沙参",
+    "百合", "麦冬", "天冬", "石斛", "玉竹", "黄精", "枸杞子", "女贞子", "墨旱莲", "龟甲",
+    "鳖甲", "五味子", "乌梅", "山茱萸", "覆盆子", "桑螵蛸", "金樱子", "芡实", "莲子", "浮小麦",
+    "麻黄根", "诃子", "肉豆蔻", "赤石脂", "葱白", "炒白术", "焦三仙", "茯神", "桂圆", "黄芪皮",
+    "前胡", "钟乳石",
+]
+
+# Alternative or non-standard names mapped to the dictionary herb they are indexed under
+HERB_ALIASES = {
+    "附片": "附子", "制附子": "附子", "黑顺片": "附子", "白附片": "附子", "淡附片": "附子", "炮附子": "附子",
+    "仙灵脾": "淫羊藿", "仙林脾": "淫羊藿",
+    "生地": "生地黄", "熟地": "熟地黄", "丹皮": "牡丹皮", "元胡": "延胡索", "玄胡": "延胡索",
+    "银花": "金银花", "二花": "金银花", "苡仁": "薏苡仁", "生苡仁": "薏苡仁", "薏米": "薏苡仁",
+    "白蔻": "白豆蔻", "白蔻仁": "白豆蔻", "蔻仁": "白豆蔻", "苏叶": "紫苏叶", "苏子": "紫苏子",
+    "首乌": "何首乌", "首乌藤": "夜交藤", "枣仁": "酸枣仁", "杞子": "枸杞子",
+    "枸杞": "枸杞子", "山萸肉": "山茱萸", "萸肉": "山茱萸", "怀牛膝": "牛膝", "川牛膝": "牛膝",
+    "淮山": "山药", "怀山药": "山药", "云苓": "茯苓", "茯苓皮": "茯苓",
+    "川贝": "川贝母", "浙贝": "浙贝母", "瓜蒌皮": "瓜蒌", "全瓜蒌": "瓜蒌", "桂心": "肉桂",
+    "官桂": "肉桂", "炙黄芪": "黄芪", "生黄芪": "黄芪", "法夏": "法半夏", "姜夏": "姜半夏",
+    "菖蒲": "石菖蒲", "六神曲": "神曲", "炒麦芽": "麦芽", "生麦芽": "麦芽",
+}
+
+# Processing prefixes that may precede a dictionary herb (炒莱菔子 -> 莱菔子)
+PROCESSING_PREFIXES = "炒焦生制酒盐蜜醋煅炙姜"
+
+UNITS = ["g", "G", "克", "kg", "mg", "钱", "两", "分", "片", "枚", "个", "只", "条", "ml", "毫升", "粒", "根", "寸"]
+_DOSE_RE = re.compile(r"\s*(\d+(?:\.\d+)?)\s*(" + "|".join(sorted(map(re.escape, UNITS), key=len, reverse=True)) + r")?")
+# Undictionaried "name + weight/count" tokens, e.g. 鹿角霜10g; other numbers
+# ("饭后30分钟", "每日1剂") are instructions, not herbs
+_UNKNOWN_RE = re.compile(r"[一-鿿]{2,5}(?=\s*\d+(?:\.\d+)?\s*(?:g|G|克|片|枚|个))")
+_NON_HERB_CHARS = set("共剂付服煎日次每饭前后分钟温时")
+# Formula names ("麻黄汤加减", "附子理中丸"): herbs in the name are not items
+# unless a dose is attached
+_FORMULA_RE = re.compile(r"[一-鿿]*?(?:汤|散|丸|饮(?!片)|加减)")
+# Total number of doses, "共6剂" / "共12付"; also applied column-wise by import_service
+TOTAL_DOSES_PATTERN = r"共\s*(\d+)\s*[剂付]"
+_TOTAL_DOSES_RE = re.compile(TOTAL_DOSES_PATTERN)
+
+def _build_trie(names: Iterable[str]) -> Dict[str, Any]:
+    root: Dict[str, Any] = {}
+    for name in names:
+        node = root
+        for ch in name:
+            node = node.setdefault(ch, {})
+        node[""] = name
+    return root
+
+_TRIE = _build_trie(list(HERBS) + list(HERB_ALIASES.keys()))
+
+def _match(text: str, start: int) -> Optional[str]:
+    """Longest dictionary name starting at text[start], or None."""
+    node = _TRIE
+    found = None
+    for i in range(start, len(text)):
+        node = node.get(text[i])
+        if node is None:
+            break
+        if "" in node:
+            found = node[""]
+    return found
+
+def canonical_herb(name: str) -> str:
+    return HERB_ALIASES.get(name, name)
+
+def _parse_dose(text: str, pos: int) -> Tuple[Optional[float], Optional[str], int]:
+    m = _DOSE_RE.match(text, pos)
+    if not m:
+        return None, None, pos
+    raw = m.group(1)
+    # "05g" in hand-typed prescriptions means 0.5g
+    if len(raw) > 1 and raw.startswith("0") and "." not in raw:
+        raw = "0." + raw[1:]
+    unit = m.group(2)
+    if unit in ("G", "克"):
+        unit = "g"
+    return float(raw), unit, m.end()
+
+def parse_prescription(text: str) -> List[Dict[str, Any]]:
+    """
+    Extract (herb, dose, unit) items from free-text prescription, e.g.
+    "山药1g 炙甘草1g 附片0.5g" -> 山药 1.0 g, 炙甘草 1.0 g, 附子 (附片) 0.5 g.
+    Dictionary names are found with a longest-match trie scan, so herbs need not be
+    separated ("附子干姜"); unknown "name + number" tokens are kept as written.
+    Herbs that only appear in a formula name ("麻黄汤加减") are skipped.
+    """
+    items = []
+    if not text:
+        return items
+    i = 0
+    n = len(text)
+    while i < n:
+        start = i
+        name = _match(text, i)
+        if name is None and text[i] in PROCESSING_PREFIXES and i + 1 < n:
+            name = _match(text, i + 1)
+            if name is not None:
+                start = i + 1
+        if name is None:
+            m = _UNKNOWN_RE.match(text, i)
+            at_token_start = i == 0 or not ("一" <= text[i - 1] <= "鿿")
+            if m and at_token_start and not (set(m.group(0)) & _NON_HERB_CHARS) \
+                    and not any(_match(text, j) for j in range(m.start(), m.end())):
+                name = m.group(0)
+            else:
+                i += 1
+                continue
+        end = start + len(name)
+        dose, unit, end = _parse_dose(text, end)
+        if dose is None:
+            formula = _FORMULA_RE.match(text, end)
+            if formula:
+                i = formula.end()
+                continue
+        items.append({
+            "herb": canonical_herb(name),
+            "raw_name": text[i:start + len(name)],
+            "dose": dose,
+            "unit": unit,
+        })
+        i = end
+    return items
+
+def parse_total_doses(text: str) -> Optional[int]:
+    """Number of doses from "共N剂" / "共N付", or None."""
+    m = _TOTAL_DOSES_RE.search(text or "")
+    return int(m.group(1)) if m else None
+
+def prescription_texts(record_data: Dict[str, Any], cold_data: Dict[str, Any] = None) -> List[Tuple[str, str]]:
+    """(source, text) pairs: medical_record.prescription plus 方药 from imported raw_data."""
+    texts = []
+    prescription = ((record_data or {}).get("medical_record") or {}).get("prescription")
+    if isinstance(prescription, str) and prescription.strip():
+        texts.append(("prescription", prescription))
+    raw_data = (cold_data or {}).get("raw_data") or (record_data or {}).get("raw_data") or {}
+    fangyao = raw_data.get("方药") if isinstance(raw_data, dict) else None
+    if isinstance(fangyao, str) and fangyao.strip():
+        texts.append(("raw_data", fangyao))
+    return texts
+
+def write_prescription_items(db: Session, record_id: int, record_data: Dict[str, Any], cold_data: Dict[str, Any] = None) -> None:
+    """Replace the parsed prescription items of one record. Runs in the caller's transaction."""
+    write_prescription_items_bulk(db, {record_id: prescription_texts(record_data, cold_data)})
+
+def write_prescription_items_bulk(db: Session, texts: Dict[int, List[Tuple[str, str]]]) -> None:
+    """
+    Replace the parsed items (and MinHash signatures) of many records;
+    texts maps record id -> prescription_texts().
+    """
+    if not texts:
+        return
+    delete_prescription_items(db, texts.keys())
+    rows = []
+    herb_sets = {}
+    for record_id, sources in texts.items():
+        position = 0
+        herbs = herb_sets[record_id] = set()
+        for source, text in sources:
+            for item in parse_prescription(text):
+                rows.append(dict(item, record_id=record_id, position=position, source=source))
+                herbs.add(item["herb"])
+                position += 1
+    if rows:
+        db.bulk_insert_mappings(PrescriptionItem, rows)
+    prescription_lsh_service.write_signatures(db, herb_sets)
+
+def delete_prescription_items(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if record_ids:
+        db.query(PrescriptionItem).filter(PrescriptionItem.record_id.in_(record_ids)).delete(synchronize_session=False)
+        prescription_lsh_service.delete_signatures(db, record_ids)
+
+def backfill_prescription_items(db: Session, chunk_size: int = 500) -> int:
+    """Rebuild prescription_items from stored records and payloads in id-ordered chunks."""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.data)\
+            .filter(MedicalRecord.id > last_id)\
+            .order_by(MedicalRecord.id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        payloads = storage_service.load_payloads(db, [rid for rid, _ in rows])
+        write_prescription_items_bulk(db, {
+            rid: prescription_texts(data, payloads.get(rid)) for rid, data in rows
+        })
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+    return total
+
+def record_herbs(db: Session, record_id: int) -> Set[str]:
+    """Herb set of one stored record."""
+    return {herb for (herb,) in db.query(PrescriptionItem.herb).filter(PrescriptionItem.record_id == record_id).all()}
+
+def _posting_list(db: Session, herb: str) -> List[int]:
+    """Sorted record ids containing herb, read from the (herb, record_id) index."""
+    return [rid for (rid,) in db.query(PrescriptionItem.record_id)
+            .filter(PrescriptionItem.herb == herb)
+            .distinct()
+            .order_by(PrescriptionItem.record_id)
+            .all()]
+
+def _intersect(a: List[int], b: List[int]) -> List[int]:
+    """Merge intersection of two sorted id lists."""
+    out = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        if a[i] == b[j]:
+            out.append(a[i])
+            i += 1
+            j += 1
+        elif a[i] < b[j]:
+            i += 1
+        else:
+            j += 1
+    return out
+
+def find_record_ids_by_herbs(db: Session, include: List[str], exclude: List[str] = None, limit: int = 200) -> List[int]:
+    """
+    Records whose prescription contains ALL herbs in include and NONE in exclude,
+    e.g. include=[附子, 干姜], exclude=[石膏]. Posting lists are intersected
+    smallest-first, so a rare herb bounds the work; exclusions are subtracted last.
+    """
+    include = [canonical_herb(h.strip()) for h in include or [] if h and h.strip()]
+    exclude = [canonical_herb(h.strip()) for h in exclude or [] if h and h.strip()]
+    if not include:
+        raise ValueError("At least one herb to include is required")
+
+    sizes = dict(
+        db.query(PrescriptionItem.herb, func.count(distinct(PrescriptionItem.record_id)))
+        .filter(PrescriptionItem.herb.in_(include))
+        .group_by(PrescriptionItem.herb)
+        .all()
+    )
+    if len(sizes) < len(set(include)):
+        return []
+
+    result = None
+    for herb in sorted(set(include), key=lambda h: sizes[h]):
+        postings = _posting_list(db, herb)
+        result = postings if result is None else _intersect(result, postings)
+        if not result:
+            return []
+    if exclude:
+        excluded = set()
+        for herb in set(exclude):
+            excluded.update(_posting_list(db, herb))
+        result = [rid for rid in result if rid not in excluded]
+    return sorted(result, reverse=True)[:limit]
+
+def count_by_herb(db: Session, limit: int = 50) -> List[Dict[str, Any]]:
+    """Most frequently prescribed herbs by number of records."""
+    records = func.count(distinct(PrescriptionItem.record_id))
+    rows = db.query(PrescriptionItem.herb, records)\
+        .group_by(PrescriptionItem.herb)\
+        .order_by(records.desc(), PrescriptionItem.herb)\
+        .limit(limit)\
+        .all()
+    return [{"herb": herb, "records": count} for herb, count in rows]
@@ -0,0 +1,458 @@
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from functools import lru_cache
+import json
+import os
+import shutil
+import threading
+import zlib
+import numpy as np
+from sqlalchemy.orm import Session
+from sqlalchemy import func, update
+from src.database.models import MedicalRecord, PulseEmbedding, SequenceCounter
+from src.services.pulse_index_service import HANDS, POSITIONS, LEVELS, PULSE_TERMS, grid_cells, tokenize_pulse_text
+
+# Pulse grid embedding: every cell text ("浮大中空") becomes a BLOCK_DIM vector of
+# signed hashed features (characters, character bigrams and recognised pulse
+# terms), placed in its hand/position/level block of an 18-block record vector.
+# Similar wording in the same cell gives high cosine similarity without exact
+# string equality. BLOCK_DIM and the feature hashing are baked into stored
+# vectors; changing them requires scripts/build_pulse_ann.py --reembed.
+BLOCK_DIM = 16
+BLOCKS = [(hand, pos, level) for hand in HANDS for pos in POSITIONS for level in LEVELS]
+BLOCK_INDEX = {block: i for i, block in enumerate(BLOCKS)}
+DIM = len(BLOCKS) * BLOCK_DIM
+TERM_WEIGHT = 2.0
+
+# On-disk signature file (see below), published in generations by swapping a
+# manifest. Records written after the current generation are scanned from the
+# pulse_embeddings table until the next build or append.
+INDEX_DIR = os.getenv("PULSE_ANN_DIR", "pulse_ann")
+NPROBE = int(os.getenv("PULSE_ANN_NPROBE", "16"))
+MANIFEST = "manifest.json"
+MAX_SEGMENTS = 8
+COMPACT_RATIO = 0.2
+KMEANS_ITERATIONS = 10
+KMEANS_SAMPLE_PER_LIST = 64
+
+def _add_feature(vec: np.ndarray, feature: str, weight: float) -> None:
+    h = zlib.crc32(feature.encode("utf-8"))
+    vec[h % BLOCK_DIM] += weight if (h >> 16) & 1 else -weight
+
+@lru_cache(maxsize=65536)
+def _cell_vector(text: str) -> np.ndarray:
+    """Unit-length hashed feature vector of one cell text (read-only, cached)."""
+    vec = np.zeros(BLOCK_DIM, dtype=np.float32)
+    chars = [c for c in text if not c.isspace()]
+    for c in chars:
+        _add_feature(vec, "c:" + c, 1.0)
+    for a, b in zip(chars, chars[1:]):
+        _add_feature(vec, "b:" + a + b, 1.0)
+    for term_id in tokenize_pulse_text(text):
+        _add_feature(vec, "t:" + PULSE_TERMS[term_id - 1], TERM_WEIGHT)
+    norm = np.linalg.norm(vec)
+    if norm:
+        vec /= norm
+    vec.flags.writeable = False
+    return vec
+
+def embed_grid(pulse_grid: Dict[str, Any], mirror_single_hand: bool = False) -> Optional[np.ndarray]:
+    """
+    Unit-length DIM vector of a grid, or None when it has no cells. Legacy
+    unprefixed cells fill both hands. With mirror_single_hand a one-handed grid
+    (a query) is copied to both hands, matching the exact search, which compares
+    a single hand against either hand of a candidate.
+    """
+    cells = grid_cells(pulse_grid or {})
+    if not cells:
+        return None
+    hands = {hand for hand, _, _, _ in cells if hand}
+    mirror = mirror_single_hand and len(hands) == 1
+    vec = np.zeros(DIM, dtype=np.float32)
+    for hand, pos, level, text in cells:
+        for h in (HANDS if hand is None or mirror else [hand]):
+            start = BLOCK_INDEX[(h, pos, level)] * BLOCK_DIM
+            vec[start:start + BLOCK_DIM] += _cell_vector(text)
+    norm = np.linalg.norm(vec)
+    if not norm:
+        return None
+    return vec / norm
+
+def quantize(vec: np.ndarray) -> Tuple[np.ndarray, float]:
+    """Symmetric int8 quantization with one scale per vector."""
+    scale = float(np.abs(vec).max()) / 127.0 or 1.0
+    return np.round(vec / scale).astype(np.int8), scale
+
+def matching_cells(query_grid: Dict[str, Any], candidate_grid: Dict[str, Any], threshold: float = 0.7) -> List[str]:
+    """Grid keys (hand-position-level) whose cell vectors are at least `threshold` similar."""
+    q = embed_grid(query_grid, mirror_single_hand=True)
+    c = embed_grid(candidate_grid)
+    if q is None or c is None:
+        return []
+    q = q.reshape(len(BLOCKS), BLOCK_DIM)
+    c = c.reshape(len(BLOCKS), BLOCK_DIM)
+    norms = np.linalg.norm(q, axis=1) * np.linalg.norm(c, axis=1)
+    sims = np.einsum("ij,ij->i", q, c) / np.where(norms > 0, norms, 1.0)
+    return [f"{hand}-{pos}-{level}" for (hand, pos, level), s, n in zip(BLOCKS, sims, norms) if n > 0 and s >= threshold]
+
+# --- pulse_embeddings table (maintained at every write path) ----------------
+
+SEQ_COUNTER = "pulse_embeddings"
+
+def _next_seq(db: Session) -> int:
+    """
+    Next seq from the sequence_counters row. Seqs never repeat, even when the
+    newest rows are replaced or deleted, so a rewritten row always lands above
+    the built_through of any generation that holds its old version.
+    """
+    # The UPDATE takes the write lock first, so on SQLite seqs follow commit order
+    # and no row can commit below a generation's built_through after it was read.
+    seq = db.execute(
+        update(SequenceCounter).where(SequenceCounter.name == SEQ_COUNTER)
+        .values(value=SequenceCounter.value + 1).returning(SequenceCounter.value)
+    ).scalar()
+    if seq is None:
+        # First write since the counter was added: continue above every seq handed out so far
+        manifest = _read_manifest(INDEX_DIR) or {}
+        seq = max(db.query(func.max(PulseEmbedding.seq)).scalar() or 0, manifest.get("built_through", 0)) + 1
+        db.add(SequenceCounter(name=SEQ_COUNTER, value=seq))
+        db.flush()
+    return seq
+
+def write_embeddings(db: Session, grids: Dict[int, Dict[str, Any]]) -> None:
+    """Replace the embeddings of the given records. Runs in the caller's transaction."""
+    if not grids:
+        return
+    seq = _next_seq(db)
+    delete_embeddings(db, grids.keys())
+    rows = []
+    for record_id, pulse_grid in grids.items():
+        vec = embed_grid(pulse_grid)
+        if vec is None:
+            continue
+        q, scale = quantize(vec)
+        rows.append({"record_id": record_id, "seq": seq, "scale": scale, "vector": q.tobytes()})
+    if rows:
+        db.bulk_insert_mappings(PulseEmbedding, rows)
+
+def delete_embeddings(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if record_ids:
+        db.query(PulseEmbedding).filter(PulseEmbedding.record_id.in_(record_ids)).delete(synchronize_session=False)
+
+def backfill_embeddings(db: Session, chunk_size: int = 1000) -> int:
+    """Recompute pulse_embeddings from medical_records.data in id-ordered chunks."""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.data)\
+            .filter(MedicalRecord.id > last_id)\
+            .order_by(MedicalRecord.id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        write_embeddings(db, {rid: (data or {}).get("pulse_grid") or {} for rid, data in rows})
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+    return total
+
+# --- On-disk signature file ------------------------------------------------
+#
+# A generation is described by manifest.json and made of immutable parts: one
+# base part clustered into IVF lists (plus centroids.npy and offsets.npy) and
+# up to MAX_SEGMENTS appended segments. Every part holds one row per record
+# version: ids.npy, seqs.npy, scales.npy and vectors.npy. Workers memory-map the
+# parts read-only, so N workers share one copy in the page cache and start
+# without scanning the database. Appending writes a new segment and swaps the
+# manifest; existing parts are reused as they are.
+
+class SignaturePart:
+    def __init__(self, path: str):
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.seqs = np.load(os.path.join(path, "seqs.npy"), mmap_mode="r")
+        self.scales = np.load(os.path.join(path, "scales.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.size = len(self.ids)
+        self.centroids = None
+        self.offsets = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            self.centroids = np.load(os.path.join(path, "centroids.npy"))
+            self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    def search(self, query: np.ndarray, n: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-n (row numbers, cosine similarities): IVF probe on the base, full scan of a segment."""
+        if not self.size:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if self.centroids is None:
+            ranges = [(0, self.size)]
+        else:
+            nprobe = min(nprobe, len(self.centroids))
+            probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+            ranges = [(self.offsets[lst], self.offsets[lst + 1]) for lst in probes]
+        rows, sims = [], []
+        for start, end in ranges:
+            if end > start:
+                sims.append((self.vectors[start:end].astype(np.float32) @ query) * self.scales[start:end])
+                rows.append(np.arange(start, end))
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate(rows)
+        sims = np.concatenate(sims)
+        if len(sims) > n:
+            top = np.argpartition(-sims, n - 1)[:n]
+            rows, sims = rows[top], sims[top]
+        return rows, sims
+
+class AnnSnapshot:
+    """One published generation: its parts and the highest seq they cover."""
+    def __init__(self, index_dir: str, manifest: Dict[str, Any]):
+        self.generation = manifest["generation"]
+        self.built_through = manifest["built_through"]
+        self.parts = [SignaturePart(os.path.join(index_dir, part)) for part in manifest["parts"]]
+        self.size = sum(part.size for part in self.parts)
+        self.nlist = len(self.parts[0].centroids) if self.parts and self.parts[0].centroids is not None else 0
+
+    def search(self, query: np.ndarray, n: int, nprobe: int = NPROBE) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Approximate top-n (ids, seqs, similarities) over all parts. An updated record
+        can appear once per part; callers keep the row whose seq is current.
+        """
+        ids, seqs, sims = [], [], []
+        for part in self.parts:
+            rows, part_sims = part.search(query, n, nprobe)
+            ids.append(part.ids[rows])
+            seqs.append(part.seqs[rows])
+            sims.append(part_sims)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids, seqs, sims = np.concatenate(ids), np.concatenate(seqs), np.concatenate(sims)
+        if len(sims) > n:
+            top = np.argpartition(-sims, n - 1)[:n]
+            ids, seqs, sims = ids[top], seqs[top], sims[top]
+        return ids, seqs, sims
+
+_snapshots: Dict[str, Tuple[int, Optional[AnnSnapshot]]] = {}
+_snapshot_lock = threading.Lock()
+
+def _read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(os.path.join(index_dir, MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    # Manifests without a parts list predate the segment format; rebuild them
+    return manifest if "parts" in manifest else None
+
+def current_snapshot(index_dir: str = None) -> Optional[AnnSnapshot]:
+    """The published generation, reloaded whenever the manifest is replaced."""
+    index_dir = index_dir or INDEX_DIR
+    try:
+        mtime = os.stat(os.path.join(index_dir, MANIFEST)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _snapshots.get(index_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with _snapshot_lock:
+        cached = _snapshots.get(index_dir)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        manifest = _read_manifest(index_dir)
+        snapshot = AnnSnapshot(index_dir, manifest) if manifest else None
+        _snapshots[index_dir] = (mtime, snapshot)
+        return snapshot
+
+def _dequantize(vectors: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return vectors.astype(np.float32) * scales[:, None]
+
+def _train_centroids(vectors: np.ndarray, scales: np.ndarray, nlist: int, seed: int) -> np.ndarray:
+    """Spherical k-means on a sample of the vectors."""
+    rng = np.random.RandomState(seed)
+    sample_size = min(len(vectors), nlist * KMEANS_SAMPLE_PER_LIST)
+    sample_idx = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+    sample = _dequantize(vectors[sample_idx], scales[sample_idx])
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+    for _ in range(KMEANS_ITERATIONS):
+        assign = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, sample)
+        counts = np.bincount(assign, minlength=nlist)
+        empty = counts == 0
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms > 0, norms, 1.0)
+    return centroids.astype(np.float32)
+
+def _assign_lists(vectors: np.ndarray, scales: np.ndarray, centroids: np.ndarray, chunk_size: int = 50000) -> np.ndarray:
+    lists = np.empty(len(vectors), dtype=np.int32)
+    for i in range(0, len(vectors), chunk_size):
+        chunk = _dequantize(vectors[i:i + chunk_size], scales[i:i + chunk_size])
+        lists[i:i + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    return lists
+
+def _write_part(path: str, ids: np.ndarray, seqs: np.ndarray, scales: np.ndarray, vectors: np.ndarray,
+                centroids: np.ndarray = None, offsets: np.ndarray = None) -> None:
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "ids.npy"), np.asarray(ids, dtype=np.int64))
+    np.save(os.path.join(path, "seqs.npy"), np.asarray(seqs, dtype=np.int64))
+    np.save(os.path.join(path, "scales.npy"), np.asarray(scales, dtype=np.float32))
+    np.save(os.path.join(path, "vectors.npy"), np.asarray(vectors, dtype=np.int8).reshape(-1, DIM))
+    if centroids is not None:
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+
+def _swap_manifest(index_dir: str, previous: Optional[Dict[str, Any]], generation: int,
+                   parts: List[str], built_through: int) -> Dict[str, Any]:
+    """
+    Atomically publish a generation with os.replace; workers pick it up on their
+    next search and never see a half-written index. Parts referenced by neither
+    this nor the previous generation are removed.
+    """
+    manifest = {
+        "generation": generation,
+        "parts": parts,
+        "built_through": built_through,
+        "dim": DIM,
+    }
+    tmp_path = os.path.join(index_dir, MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(index_dir, MANIFEST))
+
+    keep = set(parts) | set(previous["parts"] if previous else [])
+    for entry in os.listdir(index_dir):
+        if entry.startswith(("base-", "seg-", "gen-")) and entry not in keep:
+            # Best effort: a worker may still have an old part mapped
+            shutil.rmtree(os.path.join(index_dir, entry), ignore_errors=True)
+    return manifest
+
+def publish_index(ids: np.ndarray, seqs: np.ndarray, vectors: np.ndarray, scales: np.ndarray, built_through: int,
+                  index_dir: str = None, nlist: int = None, seed: int = 0) -> Dict[str, Any]:
+    """Train the coarse quantizer and publish a generation with a single, freshly clustered base part."""
+    index_dir = index_dir or INDEX_DIR
+    os.makedirs(index_dir, exist_ok=True)
+    size = len(ids)
+    if size:
+        nlist = max(1, min(nlist or int(np.sqrt(size)), size))
+        centroids = _train_centroids(vectors, scales, nlist, seed)
+        lists = _assign_lists(vectors, scales, centroids)
+    else:
+        nlist = 0
+        centroids = np.empty((0, DIM), dtype=np.float32)
+        lists = np.empty(0, dtype=np.int32)
+    order = np.argsort(lists, kind="stable")
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=nlist))]).astype(np.int64)
+
+    previous = _read_manifest(index_dir)
+    generation = (previous["generation"] if previous else 0) + 1
+    name = f"base-{generation:06d}"
+    _write_part(os.path.join(index_dir, name), np.asarray(ids)[order], np.asarray(seqs)[order],
+                np.asarray(scales)[order], np.asarray(vectors)[order], centroids, offsets)
+    return _swap_manifest(index_dir, previous, generation, [name], built_through)
+
+def _load_rows(db: Session, min_seq: int, max_seq: int, chunk_size: int = 50000):
+    """(ids, seqs, scales, vectors) of embeddings with min_seq < seq <= max_seq, keyset-paginated."""
+    ids, seqs, scales, blobs = [], [], [], []
+    last_id = 0
+    while True:
+        rows = db.query(PulseEmbedding.record_id, PulseEmbedding.seq, PulseEmbedding.scale, PulseEmbedding.vector)\
+            .filter(PulseEmbedding.record_id > last_id, PulseEmbedding.seq > min_seq, PulseEmbedding.seq <= max_seq)\
+            .order_by(PulseEmbedding.record_id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        for rid, seq, scale, blob in rows:
+            ids.append(rid)
+            seqs.append(seq)
+            scales.append(scale)
+            blobs.append(blob)
+        last_id = rows[-1][0]
+    vectors = np.frombuffer(b"".join(blobs), dtype=np.int8).reshape(-1, DIM)
+    return np.array(ids, dtype=np.int64), np.array(seqs, dtype=np.int64), np.array(scales, dtype=np.float32), vectors
+
+def build_index(db: Session, index_dir: str = None, nlist: int = None) -> Dict[str, Any]:
+    """
+    Publish a compacted generation of every embedding up to the current max seq.
+    Rows written while the build runs get a higher seq and stay in the delta.
+    """
+    built_through = db.query(func.max(PulseEmbedding.seq)).scalar() or 0
+    ids, seqs, scales, vectors = _load_rows(db, 0, built_through)
+    return publish_index(ids, seqs, vectors, scales, built_through, index_dir=index_dir, nlist=nlist)
+
+def append_index(db: Session, index_dir: str = None) -> Dict[str, Any]:
+    """
+    Fold embeddings written since the current generation into a new segment and
+    publish it as the next generation. Falls back to a full build when there is no
+    generation yet, or when segments would exceed MAX_SEGMENTS or COMPACT_RATIO
+    of the base part.
+    """
+    index_dir = index_dir or INDEX_DIR
+    previous = _read_manifest(index_dir)
+    if previous is None:
+        return build_index(db, index_dir)
+    built_through = db.query(func.max(PulseEmbedding.seq)).scalar() or 0
+    if built_through <= previous["built_through"]:
+        return previous
+    ids, seqs, scales, vectors = _load_rows(db, previous["built_through"], built_through)
+    snapshot = current_snapshot(index_dir)
+    base_size = snapshot.parts[0].size if snapshot and snapshot.parts else 0
+    segment_rows = (snapshot.size - base_size if snapshot else 0) + len(ids)
+    if len(previous["parts"]) >= MAX_SEGMENTS + 1 or segment_rows > COMPACT_RATIO * base_size:
+        return build_index(db, index_dir)
+    generation = previous["generation"] + 1
+    name = f"seg-{generation:06d}"
+    _write_part(os.path.join(index_dir, name), ids, seqs, scales, vectors)
+    return _swap_manifest(index_dir, previous, generation, previous["parts"] + [name], built_through)
+
+def index_stats(db: Session, index_dir: str = None) -> Dict[str, Any]:
+    snapshot = current_snapshot(index_dir)
+    built_through = snapshot.built_through if snapshot else 0
+    return {
+        "generation": snapshot.generation if snapshot else None,
+        "snapshot_size": snapshot.size if snapshot else 0,
+        "segments": len(snapshot.parts) - 1 if snapshot else 0,
+        "nlist": snapshot.nlist if snapshot else 0,
+        "delta_size": db.query(func.count(PulseEmbedding.record_id)).filter(PulseEmbedding.seq > built_through).scalar(),
+    }
+
+def find_similar(db: Session, pulse_grid: Dict[str, Any], limit: int = 100, nprobe: int = NPROBE,
+                 index_dir: str = None) -> List[Tuple[int, float]]:
+    """
+    Approximate nearest records by pulse embedding, (record_id, cosine) best first.
+    Merges the memory-mapped generation with an exact scan of rows written after
+    it; file rows whose seq no longer matches the table (updated, superseded by a
+    later segment, or deleted) are dropped.
+    """
+    query = embed_grid(pulse_grid, mirror_single_hand=True)
+    if query is None:
+        return []
+    snapshot = current_snapshot(index_dir)
+    built_through = 0
+    hits: List[Tuple[int, int, float]] = []
+    if snapshot:
+        built_through = snapshot.built_through
+        ids, seqs, sims = snapshot.search(query, limit, nprobe)
+        hits = list(zip(ids.tolist(), seqs.tolist(), sims.tolist()))
+
+    delta = db.query(PulseEmbedding.record_id, PulseEmbedding.scale, PulseEmbedding.vector)\
+        .filter(PulseEmbedding.seq > built_through)\
+        .all()
+    found: Dict[int, float] = {}
+    if delta:
+        vectors = np.frombuffer(b"".join(row.vector for row in delta), dtype=np.int8).reshape(-1, DIM)
+        scales = np.array([row.scale for row in delta], dtype=np.float32)
+        sims = (vectors.astype(np.float32) @ query) * scales
+        found = dict(zip((row.record_id for row in delta), sims.tolist()))
+
+    stale_check = list({rid for rid, _, _ in hits if rid not in found})
+    if stale_check:
+        current = dict(
+            db.query(PulseEmbedding.record_id, PulseEmbedding.seq)
+            .filter(PulseEmbedding.record_id.in_(stale_check)).all()
+        )
+        for rid, seq, sim in hits:
+            if current.get(rid) == seq:
+                found[rid] = sim
+    return sorted(found.items(), key=lambda kv: (-kv[1], -kv[0]))[:limit]
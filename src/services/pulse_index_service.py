@@ -0,0 +1,198 @@
+from typing import Dict, Any, List, Iterable, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from sqlalchemy import func, distinct, or_, and_
+from src.database.models import MedicalRecord, PulseCell, PulseCellTerm
+
+POSITIONS = ["cun", "guan", "chi"]
+LEVELS = ["fu", "zhong", "chen"]
+HANDS = ["left", "right"]
+
+# Pulse term vocabulary. Ids are positions in this list (1-based) and are stored
+# in the database, so only ever append new terms at the end.
+PULSE_TERMS = [
+    "浮", "沉", "迟", "数", "滑", "涩", "虚", "实", "长", "短",
+    "洪", "微", "紧", "缓", "弦", "芤", "革", "牢", "濡", "弱",
+    "散", "细", "伏", "动", "促", "结", "代", "疾", "大", "小",
+    "空", "无", "豁", "软", "硬", "有力", "无力", "无根", "中空",
+]
+TERM_IDS = {term: i + 1 for i, term in enumerate(PULSE_TERMS)}
+_MAX_TERM_LEN = max(len(t) for t in PULSE_TERMS)
+
+def tokenize_pulse_text(text: str) -> List[int]:
+    """
+    Longest-match scan of a cell text into term ids, e.g. "浮大中空" -> [浮, 大, 中空].
+    Characters outside the vocabulary are skipped. Ids are returned in first-seen order.
+    """
+    ids = []
+    i = 0
+    n = len(text)
+    while i < n:
+        for size in range(min(_MAX_TERM_LEN, n - i), 0, -1):
+            term_id = TERM_IDS.get(text[i:i + size])
+            if term_id:
+                if term_id not in ids:
+                    ids.append(term_id)
+                i += size
+                break
+        else:
+            i += 1
+    return ids
+
+def grid_cells(pulse_grid: Dict[str, Any]) -> List[Tuple[Optional[str], str, str, str]]:
+    """Non-empty cells of a grid as (hand, position, level, text); legacy keys have hand None."""
+    cells = []
+    if not pulse_grid:
+        return cells
+    for hand in HANDS + [None]:
+        prefix = f"{hand}-" if hand else ""
+        for pos in POSITIONS:
+            for level in LEVELS:
+                val = pulse_grid.get(f"{prefix}{pos}-{level}")
+                if isinstance(val, str) and val.strip():
+                    cells.append((hand, pos, level, val.strip()))
+    return cells
+
+def write_pulse_cells(db: Session, record_id: int, pulse_grid: Dict[str, Any]) -> None:
+    """Replace the normalized cells of one record. Runs in the caller's transaction."""
+    write_pulse_cells_bulk(db, {record_id: pulse_grid})
+
+def write_pulse_cells_bulk(db: Session, grids: Dict[int, Dict[str, Any]]) -> None:
+    """Replace the normalized cells of many records with bulk inserts."""
+    if not grids:
+        return
+    delete_pulse_cells(db, grids.keys())
+
+    cell_rows = []
+    cell_terms = []
+    for record_id, pulse_grid in grids.items():
+        for hand, pos, level, text in grid_cells(pulse_grid or {}):
+            term_ids = tokenize_pulse_text(text)
+            cell_rows.append({
+                "record_id": record_id,
+                "hand": hand,
+                "position": pos,
+                "level": level,
+                "raw_text": text,
+                "term_ids": ",".join(str(t) for t in term_ids),
+            })
+            cell_terms.append(term_ids)
+    if not cell_rows:
+        return
+
+    db.bulk_insert_mappings(PulseCell, cell_rows, return_defaults=True)
+    postings = [
+        {
+            "cell_id": cell["id"],
+            "term_id": term_id,
+            "record_id": cell["record_id"],
+            "hand": cell["hand"],
+            "position": cell["position"],
+            "level": cell["level"],
+        }
+        for cell, term_ids in zip(cell_rows, cell_terms)
+        for term_id in term_ids
+    ]
+    if postings:
+        db.bulk_insert_mappings(PulseCellTerm, postings)
+
+def delete_pulse_cells(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if not record_ids:
+        return
+    db.query(PulseCellTerm).filter(PulseCellTerm.record_id.in_(record_ids)).delete(synchronize_session=False)
+    db.query(PulseCell).filter(PulseCell.record_id.in_(record_ids)).delete(synchronize_session=False)
+
+def backfill_pulse_cells(db: Session, chunk_size: int = 500) -> int:
+    """Rebuild pulse_cells from medical_records.data in id-ordered chunks. Returns records processed."""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.data)\
+            .filter(MedicalRecord.id > last_id)\
+            .order_by(MedicalRecord.id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        write_pulse_cells_bulk(db, {rid: (data or {}).get("pulse_grid") or {} for rid, data in rows})
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+    return total
+
+def _term_filter(query, position: str, level: str, term: str, hand: str = None):
+    term_id = TERM_IDS.get(term)
+    if term_id is None:
+        raise ValueError(f"Unknown pulse term: {term}")
+    query = query.filter(
+        PulseCellTerm.position == position,
+        PulseCellTerm.level == level,
+        PulseCellTerm.term_id == term_id,
+    )
+    if hand:
+        query = query.filter(PulseCellTerm.hand == hand)
+    return query
+
+def find_record_ids_by_pulse(db: Session, criteria: List[Dict[str, str]], limit: int = 200) -> List[int]:
+    """
+    Records matching ALL criteria, each {"position", "level", "term", optional "hand"}.
+    Example: [{"hand": "right", "position": "chi", "level": "chen", "term": "沉"}]
+    """
+    if not criteria:
+        return []
+    result = None
+    for c in criteria:
+        query = _term_filter(db.query(PulseCellTerm.record_id).distinct(),
+                             c["position"], c["level"], c["term"], c.get("hand"))
+        ids = {rid for (rid,) in query.all()}
+        result = ids if result is None else result & ids
+        if not result:
+            return []
+    return sorted(result, reverse=True)[:limit]
+
+def count_by_term(db: Session, position: str, level: str, hand: str = None) -> Dict[str, int]:
+    """Cohort counts: number of records showing each term at one grid position."""
+    query = db.query(PulseCellTerm.term_id, func.count(distinct(PulseCellTerm.record_id)))\
+        .filter(PulseCellTerm.position == position, PulseCellTerm.level == level)
+    if hand:
+        query = query.filter(PulseCellTerm.hand == hand)
+    rows = query.group_by(PulseCellTerm.term_id).all()
+    return {PULSE_TERMS[term_id - 1]: count for term_id, count in rows if 0 < term_id <= len(PULSE_TERMS)}
+
+def grid_term_keys(pulse_grid: Dict[str, Any]) -> Set[Tuple[str, str, int]]:
+    """Hand-agnostic (position, level, term_id) keys of a grid."""
+    keys = set()
+    for _, pos, level, text in grid_cells(pulse_grid or {}):
+        for term_id in tokenize_pulse_text(text):
+            keys.add((pos, level, term_id))
+    return keys
+
+def overlap_counts(db: Session, keys: Iterable[Tuple[str, str, int]], limit: int = None,
+                   record_ids: Iterable[int] = None) -> List[Tuple[int, int]]:
+    """
+    (record_id, number of matching postings) for records sharing (position, level, term)
+    keys, best first. Either the top `limit` records or only the given record_ids.
+    """
+    keys = list(keys)
+    if not keys:
+        return []
+    conditions = [
+        and_(PulseCellTerm.position == pos, PulseCellTerm.level == level, PulseCellTerm.term_id == term_id)
+        for pos, level, term_id in keys
+    ]
+    overlap = func.count(PulseCellTerm.term_id)
+    query = db.query(PulseCellTerm.record_id, overlap).filter(or_(*conditions))
+    if record_ids is not None:
+        query = query.filter(PulseCellTerm.record_id.in_(list(record_ids)))
+    query = query.group_by(PulseCellTerm.record_id).order_by(overlap.desc(), PulseCellTerm.record_id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+def candidate_record_ids(db: Session, pulse_grid: Dict[str, Any], limit: int = 200) -> List[int]:
+    """
+    Similarity candidates: records sharing the most (position, level, term) postings
+    with the query grid, ranked by overlap in SQL. Hand is ignored so single-hand
+    input can match either hand, as search_similar_records does.
+    """
+    return [rid for rid, _ in overlap_counts(db, grid_term_keys(pulse_grid), limit=limit)]
@@ -0,0 +1,108 @@
+from typing import Dict, Any, List, Tuple, Iterator, Optional
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+import logging
+from sqlalchemy.orm import Session
+from sqlalchemy import or_
+from src.database.models import MedicalRecord, AnalysisResult
+from src.services import analysis_service, pattern_stats_service
+
+logger = logging.getLogger(__name__)
+
+def _analyze_chunk(items: List[Tuple[int, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Worker entry point (runs in a pool process; rules are loaded there from the rule file)."""
+    rows = []
+    now = datetime.now()
+    for record_id, data in items:
+        result = analysis_service.analyze_pulse_data_full(data or {})
+        rows.append({
+            "record_id": record_id,
+            "rule_version": result["rule_version"],
+            "pattern": result["pattern"],
+            "features": result["features"],
+            "consistency_comment": result["consistency_comment"],
+            "prescription_comment": result["prescription_comment"],
+            "suggestion": result["suggestion"],
+            "analyzed_at": now,
+        })
+    return rows
+
+def iter_stale_chunks(db: Session, rule_version: str, chunk_size: int = 500, force: bool = False) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """
+    Stream (record_id, data) chunks, keyset-paginated by id, for records that have
+    no stored result or one produced by a different rule version.
+    """
+    last_id = 0
+    while True:
+        query = db.query(MedicalRecord.id, MedicalRecord.data)\
+            .outerjoin(AnalysisResult, AnalysisResult.record_id == MedicalRecord.id)\
+            .filter(MedicalRecord.id > last_id)
+        if not force:
+            query = query.filter(or_(
+                AnalysisResult.record_id.is_(None),
+                AnalysisResult.rule_version != rule_version
+            ))
+        rows = query.order_by(MedicalRecord.id).limit(chunk_size).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [(rid, data) for rid, data in rows]
+
+def save_results(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """
+    Replace stored results for the given records and bring the pattern columns
+    on medical_records (and their rollups) up to date (caller commits).
+    """
+    if not rows:
+        return
+    record_ids = [r["record_id"] for r in rows]
+    db.query(AnalysisResult)\
+        .filter(AnalysisResult.record_id.in_(record_ids))\
+        .delete(synchronize_session=False)
+    db.bulk_insert_mappings(AnalysisResult, rows)
+    pattern_stats_service.update_record_patterns(db, {r["record_id"]: (r["pattern"], r["features"]) for r in rows})
+    pattern_stats_service.refresh_pattern_rollups(db, pattern_stats_service.rollup_keys(db, record_ids))
+
+def run_reanalysis(db: Session, workers: int = 4, chunk_size: int = 500, force: bool = False,
+                   progress: Optional[callable] = None) -> Dict[str, Any]:
+    """
+    Re-run analysis over stale records with a process pool, committing one chunk
+    at a time. Returns counts and the rule version used.
+    """
+    rule_version = analysis_service.get_rule_version()
+    analyzed = 0
+    chunks = iter_stale_chunks(db, rule_version, chunk_size=chunk_size, force=force)
+
+    if workers <= 1:
+        for chunk in chunks:
+            save_results(db, _analyze_chunk(chunk))
+            db.commit()
+            analyzed += len(chunk)
+            if progress:
+                progress(analyzed)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Keep a bounded number of chunks in flight so memory stays flat
+            pending = []
+            for chunk in chunks:
+                pending.append(pool.submit(_analyze_chunk, chunk))
+                if len(pending) >= workers * 2:
+                    rows = pending.pop(0).result()
+                    save_results(db, rows)
+                    db.commit()
+                    analyzed += len(rows)
+                    if progress:
+                        progress(analyzed)
+            for future in pending:
+                rows = future.result()
+                save_results(db, rows)
+                db.commit()
+                analyzed += len(rows)
+                if progress:
+                    progress(analyzed)
+
+    return {"rule_version": rule_version, "analyzed": analyzed}
+
+def delete_results(db: Session, record_ids: List[int]) -> None:
+    if record_ids:
+        db.query(AnalysisResult).filter(AnalysisResult.record_id.in_(record_ids)).delete(synchronize_session=False)
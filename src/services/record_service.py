@@ -1,9 +1,9 @@
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_
+from sqlalchemy import func, or_, and_
 from datetime import datetime, date
-from src.database.models import Patient, MedicalRecord, Practitioner
-from pypinyin import lazy_pinyin, Style
+from src.database.models import Patient, MedicalRecord, Practitioner, ChangeLog
+from src.services import pinyin_service, summary_service, pulse_index_service, storage_service, pattern_stats_service, prescription_service, text_index_service, pulse_embedding_service
 
 def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None) -> Dict[str, Any]:
     """
@@ -31,14 +31,13 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
     patient = patient_query.first()
     
     if not patient:
-        pinyin_initials = "".join(lazy_pinyin(patient_name, style=Style.FIRST_LETTER))
         patient = Patient(
             name=patient_name,
             gender=patient_info.get("gender"),
             age=int(patient_info.get("age", 0)) if patient_info.get("age") else None,
             phone=patient_info.get("phone"),
-            pinyin=pinyin_initials,
-            info=patient_info
+            info=patient_info,
+            **pinyin_service.pinyin_fields(patient_name)
         )
         db.add(patient)
         db.commit()
@@ -47,9 +46,10 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
         if patient_info.get("phone") and not patient.phone:
             patient.phone = patient_info.get("phone")
             db.commit()
-        if not patient.pinyin:
-             patient.pinyin = "".join(lazy_pinyin(patient.name, style=Style.FIRST_LETTER))
-             db.commit()
+        if not patient.pinyin or not patient.pinyin_full:
+            # Committed with the record below
+            for column, value in pinyin_service.pinyin_fields(patient.name).items():
+                setattr(patient, column, value)
     
     # 2. Create or Update Medical Record
     today = date.today()
@@ -73,7 +73,8 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
              if teacher:
                  practitioner_id = teacher.id
     
-    record_data = {
+    # raw_input goes to the compressed record_payloads side table
+    record_data, cold_data = storage_service.split_record_data({
         "medical_record": medical_info,
         "pulse_grid": data.get("pulse_grid", {}),
         "raw_input": data,
@@ -83,12 +84,17 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
             "practitioner_id": practitioner_id,
             "user_id": user_id
         }
-    }
+    })
     
+    pattern, features = pattern_stats_service.classify(record_data)
+    rollup_keys = set()
     if existing_record:
+        rollup_keys.add((existing_record.practitioner_id, pattern_stats_service.month_of(existing_record.visit_date)))
         existing_record.complaint = complaint
         existing_record.data = record_data
         existing_record.practitioner_id = practitioner_id
+        existing_record.analysis_pattern = pattern
+        existing_record.analysis_features = features
         existing_record.user_id = user_id # Track who updated it
         existing_record.updated_at = datetime.now()
         record_id = existing_record.id
@@ -99,6 +105,8 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
             complaint=complaint,
             data=record_data,
             practitioner_id=practitioner_id,
+            analysis_pattern=pattern,
+            analysis_features=features,
             user_id=user_id
         )
         db.add(new_record)
@@ -106,11 +114,20 @@ def save_medical_record(db: Session, data: Dict[str, Any], user_id: int = None)
         record_id = new_record.id
         message = "Record saved successfully"
     
+    storage_service.store_payload(db, record_id, cold_data)
+    pulse_index_service.write_pulse_cells(db, record_id, record_data["pulse_grid"])
+    pulse_embedding_service.write_embeddings(db, {record_id: record_data["pulse_grid"]})
+    prescription_service.write_prescription_items(db, record_id, record_data, cold_data)
+    text_index_service.write_complaint_terms(db, record_id, complaint)
+    summary_service.refresh_patient_summaries(db, [patient.id])
+    rollup_keys |= pattern_stats_service.rollup_keys(db, [record_id])
+    pattern_stats_service.refresh_pattern_rollups(db, rollup_keys)
     db.commit()
     return {"status": "success", "message": message, "record_id": record_id}
 
 def get_patient_history(db: Session, patient_id: int) -> List[Dict[str, Any]]:
-    records = db.query(MedicalRecord)\
+    # Column projection: the deferred data JSON is never read for listings
+    records = db.query(MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint)\
         .filter(MedicalRecord.patient_id == patient_id)\
         .order_by(MedicalRecord.visit_date.desc())\
         .all()
@@ -123,8 +140,57 @@ def get_patient_history(db: Session, patient_id: int) -> List[Dict[str, Any]]:
         for r in records
     ]
 
+def get_patient_latest_record(db: Session, patient: Patient) -> Dict[str, Any]:
+    """Patient info plus the medical_record / pulse_grid of their latest record (empty if none)."""
+    summary = summary_service.get_patient_summary(db, patient.id)
+    latest_record = None
+    if summary and summary["latest_record_id"]:
+        latest_record = db.query(MedicalRecord.id, MedicalRecord.data)\
+            .filter(MedicalRecord.id == summary["latest_record_id"])\
+            .first()
+
+    response_data = {
+        "record_id": latest_record.id if latest_record else None,
+        "patient_info": {
+            "name": patient.name,
+            "age": patient.age,
+            "gender": patient.gender,
+            "phone": patient.phone
+        },
+        "medical_record": {},
+        "pulse_grid": {}
+    }
+
+    if latest_record and latest_record.data:
+        record_data = latest_record.data
+        if "medical_record" in record_data:
+            response_data["medical_record"] = record_data["medical_record"]
+        if "pulse_grid" in record_data:
+            response_data["pulse_grid"] = record_data["pulse_grid"]
+
+    return response_data
+
+def history_version(db: Session, patient_id: int) -> Tuple:
+    """
+    (record count, latest updated_at, latest change_log id) of a patient's
+    records: changes whenever the history listing can. The change_log id
+    catches a delete plus an insert with an older updated_at (or a reused id),
+    which leave the first two unchanged.
+    """
+    latest_change = db.query(func.max(ChangeLog.id))\
+        .join(MedicalRecord, and_(ChangeLog.table_name == "medical_records", ChangeLog.row_id == MedicalRecord.id))\
+        .filter(MedicalRecord.patient_id == patient_id)\
+        .scalar_subquery()
+    return tuple(db.query(func.count(MedicalRecord.id), func.max(MedicalRecord.updated_at), latest_change)
+                 .filter(MedicalRecord.patient_id == patient_id).one())
+
+def record_version(db: Session, record_id: int) -> Optional[Tuple]:
+    """(updated_at,) of a record, None if it does not exist."""
+    row = db.query(MedicalRecord.updated_at).filter(MedicalRecord.id == record_id).first()
+    return tuple(row) if row else None
+
 def get_record_by_id(db: Session, record_id: int) -> Dict[str, Any]:
-    record = db.query(MedicalRecord).filter(MedicalRecord.id == record_id).first()
+    record = db.query(MedicalRecord.id, MedicalRecord.data).filter(MedicalRecord.id == record_id).first()
     if not record:
         return None
         
@@ -141,3 +207,225 @@ def get_record_by_id(db: Session, record_id: int) -> Dict[str, Any]:
             response_data["pulse_grid"] = record_data["pulse_grid"]
             
     return response_data
+
+def _batch_item_parts(item: Any) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """
+    (patient_info, medical_record, pulse_grid) of one batch item, type-checked
+    so malformed client data is reported for that item instead of failing the
+    whole batch. Raises ValueError.
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Record must be an object")
+    parts = []
+    for key in ("patient_info", "medical_record", "pulse_grid"):
+        part = item.get(key) or {}
+        if not isinstance(part, dict):
+            raise ValueError(f"{key} must be an object")
+        parts.append(part)
+    patient_info, medical_info, _ = parts
+    name = patient_info.get("name")
+    if name and not isinstance(name, str):
+        raise ValueError("Patient name must be a string")
+    if not name or not name.strip():
+        raise ValueError("Patient name is required")
+    if not isinstance(patient_info.get("phone"), (str, int, type(None))):
+        raise ValueError("phone must be a string")
+    if not isinstance(patient_info.get("gender"), (str, type(None))):
+        raise ValueError("gender must be a string")
+    for key in ("complaint", "prescription"):
+        if not isinstance(medical_info.get(key), (str, type(None))):
+            raise ValueError(f"medical_record.{key} must be a string")
+    for key in ("mode", "teacher"):
+        if not isinstance(item.get(key), (str, type(None))):
+            raise ValueError(f"{key} must be a string")
+    return tuple(parts)
+
+def _parse_age(value) -> Any:
+    try:
+        return int(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+def _parse_visit_date(value) -> datetime:
+    """Offline clients may send the original visit date; default to now like save_medical_record."""
+    if not value:
+        return datetime.now()
+    for fmt in ("%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(str(value)[:19], fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid visit_date: {value}")
+
+def save_medical_records_batch(db: Session, items: List[Dict[str, Any]], user_id: int = None) -> List[Dict[str, Any]]:
+    """
+    Bulk variant of save_medical_record for offline uploads.
+    Patients, practitioners and same-day records are resolved with one set-based
+    query each, and rows are written with bulk insert/update mappings in a single
+    transaction. Returns one status entry per input item, in input order.
+    """
+    results: List[Dict[str, Any]] = [None] * len(items)
+    prepared = []
+
+    # 1. Validate and normalize every item up front; a bad item fails alone
+    for idx, item in enumerate(items):
+        try:
+            patient_info, medical_info, pulse_grid = _batch_item_parts(item)
+            prepared.append({
+                "index": idx,
+                "item": item,
+                "medical_record": medical_info,
+                "pulse_grid": pulse_grid,
+                "name": patient_info["name"],
+                "phone": str(patient_info["phone"]) if patient_info.get("phone") else None,
+                "gender": patient_info.get("gender"),
+                "age": _parse_age(patient_info.get("age")),
+                "visit_date": _parse_visit_date(item.get("visit_date")),
+                "mode": item.get("mode") or "personal",
+                "teacher": item.get("teacher") or "",
+            })
+        except ValueError as e:
+            results[idx] = {"index": idx, "status": "error", "message": str(e)}
+        except Exception as e:
+            results[idx] = {"index": idx, "status": "error", "message": f"Invalid record: {e}"}
+
+    if not prepared:
+        return results
+
+    # 2. Resolve patients with one IN query (same matching rules as save_medical_record)
+    names = {p["name"] for p in prepared}
+    by_phone, by_demo = {}, {}
+    for patient in db.query(Patient).filter(Patient.name.in_(names)).order_by(Patient.id).all():
+        if patient.phone:
+            by_phone.setdefault((patient.name, patient.phone), patient.id)
+        by_demo.setdefault((patient.name, patient.gender, patient.age), patient.id)
+
+    new_patients = {}
+    for p in prepared:
+        key = (p["name"], p["phone"]) if p["phone"] else (p["name"], p["gender"], p["age"])
+        patient_id = (by_phone if p["phone"] else by_demo).get(key)
+        if patient_id is None and key not in new_patients:
+            new_patients[key] = {
+                "name": p["name"],
+                "gender": p["gender"],
+                "age": p["age"],
+                "phone": p["phone"],
+                "info": p["item"].get("patient_info"),
+                **pinyin_service.pinyin_fields(p["name"]),
+            }
+        p["patient_key"] = key
+        p["patient_id"] = patient_id
+
+    if new_patients:
+        mappings = list(new_patients.values())
+        db.bulk_insert_mappings(Patient, mappings, return_defaults=True)
+        created = {key: m["id"] for key, m in zip(new_patients.keys(), mappings)}
+        for p in prepared:
+            if p["patient_id"] is None:
+                p["patient_id"] = created[p["patient_key"]]
+
+    # 3. Resolve practitioners: one doctor lookup plus one IN query for teachers
+    doctor = db.query(Practitioner.id).filter(Practitioner.role == "doctor").first()
+    teacher_names = {p["teacher"] for p in prepared if p["mode"] == "shadowing" and p["teacher"]}
+    teacher_ids = {}
+    if teacher_names:
+        teacher_ids = dict(
+            db.query(Practitioner.name, Practitioner.id)
+            .filter(Practitioner.name.in_(teacher_names), Practitioner.role == "teacher")
+            .all()
+        )
+
+    # 4. Find existing same-day records for the affected patients in one query
+    patient_ids = {p["patient_id"] for p in prepared}
+    visit_days = {p["visit_date"].date() for p in prepared}
+    existing = {}
+    rows = db.query(MedicalRecord.id, MedicalRecord.patient_id, MedicalRecord.visit_date)\
+        .filter(
+            MedicalRecord.patient_id.in_(patient_ids),
+            MedicalRecord.visit_date >= datetime.combine(min(visit_days), datetime.min.time()),
+            MedicalRecord.visit_date <= datetime.combine(max(visit_days), datetime.max.time()),
+        ).order_by(MedicalRecord.id).all()
+    for record_id, patient_id, visit_date in rows:
+        existing.setdefault((patient_id, visit_date.date()), record_id)
+
+    # 5. Build insert/update mappings; later items for the same patient and day win
+    inserts, updates = {}, {}
+    now = datetime.now()
+    for p in prepared:
+        item = p["item"]
+        medical_info = p["medical_record"]
+        if p["mode"] == "personal":
+            practitioner_id = doctor.id if doctor else None
+        elif p["mode"] == "shadowing":
+            practitioner_id = teacher_ids.get(p["teacher"])
+        else:
+            practitioner_id = None
+        record_data, cold_data = storage_service.split_record_data({
+            "medical_record": medical_info,
+            "pulse_grid": p["pulse_grid"],
+            "raw_input": item,
+            "client_info": {
+                "mode": p["mode"],
+                "teacher": p["teacher"],
+                "practitioner_id": practitioner_id,
+                "user_id": user_id
+            }
+        })
+        p["cold_data"] = cold_data
+        values = pattern_stats_service.apply_classification({
+            "complaint": medical_info.get("complaint"),
+            "data": record_data,
+            "practitioner_id": practitioner_id,
+            "user_id": user_id,
+            "updated_at": now,
+        })
+        day_key = (p["patient_id"], p["visit_date"].date())
+        record_id = existing.get(day_key)
+        if record_id is not None:
+            updates[record_id] = dict(values, id=record_id)
+            p["record_id"] = record_id
+            p["message"] = "Record updated successfully"
+        else:
+            if day_key in inserts:
+                p["message"] = "Record updated successfully"
+            else:
+                p["message"] = "Record saved successfully"
+            inserts[day_key] = dict(values, patient_id=p["patient_id"], visit_date=p["visit_date"])
+            p["day_key"] = day_key
+
+    insert_mappings = list(inserts.values())
+    rollup_keys = pattern_stats_service.rollup_keys(db, updates.keys())
+    if insert_mappings:
+        db.bulk_insert_mappings(MedicalRecord, insert_mappings, return_defaults=True)
+    if updates:
+        db.bulk_update_mappings(MedicalRecord, list(updates.values()))
+    grids = {m["id"]: m["data"]["pulse_grid"] for m in insert_mappings + list(updates.values())}
+    pulse_index_service.write_pulse_cells_bulk(db, grids)
+    pulse_embedding_service.write_embeddings(db, grids)
+    payloads = {}
+    for p in prepared:
+        if "day_key" in p:
+            p["record_id"] = inserts[p["day_key"]]["id"]
+        payloads[p["record_id"]] = p["cold_data"]
+    storage_service.store_payloads(db, payloads)
+    prescription_service.write_prescription_items_bulk(db, {
+        m["id"]: prescription_service.prescription_texts(m["data"])
+        for m in insert_mappings + list(updates.values())
+    })
+    text_index_service.write_complaint_terms_bulk(db, {
+        m["id"]: m.get("complaint") for m in insert_mappings + list(updates.values())
+    })
+    summary_service.refresh_patient_summaries(db, patient_ids)
+    rollup_keys |= pattern_stats_service.rollup_keys(db, grids.keys())
+    pattern_stats_service.refresh_pattern_rollups(db, rollup_keys)
+    db.commit()
+
+    for p in prepared:
+        results[p["index"]] = {
+            "index": p["index"],
+            "status": "success",
+            "message": p["message"],
+            "record_id": p["record_id"],
+            "patient_id": p["patient_id"],
+        }
+    return results
@@ -0,0 +1,239 @@
+from typing import Dict, Any, List, Optional, Set, Tuple
+import heapq
+import time
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from src.database.models import MedicalRecord, Patient
+from src.services import pulse_index_service, text_index_service, prescription_service, prescription_lsh_service
+
+# Fusion weights per signal. Only signals present in the query take part, and
+# their weights are renormalised, so scores stay in [0, 1].
+DEFAULT_WEIGHTS = {
+    "pulse": 0.45,
+    "complaint": 0.25,
+    "herbs": 0.2,
+    "demographics": 0.1,
+}
+SIGNALS = tuple(DEFAULT_WEIGHTS)
+
+PULSE_CANDIDATES = 500
+HERB_CANDIDATES = 500
+TEXT_CANDIDATES = 500
+# Complaint terms in more than this share of records are "non-essential": they
+# are not used to generate candidates, only probed for candidates being scored.
+ESSENTIAL_DF_RATIO = 0.05
+SCORE_BATCH = 32
+AGE_SPAN = 30.0
+
+class _Timer:
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+
+    def stage(self, name: str, started: float):
+        self.stages[name] = round((time.perf_counter() - started) * 1000, 2)
+
+def _query_signals(payload: Dict[str, Any]) -> Dict[str, Any]:
+    medical_record = payload.get("medical_record") or {}
+    patient_info = payload.get("patient_info") or {}
+    age = patient_info.get("age")
+    try:
+        age = int(age) if age not in (None, "") else None
+    except (TypeError, ValueError):
+        age = None
+    return {
+        "pulse": pulse_index_service.grid_term_keys(payload.get("pulse_grid") or {}),
+        "complaint": text_index_service.complaint_terms(medical_record.get("complaint")),
+        "herbs": {item["herb"] for item in prescription_service.parse_prescription(medical_record.get("prescription") or "")},
+        "gender": patient_info.get("gender") or None,
+        "age": age,
+    }
+
+def _demographic_score(query: Dict[str, Any], gender: Optional[str], age: Optional[int]) -> float:
+    parts = []
+    if query["gender"]:
+        parts.append(1.0 if gender == query["gender"] else 0.0)
+    if query["age"] is not None:
+        parts.append(max(0.0, 1.0 - abs((age if age is not None else -100) - query["age"]) / AGE_SPAN))
+    return sum(parts) / len(parts) if parts else 0.0
+
+def search_similar_cases(db: Session, payload: Dict[str, Any], k: int = 5, weights: Dict[str, float] = None,
+                         teacher_only: bool = True, exclude_record_id: int = None,
+                         debug: bool = False) -> Dict[str, Any]:
+    """
+    Multi-signal similar-case retrieval.
+
+    1. Candidate generation from cheap indexes: top pulse-posting overlaps,
+       records holding the query's rare complaint terms, and prescription LSH
+       buckets. Each candidate gets an upper bound on its fused score: exact
+       partial scores where the index already gave them, the best still
+       possible value elsewhere.
+    2. Candidates are scored exactly in descending bound order, in batches
+       (pulse overlap, non-essential complaint terms, MinHash Jaccard,
+       demographics). As in MaxScore/WAND, scoring stops as soon as the next
+       bound cannot beat the current k-th score.
+    """
+    timer = _Timer()
+    query = _query_signals(payload)
+    weights = dict(DEFAULT_WEIGHTS, **(weights or {}))
+    active = {
+        "pulse": bool(query["pulse"]),
+        "complaint": bool(query["complaint"]),
+        "herbs": bool(query["herbs"]),
+        "demographics": bool(query["gender"] or query["age"] is not None),
+    }
+    total_weight = sum(weights[s] for s in SIGNALS if active[s])
+    if not total_weight or not (active["pulse"] or active["complaint"] or active["herbs"]):
+        return {"results": [], "debug": {"stages": timer.stages}} if debug else {"results": []}
+    w = {s: (weights[s] / total_weight if active[s] else 0.0) for s in SIGNALS}
+
+    # --- Stage 1: candidates and per-signal partial scores -----------------
+    pulse_exact: Dict[int, float] = {}
+    pulse_residual = 0.0
+    if active["pulse"]:
+        started = time.perf_counter()
+        n_keys = len(query["pulse"])
+        rows = pulse_index_service.overlap_counts(db, query["pulse"], limit=PULSE_CANDIDATES)
+        pulse_exact = {rid: min(count, n_keys) / n_keys for rid, count in rows}
+        if len(rows) == PULSE_CANDIDATES:
+            pulse_residual = min(rows[-1][1], n_keys) / n_keys
+        timer.stage("pulse_candidates", started)
+
+    text_partial: Dict[int, float] = {}
+    text_residual = 0.0
+    nonessential: Set[str] = set()
+    nonessential_bound = 0.0
+    term_idf: Dict[str, float] = {}
+    if active["complaint"]:
+        started = time.perf_counter()
+        stats = text_index_service.term_weights(db, query["complaint"])
+        # Normalise by the idf of every query term, including unseen ones
+        max_idf = max((idf for idf, _ in stats.values()), default=1.0)
+        term_idf = {t: stats[t][0] if t in stats else max_idf for t in query["complaint"]}
+        idf_total = sum(term_idf.values())
+        total_docs = db.query(func.max(MedicalRecord.id)).scalar() or 1
+        df_cutoff = max(TEXT_CANDIDATES, ESSENTIAL_DF_RATIO * total_docs)
+        essential = [t for t, (_, df) in stats.items() if df <= df_cutoff]
+        nonessential = {t for t, (_, df) in stats.items() if df > df_cutoff}
+        nonessential_bound = sum(term_idf[t] for t in nonessential) / idf_total
+        for term, rid in text_index_service.postings(db, essential):
+            text_partial[rid] = text_partial.get(rid, 0.0) + term_idf[term] / idf_total
+        if len(text_partial) > TEXT_CANDIDATES:
+            best = heapq.nlargest(TEXT_CANDIDATES, text_partial.items(), key=lambda kv: kv[1])
+            text_partial = dict(best)
+            text_residual = best[-1][1]
+        timer.stage("complaint_candidates", started)
+
+    herb_candidates = set()
+    signature = None
+    if active["herbs"]:
+        started = time.perf_counter()
+        signature = prescription_lsh_service.compute_signature(query["herbs"])
+        herb_candidates = {rid for rid, _ in prescription_lsh_service.candidate_records(db, signature, HERB_CANDIDATES)}
+        timer.stage("herb_candidates", started)
+
+    candidates = set(pulse_exact) | set(text_partial) | herb_candidates
+    candidates.discard(exclude_record_id)
+
+    def upper_bound(rid: int) -> float:
+        bound = w["pulse"] * pulse_exact.get(rid, pulse_residual)
+        bound += w["complaint"] * (text_partial.get(rid, text_residual) + nonessential_bound)
+        # Records outside every LSH bucket are treated as dissimilar, as in find_similar
+        bound += w["herbs"] * (1.0 if rid in herb_candidates else 0.0)
+        bound += w["demographics"]
+        return bound
+
+    # --- Stage 2: exact scoring in bound order with early termination -------
+    started = time.perf_counter()
+    ordered = sorted(((upper_bound(rid), rid) for rid in candidates), reverse=True)
+    heap: List[Tuple[float, int, Dict[str, float]]] = []
+    scored = 0
+    position = 0
+    while position < len(ordered):
+        if len(heap) >= k and ordered[position][0] <= heap[0][0]:
+            break
+        batch = [rid for _, rid in ordered[position:position + SCORE_BATCH]]
+        position += len(batch)
+        scored += len(batch)
+
+        info_query = db.query(MedicalRecord.id, MedicalRecord.practitioner_id, Patient.gender, Patient.age)\
+            .outerjoin(Patient, Patient.id == MedicalRecord.patient_id)\
+            .filter(MedicalRecord.id.in_(batch))
+        info = {row.id: row for row in info_query.all()}
+
+        missing_pulse = [rid for rid in batch if rid not in pulse_exact] if active["pulse"] else []
+        pulse_probe = {}
+        if missing_pulse:
+            n_keys = len(query["pulse"])
+            pulse_probe = {rid: min(c, n_keys) / n_keys
+                           for rid, c in pulse_index_service.overlap_counts(db, query["pulse"], record_ids=missing_pulse)}
+
+        text_probe: Dict[int, float] = {}
+        if active["complaint"]:
+            probe_terms = list(term_idf) if any(rid not in text_partial for rid in batch) else nonessential
+            idf_total = sum(term_idf.values())
+            for term, rid in text_index_service.postings(db, probe_terms, record_ids=batch):
+                if term in nonessential or rid not in text_partial:
+                    text_probe[rid] = text_probe.get(rid, 0.0) + term_idf.get(term, 0.0) / idf_total
+
+        # As in upper_bound, only LSH candidates get a herbs score
+        herb_batch = [rid for rid in batch if rid in herb_candidates]
+        signatures = prescription_lsh_service.load_signatures(db, herb_batch) if herb_batch else {}
+
+        for rid in batch:
+            row = info.get(rid)
+            if row is None or (teacher_only and row.practitioner_id is None):
+                continue
+            signals = {
+                "pulse": pulse_exact.get(rid, pulse_probe.get(rid, 0.0)) if active["pulse"] else 0.0,
+                "complaint": (text_partial.get(rid, 0.0) + text_probe.get(rid, 0.0)) if active["complaint"] else 0.0,
+                "herbs": prescription_lsh_service.estimate_jaccard(signature, signatures[rid]) if rid in signatures else 0.0,
+                "demographics": _demographic_score(query, row.gender, row.age) if active["demographics"] else 0.0,
+            }
+            score = sum(w[s] * signals[s] for s in SIGNALS)
+            if score <= 0:
+                continue
+            entry = (score, -rid, signals)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry[:2] > heap[0][:2]:
+                heapq.heapreplace(heap, entry)
+    timer.stage("scoring", started)
+
+    # --- Hydrate the winners -------------------------------------------------
+    started = time.perf_counter()
+    top = sorted(heap, key=lambda e: (e[0], e[1]), reverse=True)
+    ids = [-neg_id for _, neg_id, _ in top]
+    rows = {}
+    if ids:
+        rows = {
+            r.id: r for r in db.query(MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint,
+                                      Patient.name.label("patient_name"))
+            .outerjoin(Patient, Patient.id == MedicalRecord.patient_id)
+            .filter(MedicalRecord.id.in_(ids))
+            .all()
+        }
+    results = []
+    for score, neg_id, signals in top:
+        row = rows.get(-neg_id)
+        if row is None:
+            continue
+        results.append({
+            "record_id": row.id,
+            "patient_name": row.patient_name or "Unknown",
+            "visit_date": row.visit_date.strftime("%Y-%m-%d") if row.visit_date else None,
+            "complaint": row.complaint,
+            "score": round(score, 4),
+            "signals": {s: round(v, 4) for s, v in signals.items() if active[s]},
+        })
+    timer.stage("hydrate", started)
+
+    response: Dict[str, Any] = {"results": results}
+    if debug:
+        response["debug"] = {
+            "stages": timer.stages,
+            "weights": {s: round(v, 4) for s, v in w.items() if v},
+            "candidates": len(candidates),
+            "scored": scored,
+            "pruned": len(candidates) - scored,
+        }
+    return response
@@ -0,0 +1,218 @@
+from typing import Dict, Any, List, Optional, Tuple
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+import yaml
+from src.services.keyword_automaton import KeywordAutomaton
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("fu", "zhong", "chen", "overall", "prescription", "complaint")
+
+# Grid keys per level in display order: for cun, guan, chi -> left, right, legacy
+LEVEL_KEYS = {
+    level: [f"{prefix}{pos}-{level}" for pos in ["cun", "guan", "chi"] for prefix in ["left-", "right-", ""]]
+    for level in ["fu", "zhong", "chen"]
+}
+
+class CompiledRuleSet:
+    """
+    A rule file compiled into a decision table.
+    All feature keywords share one automaton; each field is scanned once into a
+    bitmask, features become bits of one feature vector, and every pattern /
+    prescription row is a pair of mask tests over that vector.
+    """
+
+    def __init__(self, spec: Dict[str, Any], version: str):
+        self.version = version
+        features = spec.get("features") or {}
+        words = [w for clauses in features.values() for c in clauses for w in c["words"]]
+        self.automaton = KeywordAutomaton(words)
+
+        self.feature_names: List[str] = list(features.keys())
+        self.feature_bits = {name: 1 << i for i, name in enumerate(self.feature_names)}
+        self._features: List[Tuple[int, List[Tuple[str, int]]]] = []
+        used_fields = set()
+        for name, clauses in features.items():
+            compiled = []
+            for clause in clauses:
+                field = clause["field"]
+                if field not in FIELDS:
+                    raise ValueError(f"Feature '{name}': unknown field '{field}'")
+                used_fields.add(field)
+                compiled.append((field, self.automaton.mask(clause["words"])))
+            self._features.append((self.feature_bits[name], compiled))
+        self._used_fields = used_fields
+
+        self._patterns = [
+            (self._row_masks(p, f"pattern '{p.get('name')}'"), p["name"],
+             self._template(p.get("consistency_comment", "")), self._template(p.get("suggestion", "")))
+            for p in spec.get("patterns") or []
+        ]
+        default = spec.get("default") or {}
+        self._default = (default.get("name", "Unknown"),
+                         self._template(default.get("consistency_comment", "")),
+                         self._template(default.get("suggestion", "")))
+
+        rx = spec.get("prescription") or {}
+        self._rx_min_length = rx.get("min_length", 2)
+        self._rx_missing = rx.get("missing_comment", "")
+        self._rx_rules = [
+            (self._row_masks(r, "prescription rule"), r.get("pattern"), r.get("comment", ""))
+            for r in rx.get("rules") or []
+        ]
+
+    def _row_masks(self, row: Dict[str, Any], where: str) -> Tuple[int, int, int]:
+        masks = []
+        for key in ("all", "any", "none"):
+            m = 0
+            for name in row.get(key) or []:
+                if name not in self.feature_bits:
+                    raise ValueError(f"{where}: unknown feature '{name}'")
+                m |= self.feature_bits[name]
+            masks.append(m)
+        return tuple(masks)
+
+    @staticmethod
+    def _template(text: str) -> Tuple[str, bool]:
+        return text, "{" in text
+
+    @staticmethod
+    def _matches(fv: int, masks: Tuple[int, int, int]) -> bool:
+        all_m, any_m, none_m = masks
+        return (fv & all_m) == all_m and (not any_m or fv & any_m) and not fv & none_m
+
+    def evaluate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the decision table. Returns pattern, feature vector and the three comments."""
+        medical_record = data.get("medical_record", {})
+        pulse_grid = data.get("pulse_grid", {})
+        prescription = medical_record.get("prescription", "")
+        scan = self.automaton.scan
+
+        # 1. Shared feature extraction: one scan per field
+        qualities = {}
+        field_masks = {}
+        for level, keys in LEVEL_KEYS.items():
+            vals = []
+            mask = 0
+            for key in keys:
+                val = pulse_grid.get(key, "").strip()
+                if val:
+                    vals.append(val)
+                    mask |= scan(val)
+            qualities[level] = vals
+            field_masks[level] = mask
+        if "overall" in self._used_fields:
+            field_masks["overall"] = scan(pulse_grid.get("overall_description", "") or "")
+        if "prescription" in self._used_fields:
+            field_masks["prescription"] = scan(prescription or "")
+        if "complaint" in self._used_fields:
+            field_masks["complaint"] = scan(medical_record.get("complaint", "") or "")
+
+        fv = 0
+        for bit, clauses in self._features:
+            for field, mask in clauses:
+                if field_masks[field] & mask:
+                    fv |= bit
+                    break
+
+        # 2. Ordered decision table: first matching pattern wins
+        pattern, consistency, suggestion = self._default
+        for masks, name, comment, advice in self._patterns:
+            if self._matches(fv, masks):
+                pattern, consistency, suggestion = name, comment, advice
+                break
+
+        context = None
+        if consistency[1] or suggestion[1]:
+            context = {f"{level}_qualities": "/".join(vals) for level, vals in qualities.items()}
+
+        # 3. Prescription rules
+        if not prescription or len(prescription) < self._rx_min_length:
+            prescription_comment = self._rx_missing
+        else:
+            prescription_comment = ""
+            for masks, rule_pattern, comment in self._rx_rules:
+                if (rule_pattern is None or rule_pattern == pattern) and self._matches(fv, masks):
+                    prescription_comment = comment
+                    break
+
+        return {
+            "pattern": pattern,
+            "features": fv,
+            "consistency_comment": consistency[0].format(**context) if consistency[1] else consistency[0],
+            "prescription_comment": prescription_comment,
+            "suggestion": suggestion[0].format(**context) if suggestion[1] else suggestion[0],
+        }
+
+class RuleEngine:
+    """
+    Loads a YAML/JSON rule file and keeps it compiled.
+    The file's mtime is checked at most every check_interval seconds and the
+    rules are recompiled when it changes, so edits apply without restarting
+    uvicorn. Compiled rule sets are cached by content hash; a broken file is
+    logged and the previous rules stay active.
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0, cache_size: int = 8):
+        self.path = path
+        self.check_interval = check_interval
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, CompiledRuleSet]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._current: Optional[CompiledRuleSet] = None
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def current(self) -> CompiledRuleSet:
+        now = time.monotonic()
+        if self._current is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                if self._current is None or now - self._checked_at >= self.check_interval:
+                    self._checked_at = now
+                    self._reload_if_changed()
+        return self._current
+
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            if self._current is None:
+                raise
+            logger.error(f"Rule file unavailable, keeping rules {self._current.version}: {e}")
+            return
+        if mtime == self._mtime and self._current is not None:
+            return
+
+        with open(self.path, "rb") as f:
+            content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+        compiled = self._cache.get(digest)
+        if compiled is None:
+            try:
+                compiled = compile_rules(content, self.path, digest[:12])
+            except Exception as e:
+                if self._current is None:
+                    raise
+                logger.error(f"Invalid rule file {self.path}, keeping rules {self._current.version}: {e}")
+                self._mtime = mtime
+                return
+            self._cache[digest] = compiled
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            logger.info(f"Compiled analysis rules {compiled.version} from {self.path}")
+        else:
+            self._cache.move_to_end(digest)
+        self._current = compiled
+        self._mtime = mtime
+
+def compile_rules(content: bytes, path: str, version: str) -> CompiledRuleSet:
+    if path.endswith(".json"):
+        spec = json.loads(content.decode("utf-8"))
+    else:
+        spec = yaml.safe_load(content.decode("utf-8"))
+    return CompiledRuleSet(spec, version)
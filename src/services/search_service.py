@@ -1,9 +1,10 @@
 from typing import Dict, Any, List
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
-from sqlalchemy import or_, func
+from sqlalchemy import or_
 from src.database.models import Patient, MedicalRecord
 from src.database.connection import SessionLocal, SessionCloud
+from src.services import pinyin_service, summary_service, pulse_index_service, prescription_service, prescription_lsh_service, pulse_embedding_service
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,30 +20,35 @@ def _get_cloud_session():
 
 def _query_patients_by_date(db: Session, start, end, user_id: int = None) -> List[Dict[str, Any]]:
     """Helper to query patients from a single database session."""
-    query = db.query(MedicalRecord).join(Patient).filter(
-        func.date(MedicalRecord.visit_date) >= start,
-        func.date(MedicalRecord.visit_date) <= end
+    # Column projection (no record entities / data JSON) and a sargable
+    # visit_date range so the visit_date index is used.
+    query = db.query(
+        MedicalRecord.visit_date,
+        Patient.id, Patient.uuid, Patient.name, Patient.gender, Patient.age, Patient.phone
+    ).join(Patient, Patient.id == MedicalRecord.patient_id).filter(
+        MedicalRecord.visit_date >= datetime.combine(start, datetime.min.time()),
+        MedicalRecord.visit_date < datetime.combine(end + timedelta(days=1), datetime.min.time())
     )
     
     if user_id is not None:
         query = query.filter(MedicalRecord.user_id == user_id)
     
-    records = query.order_by(MedicalRecord.visit_date.desc()).all()
+    rows = query.order_by(MedicalRecord.visit_date.desc()).all()
+    summaries = summary_service.get_summaries(db, [r.id for r in rows])
     
     results = []
-    for r in records:
-        p = r.patient
-        if p:
-            results.append({
-                "uuid": p.uuid,  # Use UUID for deduplication
-                "id": p.id,
-                "name": p.name,
-                "gender": p.gender,
-                "age": p.age,
-                "phone": p.phone,
-                "last_visit": r.visit_date.strftime("%Y-%m-%d"),
-                "source": "local" if db == SessionLocal else "cloud"
-            })
+    for r in rows:
+        results.append({
+            "uuid": r.uuid,  # Use UUID for deduplication
+            "id": r.id,
+            "name": r.name,
+            "gender": r.gender,
+            "age": r.age,
+            "phone": r.phone,
+            "last_visit": r.visit_date.strftime("%Y-%m-%d"),
+            "visit_count": summaries.get(r.id, {}).get("visit_count", 0),
+            "source": "local" if db == SessionLocal else "cloud"
+        })
     return results
 
 def get_patients_by_date_range(db: Session, start_date_str: str = None, end_date_str: str = None, single_date_str: str = None, user_id: int = None) -> List[Dict[str, Any]]:
@@ -110,7 +116,8 @@ def _query_patients_by_name(db: Session, query_str: str, user_id: int = None) ->
     base_filter = or_(
         Patient.name.ilike(f"%{query_str}%"),
         Patient.phone.ilike(f"%{query_str}%"),
-        Patient.pinyin.ilike(f"%{query_str}%")
+        Patient.pinyin.ilike(f"%{query_str}%"),
+        pinyin_service.full_prefix_filter(query_str)
     )
     
     if user_id is not None:
@@ -125,18 +132,22 @@ def _query_patients_by_name(db: Session, query_str: str, user_id: int = None) ->
     else:
         patients = db.query(Patient).filter(base_filter).limit(20).all()
     
-    return [
-        {
+    summaries = summary_service.get_summaries(db, [p.id for p in patients])
+    results = []
+    for p in patients:
+        summary = summaries.get(p.id) or {}
+        last_visit = summary.get("last_visit")
+        results.append({
             "uuid": p.uuid,
             "id": p.id,
             "name": p.name,
             "gender": p.gender,
             "age": p.age,
             "phone": p.phone,
-            "last_visit": p.updated_at.strftime("%Y-%m-%d") if p.updated_at else None
-        }
-        for p in patients
-    ]
+            "last_visit": last_visit.strftime("%Y-%m-%d") if last_visit else None,
+            "visit_count": summary.get("visit_count", 0)
+        })
+    return results
 
 def search_patients(db: Session, query: str, user_id: int = None) -> List[Dict[str, Any]]:
     """
@@ -182,15 +193,26 @@ def search_similar_records(db: Session, current_grid: Dict[str, Any]) -> List[Di
     Search for similar medical records based on pulse grid.
     Only searches records that have a practitioner (teacher records) for learning reference.
     """
-    from src.database.models import Practitioner
-    
     if not current_grid:
         return []
     
-    # Only search records with a practitioner assigned (teacher's records)
-    candidates = db.query(MedicalRecord).filter(
+    # Only search records with a practitioner assigned (teacher's records).
+    # Candidates: the latest 200 plus the best term-overlap matches from pulse_cells.
+    # Only the pulse_grid sub-document is extracted, not the whole data JSON.
+    columns = (
+        MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint,
+        MedicalRecord.data["pulse_grid"].label("pulse_grid"), Patient.name.label("patient_name")
+    )
+    candidates = db.query(*columns).outerjoin(Patient, Patient.id == MedicalRecord.patient_id).filter(
         MedicalRecord.practitioner_id.isnot(None)
     ).order_by(MedicalRecord.created_at.desc()).limit(200).all()
+    seen_ids = {r.id for r in candidates}
+    indexed_ids = [rid for rid in pulse_index_service.candidate_record_ids(db, current_grid) if rid not in seen_ids]
+    if indexed_ids:
+        candidates += db.query(*columns).outerjoin(Patient, Patient.id == MedicalRecord.patient_id).filter(
+            MedicalRecord.id.in_(indexed_ids),
+            MedicalRecord.practitioner_id.isnot(None)
+        ).all()
     results = []
     
     base_positions = [
@@ -206,10 +228,10 @@ def search_similar_records(db: Session, current_grid: Dict[str, Any]) -> List[Di
     input_hand_prefix = "left-" if (has_left and not has_right) else "right-" if (has_right and not has_left) else None
     
     for record in candidates:
-        if not record.data or "pulse_grid" not in record.data:
+        if not isinstance(record.pulse_grid, dict):
             continue
             
-        candidate_grid = record.data["pulse_grid"]
+        candidate_grid = record.pulse_grid
         
         def calculate_score(prefix_a, prefix_b):
             sc = 0
@@ -258,10 +280,9 @@ def search_similar_records(db: Session, current_grid: Dict[str, Any]) -> List[Di
                 final_score += overlap * 2
                 
         if final_score > 0:
-            patient = record.patient
             results.append({
                 "record_id": record.id,
-                "patient_name": patient.name if patient else "Unknown",
+                "patient_name": record.patient_name or "Unknown",
                 "visit_date": record.visit_date.strftime("%Y-%m-%d"),
                 "score": final_score,
                 "pulse_grid": candidate_grid,
@@ -271,3 +292,93 @@ def search_similar_records(db: Session, current_grid: Dict[str, Any]) -> List[Di
             
     results.sort(key=lambda x: x["score"], reverse=True)
     return results[:5]
+
+def search_similar_records_semantic(db: Session, current_grid: Dict[str, Any], k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Teacher records nearest to a pulse grid by embedding similarity (pulse
+    embedding ANN index), so differently worded but similar cells still match.
+    Same result shape as search_similar_records; score is the cosine similarity.
+    """
+    if not current_grid:
+        return []
+    # Oversample: personal records are filtered out after the index lookup
+    matches = pulse_embedding_service.find_similar(db, current_grid, limit=k * 5)
+    if not matches:
+        return []
+    rows = db.query(
+        MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint,
+        MedicalRecord.data["pulse_grid"].label("pulse_grid"), Patient.name.label("patient_name")
+    ).outerjoin(Patient, Patient.id == MedicalRecord.patient_id).filter(
+        MedicalRecord.id.in_([rid for rid, _ in matches]),
+        MedicalRecord.practitioner_id.isnot(None)
+    ).all()
+    rows = {r.id: r for r in rows}
+    results = []
+    for rid, score in matches:
+        if score <= 0:
+            break
+        record = rows.get(rid)
+        if record is None or not isinstance(record.pulse_grid, dict):
+            continue
+        results.append({
+            "record_id": record.id,
+            "patient_name": record.patient_name or "Unknown",
+            "visit_date": record.visit_date.strftime("%Y-%m-%d") if record.visit_date else None,
+            "score": round(min(score, 1.0), 3),  # int8 rounding can overshoot 1
+            "pulse_grid": record.pulse_grid,
+            "matches": pulse_embedding_service.matching_cells(current_grid, record.pulse_grid),
+            "complaint": record.complaint
+        })
+        if len(results) >= k:
+            break
+    return results
+
+def search_records_by_pulse(db: Session, criteria: List[Dict[str, str]], limit: int = 200) -> List[Dict[str, Any]]:
+    """Records matching all pulse criteria, answered from the pulse_cells index."""
+    record_ids = pulse_index_service.find_record_ids_by_pulse(db, criteria, limit=limit)
+    return _record_rows(db, record_ids)
+
+def search_records_by_herbs(db: Session, include: List[str], exclude: List[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """Records whose prescription has all include herbs and no exclude herbs (prescription_items index)."""
+    record_ids = prescription_service.find_record_ids_by_herbs(db, include, exclude, limit=limit)
+    return _record_rows(db, record_ids)
+
+def search_similar_prescriptions(db: Session, prescription: str = None, record_id: int = None, k: int = 20) -> List[Dict[str, Any]]:
+    """
+    Past records whose herb set is most similar to a prescription text or to a
+    stored record's prescription, ranked by MinHash-estimated Jaccard similarity.
+    """
+    if record_id is not None:
+        herbs = prescription_service.record_herbs(db, record_id)
+    elif prescription:
+        herbs = {item["herb"] for item in prescription_service.parse_prescription(prescription)}
+    else:
+        raise ValueError("prescription or record_id is required")
+    matches = prescription_lsh_service.find_similar(db, herbs, k=k, exclude_record_id=record_id)
+    if not matches:
+        return []
+    similarity = dict(matches)
+    rows = {row["record_id"]: row for row in _record_rows(db, list(similarity))}
+    results = []
+    for rid, score in matches:
+        if rid in rows:
+            results.append(dict(rows[rid], similarity=round(score, 3)))
+    return results
+
+def _record_rows(db: Session, record_ids: List[int]) -> List[Dict[str, Any]]:
+    if not record_ids:
+        return []
+    rows = db.query(MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.complaint, Patient.name)\
+        .join(Patient, Patient.id == MedicalRecord.patient_id)\
+        .filter(MedicalRecord.id.in_(record_ids))\
+        .order_by(MedicalRecord.visit_date.desc())\
+        .all()
+    return [
+        {
+            "record_id": rid,
+            "patient_name": name,
+            "visit_date": visit_date.strftime("%Y-%m-%d") if visit_date else None,
+            "complaint": complaint
+        }
+        for rid, visit_date, complaint, name in rows
+    ]
@@ -0,0 +1,137 @@
+from typing import Dict, Any, Iterable, Tuple
+import json
+import zlib
+from sqlalchemy.orm import Session
+from src.database.models import RecordPayload
+
+# Keys moved out of medical_records.data into record_payloads
+COLD_KEYS = ("raw_input", "raw_data")
+# Keys of raw_input that are already stored as hot fields of the record
+_HOT_DUPLICATES = ("medical_record", "pulse_grid")
+
+def encode_payload(obj: Dict[str, Any]) -> Tuple[str, bytes]:
+    """Serialize and compress with zlib; returns (encoding, blob)."""
+    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return "zlib", zlib.compress(raw, 9)
+
+def decode_payload(encoding: str, blob: bytes) -> Dict[str, Any]:
+    if encoding != "zlib":
+        raise ValueError(f"Unknown record payload encoding: {encoding}")
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def split_record_data(data: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Split a record's data dict into (hot, cold).
+    Hot stays in medical_records.data; cold goes to record_payloads. The copies of
+    medical_record / pulse_grid inside raw_input are dropped and restored on read.
+    """
+    hot = {k: v for k, v in (data or {}).items() if k not in COLD_KEYS}
+    cold = {}
+    raw_input = (data or {}).get("raw_input")
+    if isinstance(raw_input, dict):
+        residual = {k: v for k, v in raw_input.items() if k not in _HOT_DUPLICATES}
+        if residual:
+            cold["raw_input"] = residual
+    raw_data = (data or {}).get("raw_data")
+    if raw_data:
+        cold["raw_data"] = raw_data
+    return hot, cold
+
+def store_payloads(db: Session, payloads: Dict[int, Dict[str, Any]]) -> None:
+    """
+    Upsert cold payloads keyed by record id (rows are updated in place so their
+    uuid stays stable for sync). Empty payloads are skipped.
+    """
+    payloads = {rid: cold for rid, cold in payloads.items() if cold}
+    if not payloads:
+        return
+    existing = {
+        p.record_id: p
+        for p in db.query(RecordPayload).filter(RecordPayload.record_id.in_(list(payloads.keys()))).all()
+    }
+    inserts = []
+    for record_id, cold in payloads.items():
+        encoding, blob = encode_payload(cold)
+        row = existing.get(record_id)
+        if row:
+            row.encoding = encoding
+            row.payload = blob
+            row.sync_status = 'pending'
+        else:
+            inserts.append({"record_id": record_id, "encoding": encoding, "payload": blob})
+    if inserts:
+        db.bulk_insert_mappings(RecordPayload, inserts)
+
+def store_payload(db: Session, record_id: int, cold: Dict[str, Any]) -> None:
+    store_payloads(db, {record_id: cold})
+
+def load_payload(db: Session, record_id: int) -> Dict[str, Any]:
+    """Lazily load and decompress the cold part of one record."""
+    row = db.query(RecordPayload.encoding, RecordPayload.payload)\
+        .filter(RecordPayload.record_id == record_id)\
+        .first()
+    if not row:
+        return {}
+    return decode_payload(row.encoding, row.payload)
+
+def load_payloads(db: Session, record_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """Cold parts of many records with one IN query, keyed by record id."""
+    record_ids = list(record_ids)
+    if not record_ids:
+        return {}
+    rows = db.query(RecordPayload.record_id, RecordPayload.encoding, RecordPayload.payload)\
+        .filter(RecordPayload.record_id.in_(record_ids))\
+        .all()
+    return {rid: decode_payload(encoding, blob) for rid, encoding, blob in rows}
+
+def load_full_record_data(db: Session, record_id: int, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Hot data merged with its cold payload, with raw_input restored to its original shape."""
+    full = dict(data or {})
+    cold = load_payload(db, record_id)
+    if "raw_input" in cold:
+        raw_input = dict(cold["raw_input"])
+        for key in _HOT_DUPLICATES:
+            if key in full:
+                raw_input[key] = full[key]
+        full["raw_input"] = raw_input
+    if "raw_data" in cold:
+        full["raw_data"] = cold["raw_data"]
+    return full
+
+def delete_payloads(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if record_ids:
+        db.query(RecordPayload).filter(RecordPayload.record_id.in_(record_ids)).delete(synchronize_session=False)
+
+def migrate_record_storage(db: Session, chunk_size: int = 500) -> int:
+    """
+    Rewrite existing rows into the split format: cold keys move to record_payloads
+    and the record is marked pending so the slimmer data syncs up. Returns rows rewritten.
+    """
+    from src.database.models import MedicalRecord
+
+    rewritten = 0
+    last_id = 0
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.data)\
+            .filter(MedicalRecord.id > last_id)\
+            .order_by(MedicalRecord.id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        payloads = {}
+        updates = []
+        for record_id, data in rows:
+            if not data or not any(k in data for k in COLD_KEYS):
+                continue
+            hot, cold = split_record_data(data)
+            payloads[record_id] = cold
+            updates.append({"id": record_id, "data": hot, "sync_status": "pending"})
+        if updates:
+            db.bulk_update_mappings(MedicalRecord, updates)
+            store_payloads(db, payloads)
+        db.commit()
+        rewritten += len(updates)
+        last_id = rows[-1][0]
+    return rewritten
@@ -0,0 +1,126 @@
+from typing import Dict, Any, Iterable, List
+from datetime import datetime
+from sqlalchemy.orm import Session
+from sqlalchemy import func, inspect
+from src.database.models import MedicalRecord, PatientSummary
+
+# Cloud databases may not carry the local-only projection table
+_table_present: Dict[str, bool] = {}
+
+def _has_summary_table(db: Session) -> bool:
+    bind = db.get_bind()
+    key = str(bind.url)
+    if key not in _table_present:
+        _table_present[key] = inspect(bind).has_table(PatientSummary.__tablename__)
+    return _table_present[key]
+
+def _compute_summaries(db: Session, patient_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Aggregate visit counts and the latest record for a set of patients (two queries)."""
+    summaries = {}
+    counts = db.query(MedicalRecord.patient_id, func.count(MedicalRecord.id))\
+        .filter(MedicalRecord.patient_id.in_(patient_ids))\
+        .group_by(MedicalRecord.patient_id)\
+        .all()
+    for patient_id, count in counts:
+        summaries[patient_id] = {
+            "patient_id": patient_id,
+            "latest_record_id": None,
+            "last_visit": None,
+            "visit_count": count,
+            "last_practitioner_id": None,
+        }
+
+    # Latest record = latest visit_date, newest id breaking ties
+    rows = db.query(MedicalRecord.patient_id, MedicalRecord.id, MedicalRecord.visit_date, MedicalRecord.practitioner_id)\
+        .filter(MedicalRecord.patient_id.in_(patient_ids))\
+        .order_by(MedicalRecord.patient_id, MedicalRecord.visit_date.desc(), MedicalRecord.id.desc())\
+        .all()
+    for patient_id, record_id, visit_date, practitioner_id in rows:
+        summary = summaries[patient_id]
+        if summary["latest_record_id"] is None:
+            summary["latest_record_id"] = record_id
+            summary["last_visit"] = visit_date
+            summary["last_practitioner_id"] = practitioner_id
+    return summaries
+
+def refresh_patient_summaries(db: Session, patient_ids: Iterable[int]) -> None:
+    """
+    Recompute the projection rows for the given patients.
+    Runs inside the caller's transaction; the caller commits.
+    """
+    patient_ids = [pid for pid in set(patient_ids) if pid is not None]
+    if not patient_ids:
+        return
+    db.flush()
+    summaries = _compute_summaries(db, patient_ids)
+    now = datetime.now()
+    db.query(PatientSummary).filter(PatientSummary.patient_id.in_(patient_ids))\
+        .delete(synchronize_session=False)
+    rows = []
+    for pid in patient_ids:
+        row = summaries.get(pid) or {
+            "patient_id": pid,
+            "latest_record_id": None,
+            "last_visit": None,
+            "visit_count": 0,
+            "last_practitioner_id": None,
+        }
+        row["updated_at"] = now
+        rows.append(row)
+    db.bulk_insert_mappings(PatientSummary, rows)
+
+def rebuild_patient_summaries(db: Session, chunk_size: int = 1000) -> int:
+    """Rebuild the whole projection from medical_records. Returns the number of patients."""
+    from src.database.models import Patient
+
+    db.query(PatientSummary).delete(synchronize_session=False)
+    total = 0
+    last_id = 0
+    while True:
+        ids = [pid for (pid,) in db.query(Patient.id)
+               .filter(Patient.id > last_id)
+               .order_by(Patient.id)
+               .limit(chunk_size)
+               .all()]
+        if not ids:
+            break
+        refresh_patient_summaries(db, ids)
+        db.commit()
+        total += len(ids)
+        last_id = ids[-1]
+    return total
+
+def get_summaries(db: Session, patient_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Read summaries for a page of patients with a single IN query.
+    Falls back to an aggregate over medical_records where the projection
+    table does not exist (e.g. the cloud database) or has no row for a
+    patient. Never writes: the projection is kept fresh by the write paths
+    (refresh_patient_summaries) and scripts/rebuild_patient_summary.py.
+    """
+    patient_ids = [pid for pid in set(patient_ids) if pid is not None]
+    if not patient_ids:
+        return {}
+    if not _has_summary_table(db):
+        return _compute_summaries(db, patient_ids)
+
+    rows = db.query(PatientSummary).filter(PatientSummary.patient_id.in_(patient_ids)).all()
+    summaries = {
+        s.patient_id: {
+            "patient_id": s.patient_id,
+            "latest_record_id": s.latest_record_id,
+            "last_visit": s.last_visit,
+            "visit_count": s.visit_count,
+            "last_practitioner_id": s.last_practitioner_id,
+        }
+        for s in rows
+    }
+    missing = [pid for pid in patient_ids if pid not in summaries]
+    if missing:
+        # Projection not built for these patients (e.g. before rebuild_patient_summary.py ran)
+        summaries.update(_compute_summaries(db, missing))
+    return summaries
+
+def get_patient_summary(db: Session, patient_id: int) -> Dict[str, Any]:
+    """Summary for one patient (primary key lookup)."""
+    return get_summaries(db, [patient_id]).get(patient_id)
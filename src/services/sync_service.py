@@ -1,8 +1,10 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import text
+from sqlalchemy.orm import undefer
 from datetime import datetime
 from src.database.connection import SessionLocal, SessionCloud
-from src.database.models import User, Patient, Practitioner, MedicalRecord
+from src.database.models import User, Patient, Practitioner, MedicalRecord, RecordPayload, SyncTombstone
+from src.services import auth_service, pinyin_service, summary_service, pulse_index_service, pattern_stats_service, prescription_service, storage_service, text_index_service, pulse_embedding_service
 import logging
 
 # Configure logging
@@ -18,7 +20,7 @@ class SyncService:
     - Sync Down: Pulls new/updated records from Cloud (optional, depending on requirement).
     """
 
-    MODELS_ORDER = [User, Practitioner, Patient, MedicalRecord]
+    MODELS_ORDER = [User, Practitioner, Patient, MedicalRecord, RecordPayload]
 
     def __init__(self):
         pass
@@ -70,7 +72,7 @@ class SyncService:
             # 1. Iterate through models in dependency order
             for model in self.MODELS_ORDER:
                 # Find pending records
-                pending_records = local_db.query(model).filter(
+                pending_records = local_db.query(model).options(undefer("*")).filter(
                     (model.sync_status == 'pending') | (model.sync_status == 'failed')
                 ).all()
 
@@ -87,6 +89,22 @@ class SyncService:
                         results["failed"] += 1
                         results["details"].append(f"UP:{model.__tablename__}:{record.id} - {str(e)}")
 
+            # 2. Apply local removals (merged duplicates) once their replacements are in the cloud
+            tombstones = local_db.query(SyncTombstone).filter(
+                (SyncTombstone.sync_status == 'pending') | (SyncTombstone.sync_status == 'failed')
+            ).order_by(SyncTombstone.id).all()
+            for tombstone in tombstones:
+                try:
+                    self._sync_tombstone_up(local_db, cloud_db, tombstone)
+                    results["synced"] += 1
+                except Exception as e:
+                    logger.error(f"Failed to sync tombstone {tombstone.table_name} {tombstone.uuid}: {e}")
+                    cloud_db.rollback()
+                    tombstone.sync_status = 'failed'
+                    local_db.commit()
+                    results["failed"] += 1
+                    results["details"].append(f"UP:tombstone:{tombstone.uuid} - {str(e)}")
+
         except ConnectionError as e:
             logger.error(f"Sync aborted: {e}")
             return {"status": "error", "message": "Cloud connection unavailable"}
@@ -112,16 +130,19 @@ class SyncService:
 
         try:
             cloud_db = self.get_cloud_db()
+            touched_patients = set()
+            touched_rollups = set()
+            touched_records = set()
             
-            # Iterate: User -> Practitioner -> Patient -> MedicalRecord
+            # Iterate: User -> Practitioner -> Patient -> MedicalRecord -> RecordPayload
             for model in self.MODELS_ORDER:
                 # Get all records from Cloud (ignoring deleted for now)
                 # Optimization needed for production!
-                cloud_records = cloud_db.query(model).filter(model.is_deleted == False).all()
+                cloud_records = cloud_db.query(model).options(undefer("*")).filter(model.is_deleted == False).all()
                 
                 for cloud_record in cloud_records:
                     try:
-                        self._sync_record_down(local_db, cloud_db, model, cloud_record)
+                        self._sync_record_down(local_db, cloud_db, model, cloud_record, touched_patients, touched_rollups, touched_records)
                         results["synced"] += 1
                     except Exception as e:
                         logger.error(f"Failed to pull {model.__tablename__} {cloud_record.uuid}: {e}")
@@ -129,6 +150,13 @@ class SyncService:
                             local_db.rollback()
                         results["failed"] += 1
                         results["details"].append(f"DOWN:{model.__tablename__} - {str(e)}")
+
+            # Keep the local projections in step with pulled records
+            summary_service.refresh_patient_summaries(local_db, touched_patients)
+            pattern_stats_service.refresh_pattern_rollups(local_db, touched_rollups)
+            # Prescriptions are parsed once both the record and its payload are local
+            self._reindex_prescriptions(local_db, touched_records)
+            local_db.commit()
                         
         except Exception as e:
             logger.error(f"Sync Down error: {e}")
@@ -140,12 +168,19 @@ class SyncService:
         
         return {"status": "completed", "data": results}
 
-    def _sync_record_down(self, local_db: Session, cloud_db: Session, model, cloud_record):
+    def _sync_record_down(self, local_db: Session, cloud_db: Session, model, cloud_record, touched_patients: set = None,
+                          touched_rollups: set = None, touched_records: set = None):
         """
         Sync a single record from Cloud to Local.
         Handles cases where local record exists with different UUID but same unique field.
+        Patient ids affected by a pulled MedicalRecord are added to touched_patients,
+        its pattern rollup keys (before and after) to touched_rollups, and the ids of
+        pulled records and payloads' records to touched_records.
         """
-        local_record = local_db.query(model).filter(model.uuid == cloud_record.uuid).first()
+        local_record = local_db.query(model).options(undefer("*")).filter(model.uuid == cloud_record.uuid).first()
+
+        if not local_record and self._tombstone(local_db, model, cloud_record.uuid):
+            return  # Removed locally (e.g. merged into another patient); do not pull it back
         
         if not local_record:
             # Try to find by unique fields before creating new record
@@ -168,6 +203,11 @@ class SyncService:
             # Assuming 'Offline First' means user entered data is sacred in conflict.
             return 
 
+        if model == MedicalRecord and touched_patients is not None and local_record.patient_id:
+            touched_patients.add(local_record.patient_id)
+        if model == MedicalRecord and touched_rollups is not None and local_record.visit_date:
+            touched_rollups.add((local_record.practitioner_id, pattern_stats_service.month_of(local_record.visit_date)))
+
         # Update attributes
         for column in model.__table__.columns:
             if column.name in ['id', 'metadata', 'sync_status']: 
@@ -181,7 +221,42 @@ class SyncService:
         
         local_record.sync_status = 'synced'
         local_record.last_synced_at = datetime.now()
+        if model == Patient and not (local_record.pinyin and local_record.pinyin_full):
+            # Cloud rows written by older clients may lack the search columns
+            for column, value in pinyin_service.pinyin_fields(local_record.name).items():
+                setattr(local_record, column, value)
+        if model == MedicalRecord:
+            # Classify with the local rule set rather than trusting the cloud copy
+            pattern_stats_service.classify_record(local_record)
+            local_db.flush()
+            pulse_index_service.write_pulse_cells(local_db, local_record.id, (local_record.data or {}).get("pulse_grid") or {})
+            pulse_embedding_service.write_embeddings(local_db, {local_record.id: (local_record.data or {}).get("pulse_grid") or {}})
         local_db.commit()
+        if model == User:
+            auth_service.invalidate_user(local_record.id)  # Role / activation may have changed in the cloud
+
+        if model == MedicalRecord and touched_patients is not None and local_record.patient_id:
+            touched_patients.add(local_record.patient_id)
+        if model == MedicalRecord and touched_rollups is not None and local_record.visit_date:
+            touched_rollups.add((local_record.practitioner_id, pattern_stats_service.month_of(local_record.visit_date)))
+        if touched_records is not None:
+            if model == MedicalRecord:
+                touched_records.add(local_record.id)
+            elif model == RecordPayload and local_record.record_id:
+                touched_records.add(local_record.record_id)
+
+    def _reindex_prescriptions(self, local_db: Session, record_ids: set):
+        """Rebuild prescription_items and complaint_terms for pulled records from their data and payloads."""
+        record_ids = list(record_ids)
+        for i in range(0, len(record_ids), 500):
+            chunk = record_ids[i:i + 500]
+            rows = local_db.query(MedicalRecord.id, MedicalRecord.data, MedicalRecord.complaint)\
+                .filter(MedicalRecord.id.in_(chunk)).all()
+            payloads = storage_service.load_payloads(local_db, chunk)
+            prescription_service.write_prescription_items_bulk(local_db, {
+                rid: prescription_service.prescription_texts(data, payloads.get(rid)) for rid, data, _ in rows
+            })
+            text_index_service.write_complaint_terms_bulk(local_db, {rid: complaint for rid, _, complaint in rows})
 
     def _find_local_by_unique_fields(self, local_db: Session, model, cloud_record):
         """
@@ -220,6 +295,7 @@ class SyncService:
         if fk_column == 'user_id': related_model = User
         elif fk_column == 'patient_id': related_model = Patient
         elif fk_column == 'practitioner_id': related_model = Practitioner
+        elif fk_column == 'record_id': related_model = MedicalRecord
         
         if not related_model: return
 
@@ -227,8 +303,12 @@ class SyncService:
         cloud_related = cloud_db.query(related_model).filter(related_model.id == cloud_fk_id).first()
         if not cloud_related: return
         
-        # UUID -> Local Related
+        # UUID -> Local Related (following a tombstone if the row was merged away locally)
         local_related = local_db.query(related_model).filter(related_model.uuid == cloud_related.uuid).first()
+        if not local_related:
+            tombstone = self._tombstone(local_db, related_model, cloud_related.uuid)
+            if tombstone and tombstone.replaced_by_uuid:
+                local_related = local_db.query(related_model).filter(related_model.uuid == tombstone.replaced_by_uuid).first()
         
         if local_related:
             setattr(local_record, fk_column, local_related.id)
@@ -237,13 +317,40 @@ class SyncService:
             # In simple loop, dependencies should come first. This implies strict order issues.
             pass
 
+    def _tombstone(self, local_db: Session, model, uuid):
+        return local_db.query(SyncTombstone).filter(
+            SyncTombstone.table_name == model.__tablename__,
+            SyncTombstone.uuid == uuid
+        ).first()
+
+    def _sync_tombstone_up(self, local_db: Session, cloud_db: Session, tombstone):
+        """
+        Soft-delete the cloud copy of a row removed locally. For a merged
+        patient, cloud records still pointing at it are moved to the patient it
+        was merged into first.
+        """
+        model = next(m for m in self.MODELS_ORDER if m.__tablename__ == tombstone.table_name)
+        cloud_row = cloud_db.query(model).filter(model.uuid == tombstone.uuid).first()
+        if cloud_row:
+            if model == Patient and tombstone.replaced_by_uuid:
+                replacement = cloud_db.query(Patient.id).filter(Patient.uuid == tombstone.replaced_by_uuid).first()
+                if not replacement:
+                    raise ValueError(f"Replacement {tombstone.replaced_by_uuid} not in cloud yet")
+                cloud_db.query(MedicalRecord)\
+                    .filter(MedicalRecord.patient_id == cloud_row.id)\
+                    .update({"patient_id": replacement.id}, synchronize_session=False)
+            cloud_row.is_deleted = True
+            cloud_db.commit()
+        tombstone.sync_status = 'synced'
+        local_db.commit()
+
     def _sync_record_up(self, local_db: Session, cloud_db: Session, model, record):
         """
         Sync a single record from Local to Cloud.
         Uses UUID to find existing record in Cloud.
         """
         # 1. Check if record exists in Cloud by UUID
-        cloud_record = cloud_db.query(model).filter(model.uuid == record.uuid).first()
+        cloud_record = cloud_db.query(model).options(undefer("*")).filter(model.uuid == record.uuid).first()
 
         if not cloud_record:
             # Create new in Cloud
@@ -294,6 +401,7 @@ class SyncService:
         if fk_column == 'user_id': related_model = User
         elif fk_column == 'patient_id': related_model = Patient
         elif fk_column == 'practitioner_id': related_model = Practitioner
+        elif fk_column == 'record_id': related_model = MedicalRecord
         
         if not related_model:
             return # Cannot resolve, leave as is (might fail FK constraint if IDs don't match)
@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import math
+import re
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from src.database.models import MedicalRecord, ComplaintTerm
+
+# Complaints are short Chinese phrases ("头痛三天，畏寒"), so they are indexed as
+# overlapping character bigrams; ASCII words are indexed whole.
+_CJK_RUN = re.compile(r"[一-鿿]+")
+_WORD = re.compile(r"[A-Za-z0-9]+")
+
+def complaint_terms(text: Optional[str]) -> Set[str]:
+    """Index terms of a complaint: CJK bigrams (single chars for 1-char runs) and ASCII words."""
+    terms = set()
+    if not text:
+        return terms
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            terms.add(run)
+        else:
+            terms.update(run[i:i + 2] for i in range(len(run) - 1))
+    terms.update(w.lower() for w in _WORD.findall(text))
+    return terms
+
+def write_complaint_terms_bulk(db: Session, complaints: Dict[int, Optional[str]]) -> None:
+    """Replace the complaint postings of many records. Runs in the caller's transaction."""
+    if not complaints:
+        return
+    delete_complaint_terms(db, complaints.keys())
+    rows = [
+        {"term": term, "record_id": record_id}
+        for record_id, text in complaints.items()
+        for term in complaint_terms(text)
+    ]
+    if rows:
+        db.bulk_insert_mappings(ComplaintTerm, rows)
+
+def write_complaint_terms(db: Session, record_id: int, complaint: Optional[str]) -> None:
+    write_complaint_terms_bulk(db, {record_id: complaint})
+
+def delete_complaint_terms(db: Session, record_ids: Iterable[int]) -> None:
+    record_ids = list(record_ids)
+    if record_ids:
+        db.query(ComplaintTerm).filter(ComplaintTerm.record_id.in_(record_ids)).delete(synchronize_session=False)
+
+def backfill_complaint_terms(db: Session, chunk_size: int = 1000) -> int:
+    """Rebuild complaint_terms from medical_records.complaint in id-ordered chunks."""
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.query(MedicalRecord.id, MedicalRecord.complaint)\
+            .filter(MedicalRecord.id > last_id)\
+            .order_by(MedicalRecord.id)\
+            .limit(chunk_size)\
+            .all()
+        if not rows:
+            break
+        write_complaint_terms_bulk(db, dict(rows))
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1][0]
+    return total
+
+def term_weights(db: Session, terms: Iterable[str]) -> Dict[str, Tuple[float, int]]:
+    """
+    idf weight and document frequency per query term, from one grouped query
+    over the (term, record_id) index. Terms that occur nowhere are dropped.
+    The collection size is approximated by the highest record id.
+    """
+    terms = list(set(terms))
+    if not terms:
+        return {}
+    total = db.query(func.max(MedicalRecord.id)).scalar() or 0
+    rows = db.query(ComplaintTerm.term, func.count(ComplaintTerm.record_id))\
+        .filter(ComplaintTerm.term.in_(terms))\
+        .group_by(ComplaintTerm.term)\
+        .all()
+    return {
+        term: (math.log(1 + (total - df + 0.5) / (df + 0.5)), df)
+        for term, df in rows if df > 0
+    }
+
+def postings(db: Session, terms: Iterable[str], record_ids: Iterable[int] = None) -> List[Tuple[str, int]]:
+    """(term, record_id) postings for the terms, optionally restricted to some records."""
+    terms = list(terms)
+    if not terms:
+        return []
+    query = db.query(ComplaintTerm.term, ComplaintTerm.record_id).filter(ComplaintTerm.term.in_(terms))
+    if record_ids is not None:
+        query = query.filter(ComplaintTerm.record_id.in_(list(record_ids)))
+    return query.all()
@@ -0,0 +1,187 @@
+from typing import Any, Optional
+import hashlib
+import zlib
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+
+# Response plumbing for the web app: orjson rendering, negotiated gzip/brotli
+# compression and ETag revalidation.
+
+# orjson when available (as for the JSON columns), stdlib json otherwise
+try:
+    import orjson
+
+    def _dumps(content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+except ImportError:
+    import json
+
+    def _dumps(content: Any) -> bytes:
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+class FastJSONResponse(JSONResponse):
+    """Default response class: same output as JSONResponse, rendered with orjson."""
+
+    def render(self, content: Any) -> bytes:
+        return _dumps(content)
+
+# --- ETags ---
+# Endpoints either derive the tag from row versions (count / max(updated_at)),
+# which lets a matching request skip building the payload, or hash the
+# rendered body when the data has no cheap version (e.g. merged cloud rows).
+CACHE_CONTROL = "private, no-cache"  # Clients may keep the body but must revalidate
+
+def make_etag(*parts: Any) -> str:
+    """Strong ETag from version parts (ids, counts, timestamps...)."""
+    return '"' + hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+def _strip_tag(tag: str) -> str:
+    """Undo what CompressionMiddleware and weak validators add to a tag."""
+    tag = tag.strip().removeprefix("W/")
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[:-len(suffix) - 1] + '"'
+    return tag
+
+def _matching_tag(request: Request, etag: str) -> Optional[str]:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() == "*":
+        return etag
+    return next((tag.strip() for tag in header.split(",") if _strip_tag(tag) == etag), None)
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 specifies for it)."""
+    return _matching_tag(request, etag) is not None
+
+def not_modified(request: Request, etag: str) -> Response:
+    """304 echoing the tag the client sent (it may carry an encoding suffix)."""
+    return Response(status_code=304, headers={"ETag": _matching_tag(request, etag) or etag,
+                                              "Cache-Control": CACHE_CONTROL})
+
+def cached_json(request: Request, content: Any, etag: Optional[str] = None) -> Response:
+    """
+    JSON response with an ETag, or 304 if the client already has it. Without
+    etag the tag is a hash of the rendered body.
+    """
+    body = _dumps(content)
+    if etag is None:
+        etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    if etag_matches(request, etag):
+        return not_modified(request, etag)
+    return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+# --- Compression ---
+# A compressed body is a different representation, so its strong ETag gets
+# the encoding appended ("abc" -> "abc-br"); etag_matches strips it again.
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+def _accepted_encoding(accept_encoding: str) -> Optional[str]:
+    """br if accepted and brotli is installed, else gzip if accepted."""
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in (("br",) if brotli is not None else ()) + ("gzip",):
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+            self._zlib = None
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        if self._brotli is not None:
+            out = self._brotli.process(data)
+            return out + (self._brotli.finish() if last else self._brotli.flush())
+        out = self._zlib.compress(data)
+        return out + self._zlib.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+class CompressionMiddleware:
+    """
+    Compresses responses with br or gzip, as negotiated by Accept-Encoding.
+    Bodies under minimum_size, already encoded responses and event streams
+    are passed through; streamed bodies are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = _accepted_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = Headers(raw=message["headers"])
+                passthrough = ("content-encoding" in headers
+                               or headers.get("content-type", "").startswith("text/event-stream")
+                               or message["status"] in (204, 304))
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag and etag.endswith('"'):
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    body = compressor.compress(body, last=True)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body})
+                    return
+                await send(start_message)
+            await send({"type": "http.response.body", "body": compressor.compress(body, last=not more_body),
+                        "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,34 +1,58 @@
 import sys
 import os
+import json
+import zlib
+import asyncio
 from typing import Dict, Any
 
-from fastapi import FastAPI, Request, Depends, HTTPException, Query, status
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi import FastAPI, Request, Depends, HTTPException, Query, Body, status
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, text
 from uuid import uuid4
 import uvicorn
-from pypinyin import lazy_pinyin, Style
 
 # Ensure src is in python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.data_preparation.validator import DataValidator
-from src.database.connection import engine, Base, get_db
+from src.database.connection import engine, Base, get_db, SessionLocal
+from src.database import schema
 from fastapi.security import OAuth2PasswordRequestForm
-from src.services import analysis_service, record_service, search_service, auth_service
+from src.services import analysis_service, record_service, search_service, auth_service, summary_service, pulse_index_service, storage_service, reanalysis_service, pattern_stats_service, prescription_service, text_index_service, retrieval_service, pulse_embedding_service, import_service, import_job_service, change_service
 from src.database.models import Patient, MedicalRecord, Practitioner, User
+from src.utils import http
 
 # Create tables if they don't exist
 # Note: In production, use Alembic for migrations
 try:
     Base.metadata.create_all(bind=engine)
+    schema.ensure_columns(engine)
 except Exception as e:
     print(f"Warning: Could not connect to database to create tables. Please ensure PostgreSQL is running. Error: {e}")
 
-app = FastAPI(title="中医脉象九宫格OCR识别系统")
+app = FastAPI(title="中医脉象九宫格OCR识别系统", default_response_class=http.FastJSONResponse)
+app.add_middleware(http.CompressionMiddleware, minimum_size=int(os.getenv("COMPRESS_MIN_SIZE", "1024")))
+
+@app.on_event("startup")
+def install_change_log():
+    # Triggers feeding /api/changes; the first run logs every existing row
+    change_service.ensure_change_log(engine)
+
+@app.on_event("startup")
+def recover_import_jobs():
+    # Jobs queued or running when the server stopped can be resumed by the user
+    db = SessionLocal()
+    try:
+        import_job_service.recover_jobs(db)
+    finally:
+        db.close()
+
+@app.on_event("shutdown")
+def stop_import_workers():
+    import_job_service.shutdown()
 
 # Mount static files from React build
 # Note: Ensure 'npm run build' has been executed in web/frontend
@@ -64,7 +88,11 @@ async def health_check(db: Session = Depends(get_db)):
 @app.post("/api/auth/login")
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = auth_service.get_user_by_username(db, form_data.username)
-    if not user or not auth_service.verify_password(form_data.password, user.hashed_password):
+    # Give the connection back while bcrypt runs, or a login storm holds the
+    # whole DB pool while it waits for the hashing pool (user stays loaded)
+    db.close()
+    valid, new_hash = await auth_service.verify_password_async(form_data.password, user.hashed_password) if user else (False, None)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
@@ -75,6 +103,14 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
             status_code=status.HTTP_403_FORBIDDEN,
             detail="账户尚未激活，请等待管理员审核"
         )
+    if new_hash:
+        # Stored with an outdated bcrypt cost. Marked for sync like any local
+        # edit, or the next sync_down would put the old hash back
+        db.query(User).filter(User.id == user.id).update(
+            {"hashed_password": new_hash, "sync_status": "pending", "updated_at": datetime.now()},
+            synchronize_session=False
+        )
+        db.commit()
     access_token = auth_service.create_access_token(data={"sub": user.username})
     return {
         "access_token": access_token, 
@@ -97,11 +133,12 @@ async def register(user_data: Dict[str, Any], db: Session = Depends(get_db)):
     existing = auth_service.get_user_by_username(db, username)
     if existing:
         raise HTTPException(status_code=400, detail="该用户名已被注册")
+    db.close()  # Do not hold a connection while waiting for the hashing pool
     
     # Create user with is_active=False (requires admin approval)
     new_user = User(
         username=username,
-        hashed_password=auth_service.get_password_hash(password),
+        hashed_password=await auth_service.get_password_hash_async(password),
         role="practitioner",  # Default role
         is_active=False,  # Requires admin approval
         real_name=user_data.get("real_name"),
@@ -156,6 +193,7 @@ async def toggle_user_active(
         raise HTTPException(status_code=404, detail="用户不存在")
     user.is_active = is_active
     db.commit()
+    auth_service.invalidate_user(user.id)
     return {"id": user.id, "username": user.username, "is_active": user.is_active}
 
 @app.post("/api/admin/users")
@@ -164,8 +202,11 @@ async def create_new_user(
     db: Session = Depends(get_db),
     admin: User = Depends(auth_service.check_admin)
 ):
+    if not user_data.get("password"):
+        raise HTTPException(status_code=400, detail="Password is required")
+    hashed_password = await auth_service.get_password_hash_async(user_data["password"])
     try:
-        user = auth_service.create_user(db, user_data)
+        user = auth_service.create_user(db, {**user_data, "hashed_password": hashed_password})
         return {"id": user.id, "username": user.username}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -222,9 +263,6 @@ async def delete_practitioner(
 
 # Import Excel Endpoint
 from fastapi import UploadFile, File
-import pandas as pd
-from io import BytesIO
-from datetime import datetime
 
 @app.post("/api/import/excel")
 async def import_excel_file(
@@ -232,154 +270,98 @@ async def import_excel_file(
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
-    """Import medical records from Excel file."""
+    """
+    Queue an Excel import. The upload is spooled to disk and imported by a
+    background worker; follow it with /api/import/jobs/{job_id} (or /events).
+    """
     if not file.filename.endswith(('.xlsx', '.xls')):
         raise HTTPException(status_code=400, detail="仅支持Excel文件 (.xlsx, .xls)")
-    
+
+    spool_path = await import_job_service.spool_upload(file, file.filename)
+    job = import_job_service.create_job(db, current_user.id, file.filename, spool_path)
+    import_job_service.submit(job.id)
+    return import_job_service.job_dict(job)
+
+def _get_import_job(db: Session, job_id: str, current_user: User):
+    job = import_job_service.get_job(db, job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return job
+
+@app.get("/api/import/jobs")
+async def list_import_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """Recent import jobs of the current user (all users for admins)."""
+    user_id = None if current_user.role == "admin" else current_user.id
+    return [import_job_service.job_dict(job) for job in import_job_service.list_jobs(db, user_id)]
+
+@app.get("/api/import/jobs/{job_id}")
+async def get_import_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """Progress of an import job: rows parsed, imported, skipped, errors."""
+    return import_job_service.job_dict(_get_import_job(db, job_id, current_user))
+
+@app.get("/api/import/jobs/{job_id}/events")
+async def stream_import_job(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Server-sent events: a `progress` event whenever the job changes, then a
+    final `end` event once it is no longer queued or running.
+    """
+    _get_import_job(db, job_id, current_user)
+
+    async def events():
+        last = None
+        idle = 0.0
+        while not await request.is_disconnected():
+            db.rollback()  # Fresh read of the row the worker is updating
+            snapshot = import_job_service.job_dict(import_job_service.get_job(db, job_id))
+            if snapshot != last:
+                last = snapshot
+                idle = 0.0
+                yield f"event: progress\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+            elif idle >= 15:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+            if snapshot["status"] not in import_job_service.ACTIVE_STATUSES:
+                yield f"event: end\ndata: {json.dumps(snapshot, ensure_ascii=False)}\n\n"
+                return
+            await asyncio.sleep(0.5)
+            idle += 0.5
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/api/import/jobs/{job_id}/cancel")
+async def cancel_import_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """Cancel a job; a running job stops after the chunk it is writing."""
+    job = _get_import_job(db, job_id, current_user)
+    return import_job_service.job_dict(import_job_service.cancel_job(db, job))
+
+@app.post("/api/import/jobs/{job_id}/resume")
+async def resume_import_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """Resume a cancelled, failed or interrupted job after its last committed chunk."""
+    job = _get_import_job(db, job_id, current_user)
     try:
-        contents = await file.read()
-        df = pd.read_excel(BytesIO(contents))
-        
-        imported = 0
-        skipped = 0
-        errors = []
-        
-        # Build practitioner map
-        practitioner_map = {}
-        doctors = df['医生'].dropna().unique() if '医生' in df.columns else []
-        for doc_name in doctors:
-            doc_name = str(doc_name).strip()
-            if not doc_name:
-                continue
-            existing = db.query(Practitioner).filter(Practitioner.name == doc_name).first()
-            if existing:
-                practitioner_map[doc_name] = existing.id
-            else:
-                new_prac = Practitioner(name=doc_name, role='teacher')
-                db.add(new_prac)
-                db.flush()
-                practitioner_map[doc_name] = new_prac.id
-        
-        for idx, row in df.iterrows():
-            try:
-                # Extract patient info
-                patient_name = str(row.get('患者姓名', '')).strip() if '患者姓名' in df.columns else ''
-                if not patient_name or patient_name == 'nan':
-                    skipped += 1
-                    continue
-                
-                phone = str(row.get('联系电话', '')).strip() if pd.notna(row.get('联系电话', None)) else None
-                gender_str = str(row.get('性别', '')).strip() if pd.notna(row.get('性别', None)) else '男'
-                gender = '女' if '女' in gender_str else '男'
-                
-                age = None
-                age_val = row.get('年龄', None)
-                if pd.notna(age_val):
-                    age_str = str(age_val).replace('岁', '').replace('周岁', '').strip()
-                    try:
-                        age = int(float(age_str))
-                    except:
-                        pass
-                
-                # Find or create patient
-                patient = db.query(Patient).filter(Patient.name == patient_name).first()
-                if not patient:
-                    patient = Patient(
-                        name=patient_name,
-                        phone=phone if phone and phone != 'nan' else None,
-                        gender=gender,
-                        age=age
-                    )
-                    db.add(patient)
-                    db.flush()
-                
-                # Parse visit date - ensure it's a Python datetime object
-                visit_date = row.get('门诊日期', None)
-                if pd.isna(visit_date) or visit_date is None:
-                    visit_date = datetime.now()
-                elif isinstance(visit_date, str):
-                    try:
-                        visit_date = datetime.strptime(visit_date, '%Y-%m-%d %H:%M:%S')
-                    except:
-                        try:
-                            visit_date = datetime.strptime(visit_date, '%Y-%m-%d')
-                        except:
-                            visit_date = datetime.now()
-                elif hasattr(visit_date, 'to_pydatetime'):
-                    # Handle pandas Timestamp
-                    visit_date = visit_date.to_pydatetime()
-                
-                # Get practitioner
-                doctor_name = str(row.get('医生', '')).strip() if pd.notna(row.get('医生', None)) else None
-                practitioner_id = practitioner_map.get(doctor_name) if doctor_name else None
-                
-                # Extract record data
-                complaint = str(row.get('主诉', '')).strip() if pd.notna(row.get('主诉', None)) else ''
-                diagnosis = str(row.get('诊断', '')).strip() if pd.notna(row.get('诊断', None)) else ''
-                
-                # Extract prescription content
-                prescription_raw = str(row.get('处方', '')).strip() if pd.notna(row.get('处方', None)) else ''
-                
-                # Parse dosage from prescription (e.g., "共6剂", "共12剂")
-                import re
-                total_dosage = '6付'  # Default
-                dosage_match = re.search(r'共(\d+)剂', prescription_raw)
-                if dosage_match:
-                    total_dosage = f"{dosage_match.group(1)}付"
-                
-                record_data = {
-                    'patient_info': {
-                        'name': patient_name,
-                        'age': str(age) if age else '',
-                        'gender': gender,
-                        'phone': phone if phone and phone != 'nan' else ''
-                    },
-                    'medical_record': {
-                        'complaint': complaint,
-                        'prescription': prescription_raw,
-                        'totalDosage': total_dosage,
-                        'note': str(row.get('医嘱事项', '')).strip() if pd.notna(row.get('医嘱事项', None)) else ''
-                    },
-                    'pulse_grid': {},
-                    'imported_from_excel': True,
-                    'raw_data': {
-                        '现病史': str(row.get('现病史', '')) if pd.notna(row.get('现病史', None)) else '',
-                        '既往史': str(row.get('既往史', '')) if pd.notna(row.get('既往史', None)) else '',
-                        '辩证': str(row.get('辩证', '')) if pd.notna(row.get('辩证', None)) else '',
-                        '治法': str(row.get('治法', '')) if pd.notna(row.get('治法', None)) else '',
-                        '望闻切诊': str(row.get('望闻切诊', '')) if pd.notna(row.get('望闻切诊', None)) else '',
-                        '方药': str(row.get('方药', '')) if pd.notna(row.get('方药', None)) else '',
-                    }
-                }
-                
-                record = MedicalRecord(
-                    patient_id=patient.id,
-                    user_id=current_user.id,
-                    practitioner_id=practitioner_id,
-                    visit_date=visit_date,
-                    complaint=complaint,
-                    diagnosis=diagnosis,
-                    data=record_data
-                )
-                db.add(record)
-                imported += 1
-                
-            except Exception as row_err:
-                errors.append(f"Row {idx + 2}: {str(row_err)}")
-                skipped += 1
-        
-        db.commit()
-        
-        return {
-            "status": "success",
-            "imported": imported,
-            "skipped": skipped,
-            "errors": errors[:10] if errors else []  # Return first 10 errors
-        }
-        
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=500, detail=f"导入失败: {str(e)}")
+        return import_job_service.job_dict(import_job_service.resume_job(db, job))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/api/validate")
 async def validate_data(data: Dict[str, Any]):
@@ -402,6 +384,7 @@ async def search_patients(
 
 @app.get("/api/patients/by_date")
 async def get_patients_by_date(
+    request: Request,
     start_date: str = Query(None, description="Start date in YYYY-MM-DD format"),
     end_date: str = Query(None, description="End date in YYYY-MM-DD format"),
     date: str = Query(None, description="Single date in YYYY-MM-DD format (deprecated, use start_date/end_date)"),
@@ -415,9 +398,30 @@ async def get_patients_by_date(
     try:
         # Admin sees all, others see only their own
         user_id = None if current_user.role == 'admin' else current_user.id
-        return search_service.get_patients_by_date_range(db, start_date, end_date, date, user_id=user_id)
+        patients = search_service.get_patients_by_date_range(db, start_date, end_date, date, user_id=user_id)
     except ValueError:
          raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    # Cloud rows are merged in, so there is no local row version: tag the body
+    return http.cached_json(request, patients)
+
+@app.get("/api/changes")
+async def get_changes(
+    since: int = Query(0, ge=0, description="Cursor returned by the previous call; 0 for everything"),
+    limit: int = Query(1000, ge=1, le=change_service.MAX_LIMIT),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Patients, records and practitioners changed after a cursor, for clients
+    that keep a local cache. Non-admin users only see their own records and
+    the patients of those records. Call again with the returned cursor while
+    has_more is true.
+    """
+    user_id = None if current_user.role == 'admin' else current_user.id
+    try:
+        return change_service.get_changes(db, since=since, limit=limit, user_id=user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=410, detail=str(e))
 
 @app.get("/api/patients/{patient_id}/latest_record")
 async def get_patient_latest_record(
@@ -431,35 +435,42 @@ async def get_patient_latest_record(
     patient = db.query(Patient).filter(Patient.id == patient_id).first()
     if not patient:
         raise HTTPException(status_code=404, detail="Patient not found")
-        
-    latest_record = db.query(MedicalRecord)\
-        .filter(MedicalRecord.patient_id == patient_id)\
-        .order_by(MedicalRecord.created_at.desc())\
-        .first()
-        
-    response_data = {
-        "record_id": latest_record.id if latest_record else None,
-        "patient_info": {
-            "name": patient.name,
-            "age": patient.age,
-            "gender": patient.gender,
-            "phone": patient.phone
-        },
-        "medical_record": {},
-        "pulse_grid": {}
+    return record_service.get_patient_latest_record(db, patient)
+
+@app.get("/api/patients/{patient_id}/bundle")
+async def get_patient_bundle(
+    patient_id: int,
+    request: Request,
+    similar: str = Query(None, description="Also search records similar to the latest pulse grid: exact or semantic"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Everything the app loads when a patient is opened, in one request (one
+    auth check, one DB session): latest_record, history and practitioners as
+    returned by their own endpoints, plus similar records when asked for.
+    """
+    if similar not in (None, "exact", "semantic"):
+        raise HTTPException(status_code=400, detail="similar must be exact or semantic")
+    patient = db.query(Patient).filter(Patient.id == patient_id).first()
+    if not patient:
+        raise HTTPException(status_code=404, detail="Patient not found")
+
+    latest = record_service.get_patient_latest_record(db, patient)
+    bundle = {
+        "latest_record": latest,
+        "history": record_service.get_patient_history(db, patient_id),
+        "practitioners": [{"id": p.id, "name": p.name, "role": p.role} for p in db.query(Practitioner).all()],
     }
-    
-    if latest_record and latest_record.data:
-        record_data = latest_record.data
-        if "medical_record" in record_data:
-            response_data["medical_record"] = record_data["medical_record"]
-        if "pulse_grid" in record_data:
-            response_data["pulse_grid"] = record_data["pulse_grid"]
-            
-    return response_data
+    if similar == "exact":
+        bundle["similar"] = search_service.search_similar_records(db, latest["pulse_grid"])
+    elif similar == "semantic":
+        bundle["similar"] = search_service.search_similar_records_semantic(db, latest["pulse_grid"])
+    return http.cached_json(request, bundle)
 
 @app.get("/api/practitioners")
 async def get_practitioners(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
@@ -467,36 +478,62 @@ async def get_practitioners(
     Get all practitioners (teachers and doctors)
     """
     practitioners = db.query(Practitioner).all()
-    return [{
+    return http.cached_json(request, [{
         "id": p.id,
         "name": p.name,
         "role": p.role
-    } for p in practitioners]
+    } for p in practitioners])
 
 @app.get("/api/patients/{patient_id}/history")
 async def get_patient_history(
     patient_id: int, 
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
     Get a list of medical records for a patient
     """
-    return record_service.get_patient_history(db, patient_id)
+    etag = http.make_etag("history", patient_id, *record_service.history_version(db, patient_id))
+    if http.etag_matches(request, etag):
+        return http.not_modified(request, etag)
+    return http.cached_json(request, record_service.get_patient_history(db, patient_id), etag)
 
 @app.get("/api/records/{record_id}")
 async def get_record(
     record_id: int, 
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
     Get a specific medical record
     """
+    version = record_service.record_version(db, record_id)
+    if version is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    etag = http.make_etag("record", record_id, *version)
+    if http.etag_matches(request, etag):
+        return http.not_modified(request, etag)
     record_data = record_service.get_record_by_id(db, record_id)
     if not record_data:
         raise HTTPException(status_code=404, detail="Record not found")
-    return record_data
+    return http.cached_json(request, record_data, etag)
+
+@app.get("/api/records/{record_id}/raw")
+async def get_record_raw(
+    record_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Get the full stored data of a record, including the original client
+    payload (raw_input) and Excel raw columns (raw_data).
+    """
+    record = db.query(MedicalRecord.id, MedicalRecord.data).filter(MedicalRecord.id == record_id).first()
+    if not record:
+        raise HTTPException(status_code=404, detail="Record not found")
+    return storage_service.load_full_record_data(db, record.id, record.data)
 
 @app.delete("/api/records/{record_id}")
 async def delete_record(
@@ -511,7 +548,18 @@ async def delete_record(
     if not record:
         raise HTTPException(status_code=404, detail="Record not found")
         
+    patient_id = record.patient_id
+    rollup_keys = pattern_stats_service.rollup_keys(db, [record_id])
+    pulse_index_service.delete_pulse_cells(db, [record_id])
+    pulse_embedding_service.delete_embeddings(db, [record_id])
+    storage_service.delete_payloads(db, [record_id])
+    prescription_service.delete_prescription_items(db, [record_id])
+    text_index_service.delete_complaint_terms(db, [record_id])
+    import_service.delete_fingerprints(db, [record_id])
+    reanalysis_service.delete_results(db, [record_id])
     db.delete(record)
+    summary_service.refresh_patient_summaries(db, [patient_id])
+    pattern_stats_service.refresh_pattern_rollups(db, rollup_keys)
     db.commit()
     
     return {"status": "success", "message": f"Record {record_id} deleted"}
@@ -539,20 +587,104 @@ async def save_record(
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+MAX_BATCH_RECORDS = 1000
+# Decompressed size allowed per record in a gzip batch; bounds gzip bombs
+MAX_BATCH_RECORD_BYTES = 64 * 1024
+
+@app.post("/api/records/save_batch")
+async def save_records_batch(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Save many medical records in one request (offline uploads from the mobile app).
+    Accepts a JSON list or {"records": [...]}, optionally gzip-compressed
+    (Content-Encoding: gzip). Returns a per-item status array.
+    """
+    body = await request.body()
+    if request.headers.get("content-encoding", "").lower() == "gzip":
+        limit = MAX_BATCH_RECORDS * MAX_BATCH_RECORD_BYTES
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = decompressor.decompress(body, limit)
+        except zlib.error:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+        if decompressor.unconsumed_tail:
+            raise HTTPException(status_code=413, detail=f"Decompressed body exceeds {limit} bytes")
+        if not decompressor.eof:
+            raise HTTPException(status_code=400, detail="Invalid gzip body")
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+
+    items = payload.get("records") if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a list of records")
+    if len(items) > MAX_BATCH_RECORDS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_RECORDS} records per batch")
+
+    try:
+        results = record_service.save_medical_records_batch(db, items, user_id=current_user.id)
+    except ValueError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        db.rollback()
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    saved = sum(1 for r in results if r["status"] == "success")
+    return {"saved": saved, "failed": len(results) - saved, "results": results}
+
 
 @app.post("/api/analyze")
 async def analyze_record(
-    data: Dict[str, Any],
+    request: Request,
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
     """
     Advanced Rule-Based Analysis Simulation based on Shanghan Lun and Zheng Qin'an (Fire Spirit School) logic.
+    Takes the record payload as a JSON object; results are memoized by body.
     """
-    return analysis_service.analyze_pulse_data(data)
+    try:
+        return analysis_service.analyze_request_body(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+MAX_ANALYZE_BATCH = 1000
+
+@app.post("/api/analyze/batch")
+async def analyze_records_batch(
+    data: Any = Body(...),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Analyze many payloads in one request: a list in (or {"items": [...]}), a list out
+    in the same order. Invalid items get {"error": ...} instead of failing the batch.
+    """
+    items = data.get("items") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Expected a list of payloads")
+    if len(items) > MAX_ANALYZE_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_ANALYZE_BATCH} payloads per batch")
+
+    results = []
+    for item in items:
+        try:
+            if not isinstance(item, dict):
+                raise ValueError("Payload must be an object")
+            results.append(analysis_service.analyze_pulse_data(item))
+        except (ValueError, AttributeError, TypeError) as e:
+            results.append({"error": str(e)})
+    return results
 
 @app.post("/api/records/search_similar")
 async def search_similar_records(
     data: Dict[str, Any], 
+    mode: str = Query("exact", description="exact: cell text matching; semantic: pulse embedding nearest neighbours"),
     db: Session = Depends(get_db),
     current_user: User = Depends(auth_service.get_current_active_user)
 ):
@@ -560,8 +692,158 @@ async def search_similar_records(
     Search for similar medical records based on pulse grid data
     """
     current_grid = data.get("pulse_grid", {})
+    if mode == "semantic":
+        return search_service.search_similar_records_semantic(db, current_grid)
+    if mode != "exact":
+        raise HTTPException(status_code=400, detail="mode must be exact or semantic")
     return search_service.search_similar_records(db, current_grid)
 
+@app.post("/api/records/search_similar_cases")
+async def search_similar_cases(
+    data: Dict[str, Any],
+    debug: bool = Query(False, description="Include candidate counts and per-stage latency"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Similar teacher cases fused from pulse grid, complaint text, prescription
+    herbs and patient age/gender. Takes the same body as /api/analyze plus
+    optional "k", "weights" ({"pulse": .., "complaint": .., "herbs": .., "demographics": ..})
+    and "exclude_record_id".
+    """
+    try:
+        k = max(1, min(int(data.get("k", 5)), 100))
+        weights = {key: float(v) for key, v in (data.get("weights") or {}).items()
+                   if key in retrieval_service.DEFAULT_WEIGHTS}
+        if any(v < 0 for v in weights.values()):
+            raise ValueError("weights must be non-negative")
+    except (TypeError, ValueError, AttributeError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return retrieval_service.search_similar_cases(
+        db, data, k=k, weights=weights, exclude_record_id=data.get("exclude_record_id"), debug=debug
+    )
+
+
+@app.post("/api/records/search_pulse")
+async def search_records_by_pulse(
+    data: Dict[str, Any],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Find records whose pulse grid matches ALL criteria, e.g.
+    {"criteria": [{"hand": "right", "position": "chi", "level": "chen", "term": "沉"}]}
+    """
+    try:
+        return search_service.search_records_by_pulse(db, data.get("criteria", []), limit=data.get("limit", 200))
+    except (KeyError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/records/search_herbs")
+async def search_records_by_herbs(
+    data: Dict[str, Any],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Find records whose prescription contains ALL include herbs and NONE of the
+    exclude herbs, e.g. {"include": ["附子", "干姜"], "exclude": ["石膏"]}
+    """
+    try:
+        return search_service.search_records_by_herbs(
+            db, data.get("include", []), data.get("exclude", []), limit=data.get("limit", 200)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/api/records/search_similar_prescription")
+async def search_similar_prescription(
+    data: Dict[str, Any],
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Past cases with a similar prescription (herb-set Jaccard, MinHash LSH), e.g.
+    {"prescription": "附子10g 干姜6g 炙甘草6g", "k": 20} or {"record_id": 12}
+    """
+    try:
+        k = max(1, min(int(data.get("k", 20)), 200))
+        return search_service.search_similar_prescriptions(
+            db, prescription=data.get("prescription"), record_id=data.get("record_id"), k=k
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/stats/herbs")
+async def get_herb_counts(
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Most frequently prescribed herbs, by number of records.
+    """
+    return prescription_service.count_by_herb(db, limit=limit)
+
+@app.get("/api/stats/pulse_terms")
+async def get_pulse_term_counts(
+    position: str = Query(..., description="cun / guan / chi"),
+    level: str = Query(..., description="fu / zhong / chen"),
+    hand: str = Query(None, description="left / right"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Cohort counts: number of records showing each pulse term at one grid position.
+    """
+    return pulse_index_service.count_by_term(db, position, level, hand)
+
+@app.get("/api/stats/patterns")
+async def get_pattern_stats(
+    group_by: str = Query("practitioner,month,pattern", description="Comma-separated: practitioner, month, pattern"),
+    practitioner_id: int = Query(None),
+    practitioner: str = Query(None, description="Practitioner name"),
+    pattern: str = Query(None, description="Analysis pattern, e.g. Rootless Yang"),
+    start_month: str = Query(None, description="First month, YYYY-MM"),
+    end_month: str = Query(None, description="Last month, YYYY-MM"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Cohort counts of analysis patterns grouped by practitioner, month and/or pattern,
+    e.g. how many Rootless Yang cases a teacher saw in a quarter.
+    """
+    try:
+        return pattern_stats_service.get_pattern_stats(
+            db,
+            group_by=[g.strip() for g in group_by.split(",") if g.strip()],
+            practitioner_id=practitioner_id,
+            practitioner_name=practitioner,
+            pattern=pattern,
+            start_month=start_month,
+            end_month=end_month,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/stats/analysis_cache")
+async def get_analysis_cache_stats(
+    current_user: User = Depends(auth_service.get_current_active_user)
+):
+    """
+    Hit / miss counters and size of the analysis result memo.
+    """
+    return analysis_service.get_cache_stats()
+
+@app.get("/api/stats/auth_cache")
+async def get_auth_cache_stats(
+    admin: User = Depends(auth_service.check_admin)
+):
+    """
+    Hit / miss counters and size of the token -> user cache.
+    """
+    return auth_service.get_cache_stats()
+
 
 from src.services.sync_service import SyncService
 
@@ -20,6 +20,7 @@ const Admin = ({ token, onBack }) => {
     const [importFile, setImportFile] = useState(null);
     const [importing, setImporting] = useState(false);
     const [importResult, setImportResult] = useState(null);
+    const [importProgress, setImportProgress] = useState(null);
 
     useEffect(() => {
         fetchUsers();
@@ -452,13 +453,24 @@ const Admin = ({ token, onBack }) => {
                                         body: formData
                                     });
 
-                                    const data = await res.json();
+                                    let data = await res.json();
                                     if (res.ok) {
+                                        // The import runs as a background job; poll it until it finishes
+                                        while (data.status === 'queued' || data.status === 'running') {
+                                            setImportProgress(data);
+                                            await new Promise(resolve => setTimeout(resolve, 1000));
+                                            const jobRes = await fetch(`/api/import/jobs/${data.job_id}`, {
+                                                headers: { 'Authorization': `Bearer ${token}` }
+                                            });
+                                            data = await jobRes.json();
+                                        }
                                         setImportResult({
-                                            success: true,
+                                            success: data.status === 'done',
                                             imported: data.imported,
                                             skipped: data.skipped,
-                                            errors: data.errors
+                                            duplicates: data.duplicates,
+                                            errors: data.errors,
+                                            error: data.message || (data.status === 'cancelled' ? '导入已取消' : '导入失败')
                                         });
                                     } else {
                                         setImportResult({
@@ -473,6 +485,7 @@ const Admin = ({ token, onBack }) => {
                                     });
                                 } finally {
                                     setImporting(false);
+                                    setImportProgress(null);
                                 }
                             }}
                             disabled={!importFile || importing}
@@ -489,7 +502,9 @@ const Admin = ({ token, onBack }) => {
                                 transition: 'all 0.2s'
                             }}
                         >
-                            {importing ? '导入中...' : '开始导入'}
+                            {importing
+                                ? (importProgress ? `导入中... 已处理 ${importProgress.rows} 行` : '导入中...')
+                                : '开始导入'}
                         </button>
 
                         {importResult && (
@@ -507,6 +522,7 @@ const Admin = ({ token, onBack }) => {
                                         </div>
                                         <div style={{ fontSize: '14px', color: '#1d1d1f' }}>
                                             成功导入 <strong>{importResult.imported}</strong> 条记录，
+                                            已导入过 <strong>{importResult.duplicates}</strong> 条，
                                             跳过 <strong>{importResult.skipped}</strong> 条
                                         </div>
                                         {importResult.errors && importResult.errors.length > 0 && (